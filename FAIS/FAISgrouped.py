@@ -1,8 +1,13 @@
 import os
+import sys
 import faiss
 from sentence_transformers import SentenceTransformer
 import unicodedata
 
+# KeywordMatcher vive em dumb/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dumb"))
+from keyword_matcher import KeywordMatcher
+
 def normalize_text(text):
     text = text.lower()
     text = ''.join(
@@ -51,14 +56,12 @@ def search_answers(index, model, questions, answers, user_question, threshold=1.
             results.append((dist, answers[idx]))
     return results
 
-def detect_category(user_input, category_keywords):
-    normalized_input = normalize_text(user_input)
-    for cat, keywords in category_keywords.items():
-        for word in keywords:
-            normalized_word = normalize_text(word)
-            if normalized_word in normalized_input:
-                return cat
-    return None
+def compile_category_keywords(category_keywords):
+    # Normaliza as keywords uma só vez, e não a cada mensagem
+    return KeywordMatcher({cat: [normalize_text(word) for word in keywords] for cat, keywords in category_keywords.items()})
+
+def detect_category(user_input, category_matcher):
+    return category_matcher.first(normalize_text(user_input))
 
 if __name__ == "__main__":
     model = SentenceTransformer('all-MiniLM-L6-v2')
@@ -71,6 +74,7 @@ if __name__ == "__main__":
         "financeiro": ["mensalidade", "boleto", "pagamento", "bolsa", "financeiro", "desconto", "parcelar", "comprovante"],
         "servicos": ["secretaria", "documento", "historico", "carteirinha", "atendimento", "agendar", "certidao", "estagio", "perda"]
     }
+    category_matcher = compile_category_keywords(category_keywords)
 
     print("Chatbot iniciado! Digite 'exit' para sair.")
 
@@ -80,7 +84,7 @@ if __name__ == "__main__":
             print("Bot: Até logo!")
             break
 
-        category = detect_category(user_input, category_keywords)
+        category = detect_category(user_input, category_matcher)
         if not category or category not in cat_to_index:
             print("Bot: Não consegui detectar uma categoria específica. Por favor, use palavras-chave relacionadas ao assunto.")
             continue
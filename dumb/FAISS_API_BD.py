@@ -1,14 +1,28 @@
 import sys
-import httpx
-import unicodedata
+import zlib
+import asyncio
 import numpy as np
-import faiss
-from langdetect import detect
-from sentence_transformers import SentenceTransformer
+from onnx_encoder import load_encoder
 from fastapi import FastAPI, HTTPException
+from typing import List, Union
 from pydantic import BaseModel
 from starlette.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import logging
+from http_client import start_http_client, close_http_client
+from faq_source import fetch_categories, fetch_category_faqs, fetch_chatbot, load_chatbot_faqs, close_data_source
+from chatbot_cache import ChatbotCache
+from faq_events import FaqChange, FaqChangeFeed
+from embedding_store import shared_index
+from faiss_factory import (build_index, build_signature, describe_index, index_spec, remove_ids, search_selected,
+                           writable_copy)
+from cache_snapshot import SnapshotStore
+from inference import InferenceExecutor
+from prewarm import Prewarmer
+from keyword_matcher import KeywordMatcher
+from message_analysis import AnalyzedMessage, analyze_message, normalize_text
+from language_id import get_model as get_language_model
+from session_store import create_session_store
 
 # Logging
 logging.basicConfig(
@@ -20,7 +34,20 @@ logger = logging.getLogger("dumb_api_bd")
 logger.info("Logger configurado e pronto!")
 
 # App & CORS
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_http_client()
+    faq_changes.start_listener()
+    prewarm.start()
+    yield
+    await prewarm.stop()
+    await faq_changes.stop_listener()
+    inference.shutdown()
+    await conversation_states.close()
+    await close_data_source()
+    await close_http_client()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -30,115 +57,58 @@ app.add_middleware(
 )
 
 # Embeddings
-model = SentenceTransformer("all-MiniLM-L6-v2")
-data_cache = {}
-conversation_states = {}
+model = load_encoder("all-MiniLM-L6-v2")  # ENCODER_BACKEND=torch|onnx
+# O modelo só corre na thread do executor, com as perguntas concorrentes em lote
+inference = InferenceExecutor(model)
+# data_cache (por chatbot) é criado junto de build_chatbot_cache
+conversation_states = create_session_store()
 
 # Utils
-import re
+def detect_categories(message, keyword_matcher):
+    # Uma passagem pelo texto já normalizado: categorias e feedback negativo de uma vez
+    return keyword_matcher.find(message.normalized)
 
-def normalize_text(text):
-    text = unicodedata.normalize('NFD', text.lower())
-    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
-    return re.sub(r'[^\w\s]', '', text).strip()
-
-def detect_categories(user_input, category_keywords):
-    norm_input = normalize_text(user_input)
-    return [cat_id for cat_id, keywords in category_keywords.items() if any(word in norm_input for word in keywords)]
-
-def is_feedback_negativo(user_input, lang, category_keywords, feedback_negativo_ids):
+def is_feedback_negativo(categorias, lang, feedback_negativo_ids):
     id_feedback = feedback_negativo_ids.get(lang)
     if id_feedback is None:
         return False
-    norm_input = normalize_text(user_input)
-    keywords = category_keywords.get(id_feedback, [])
-    return any(k in norm_input for k in keywords)
-
-def detect_language(text: str) -> str:
-    try:
-        from langdetect import detect
-        norm = normalize_text(text)
-
-        greetings_en = {
-            "hi", "hello", "hey", "good morning", "good afternoon",
-            "good evening", "howdy", "greetings", "what's up", "yo", "sup"
-        }
-
-        greetings_pt = {
-            "oi", "olá", "ola", "bom dia", "boa tarde", "boa noite",
-            "alô", "alo", "e aí", "fala", "boas"
-        }
-
-        if norm in greetings_en:
-            return "en"
-        if norm in greetings_pt:
-            return "pt"
-
-        if len(text) < 10:
-            return "pt"
-
-        detected = detect(text)
-        return "en" if detected == "en" else "pt"
-    except:
-        return "pt"
-
-def is_greeting(text: str) -> bool:
-    greetings_pt = {
-        "ola", "olá", "bom dia", "boa tarde", "boa noite", "oi",
-        "alô", "alo", "hey", "boas", "e aí", "fala", "opa", "tudo bem", "beleza"
-    }
-
-    greetings_en = {
-        "hello", "hi", "good morning", "good afternoon", "good evening",
-        "hey", "howdy", "greetings", "what's up", "yo", "sup", "hiya"
-    }
-
-    norm_text = normalize_text(text.strip())
-    lang = detect_language(text)
-
-    greetings = greetings_en if lang == "en" else greetings_pt
-
-    # Se for só uma saudação curta, como "olá" ou "hi"
-    if norm_text in greetings:
-        return True
-
-    # Se for frase longa, ignorar como saudação
-    if len(norm_text.split()) > 3:
-        return False
+    return id_feedback in categorias
 
-    # Última tentativa: começa com saudação?
-    for greet in greetings:
-        if norm_text.startswith(greet):
-            return True
 
-    return False
+def category_members(data, categorias):
+    """Ids das FAQs de cada categoria detetada que tenha FAQs neste idioma."""
+    return [data["categories"][cat_id] for cat_id in categorias if cat_id in data["categories"]]
 
+async def find_answers_faiss_with_threshold(user_input, indices_by_language, lang, categorias_detectadas, top_k=5, threshold=0.6):
+    data = indices_by_language.get(lang)
+    if not data:
+        return [], []
+    members = category_members(data, categorias_detectadas)
+    if not members:
+        return [], []
 
-def find_answers_faiss_with_threshold(user_input, indices_by_category, lang, categorias_detectadas, top_k=5, threshold=0.6):
-    input_embedding = model.encode([user_input], convert_to_numpy=True)
-    input_embedding /= np.linalg.norm(input_embedding)
+    input_embedding = await inference.encode_query(user_input)
+    # Uma só pesquisa, restrita às FAQs das categorias, com top_k candidatos por
+    # categoria como quando se pesquisava cada uma à parte
+    D, I = search_selected(data["index"], input_embedding, np.concatenate(members), top_k * len(members))
 
-    all_candidates = []
-    for cat_id in categorias_detectadas:
-        key = (cat_id, lang)
-        data = indices_by_category.get(key)
-        if data:
-            D, I = data["index"].search(input_embedding, top_k)
-            for dist, idx in zip(D[0], I[0]):
-                if idx < len(data["answers"]):
-                    similarity = 1 - dist / 2
-                    all_candidates.append((similarity, data["questions"][idx], data["answers"][idx]))
-
-    all_candidates.sort(key=lambda x: x[0], reverse=True)
     seen = set()
-    answers = []
-    for sim, q, a in all_candidates:
-        if sim < threshold:
+    answers, refs = [], []
+    for dist, vid in zip(D[0], I[0]):
+        if vid < 0 or 1 - dist / 2 < threshold:
             continue
+        _, q, a = data["faqs"][int(vid)]
         if q not in seen:
             seen.add(q)
             answers.append(a)
-    return answers
+            refs.append(int(vid))
+    return answers, refs
+
+def resolve_answer(indices_by_language, lang, ref):
+    """Texto da resposta guardada na sessão como referência (id do vetor da FAQ)."""
+    data = indices_by_language.get(lang)
+    faq = data["faqs"].get(ref) if data else None
+    return faq[2] if faq else None
 
 class MessageRequest(BaseModel):
     message: str
@@ -146,134 +116,401 @@ class MessageRequest(BaseModel):
     chatbot_id: str
     force_reload: bool = False
 
-async def fetch_categories(chatbot_id: str):
-    url = f"http://localhost:3004/chatbot-categoria/{int(chatbot_id)}"
-    async with httpx.AsyncClient() as client:
-        res = await client.get(url)
-        res.raise_for_status()
-        return res.json()
-
-async def fetch_faq_data(chatbot_id: int):
-    categories = await fetch_categories(str(chatbot_id))
-    faqs = []
-    async with httpx.AsyncClient() as client:
-        for cat in categories:
-            cat_id = cat["categoria_id"]
-            url = f"http://localhost:3004/faq-categoria/?categoria_id={cat_id}"
-            res = await client.get(url)
-            res.raise_for_status()
-            faqs.extend(res.json())
-    return faqs
-
-async def fetch_no_response_message(chatbot_id: int, lang: str):
-    url = f"http://localhost:3004/chatbots/{chatbot_id}"
+async def fetch_chatbot_or_none(chatbot_id: int):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            chatbot_data = response.json()
-            return chatbot_data.get(
-                "mensagem_no_response_pt" if lang == "pt" else "mensagem_no_response_en",
-                "Desculpe, não tenho uma resposta para isso." if lang == "pt" else "Sorry, I don't have an answer for that."
-            )
+        return await fetch_chatbot(chatbot_id)
     except Exception as e:
-        logger.error(f"Erro ao buscar mensagem padrão: {e}")
+        logger.error(f"Erro ao buscar dados do chatbot {chatbot_id}: {e}")
+        return None
+
+async def load_chatbot_metadata(chatbot_id: int, cache: dict):
+    """Metadados do chatbot (mensagens, estado, idioma) guardados no data_cache.
+
+    Normalmente já vêm com a construção da cache; só voltam a ser pedidos ao
+    backend se essa busca tiver falhado.
+    """
+    if cache.get("chatbot") is None:
+        cache["chatbot"] = await fetch_chatbot_or_none(chatbot_id)
+    return cache["chatbot"]
+
+async def fetch_no_response_message(chatbot_id: int, lang: str, cache: dict):
+    chatbot_data = await load_chatbot_metadata(chatbot_id, cache)
+    if chatbot_data is None:
         return "Desculpe, não consegui processar sua solicitação no momento."
+    return chatbot_data.get(
+        "mensagem_no_response_pt" if lang == "pt" else "mensagem_no_response_en",
+        "Desculpe, não tenho uma resposta para isso." if lang == "pt" else "Sorry, I don't have an answer for that."
+    )
+
+async def fetch_greeting_message(chatbot_id: int, lang: str, cache: dict):
+    chatbot_data = await load_chatbot_metadata(chatbot_id, cache)
+    if chatbot_data is None:
+        return "Olá! Como posso ajudar?" if lang == "pt" else "Hello! How can I help you?"
+    return chatbot_data.get(
+        "mensagem_inicial_pt" if lang == "pt" else "mensagem_inicial_en",
+        "Olá! Como posso ajudar?" if lang == "pt" else "Hello! How can I help you?"
+    )
+
+def parse_categories(categories):
+    cat_keywords, feedback_ids = {}, {"pt": None, "en": None}
+    for cat in categories:
+        cat_id = cat["categoria_id"]
+        keys = cat.get("categoria", {}).get("keywords", [])
+        cat_keywords[cat_id] = [normalize_text(k) for k in keys]
+        if cat_id == 999: feedback_ids["pt"] = cat_id
+        if cat_id == 998: feedback_ids["en"] = cat_id
+    return cat_keywords, feedback_ids
+
+def parse_faq_item(item):
+    """((categoria, idioma), faq_id, pergunta, resposta) de um item de /faq-categoria, ou None."""
+    faq = item.get("faq", {})
+    q = faq.get("pergunta", "").strip()
+    a = faq.get("resposta", "").strip()
+    if not (q and a):
+        return None
+    idioma = "pt" if normalize_text(faq.get("idioma", "pt").lower()) in ["pt", "portugues", "português"] else "en"
+    return (item["categoria_id"], idioma), item.get("faq_id") or faq.get("faq_id"), q, a
+
+async def encode_questions(qlist):
+    return await inference.encode_many(qlist)
+
+def vector_id(faq_id, question: str) -> int:
+    """Id do vetor no índice: o faq_id, ou um id estável derivado da pergunta se o backend não o enviar."""
+    if faq_id is not None:
+        return int(faq_id)
+    return (1 << 40) | zlib.crc32(question.encode("utf-8"))
+
+
+async def fetch_chatbot_sources(chatbot_id: str):
+    """Respostas do backend a partir das quais a cache é construída (e o seu hash calculado)."""
+    # Categorias e FAQs numa só passagem (FAQ_SOURCE): sem repetir /chatbot-categoria
+    (categories, faqs), chatbot_data = await asyncio.gather(
+        load_chatbot_faqs(chatbot_id),
+        fetch_chatbot_or_none(int(chatbot_id)),
+    )
+    return categories, faqs, chatbot_data
+
+async def build_cache_from_sources(chatbot_id: str, categories, faqs, chatbot_data) -> dict:
+    cat_keywords, feedback_ids = parse_categories(categories)
+    # Por idioma: cada FAQ entra uma só vez, mesmo que pertença a várias categorias
+    faqs_by_lang, members = {}, {}
+
+    for item in faqs:
+        parsed = parse_faq_item(item)
+        if parsed:
+            (cat_id, lang), faq_id, q, a = parsed
+            vid = vector_id(faq_id, q)
+            faqs_by_lang.setdefault(lang, {})[vid] = (faq_id, q, a)
+            members.setdefault(lang, {}).setdefault(cat_id, []).append(vid)
+
+    indices = {}
+    for lang, lang_faqs in faqs_by_lang.items():
+        ids = np.fromiter(lang_faqs, dtype=np.int64, count=len(lang_faqs))
+        qlist = [faq[1] for faq in lang_faqs.values()]
+        # Flat, HNSW ou IVF-PQ consoante o tamanho (FAISS_INDEX_TYPE); com EMBEDDINGS_DIR
+        # o índice é um ficheiro mapeado, partilhado pelos workers
+        spec = index_spec(len(qlist), model.get_sentence_embedding_dimension())
+        idx, shared = await shared_index(qlist, encode_questions, lambda embeds: build_index(embeds, ids), ids,
+                                        f"faiss-{spec}", f"{chatbot_id}-{lang}")
+        indices[lang] = {
+            "index": idx,
+            "shared": shared,
+            "faqs": lang_faqs,
+            "categories": {cat_id: np.array(vids, dtype=np.int64) for cat_id, vids in members[lang].items()},
+        }
+
+    return {
+        "chatbot": chatbot_data,
+        "category_keywords": cat_keywords,
+        "keyword_matcher": KeywordMatcher(cat_keywords),
+        "feedback_negativo_ids": feedback_ids,
+        "indices_by_language": indices
+    }
 
-async def fetch_greeting_message(chatbot_id: int, lang: str):
-    url = f"http://localhost:3004/chatbots/{chatbot_id}"
+def dump_chatbot_cache(cache: dict):
+    """(meta, índices) para o snapshot; as chaves inteiras vão como listas."""
+    meta = {
+        "chatbot": cache["chatbot"],
+        "category_keywords": list(cache["category_keywords"].items()),
+        "feedback_negativo_ids": cache["feedback_negativo_ids"],
+        "languages": {
+            lang: {
+                "faqs": [[vid, *faq] for vid, faq in data["faqs"].items()],
+                "categories": [[cat_id, ids.tolist()] for cat_id, ids in data["categories"].items()],
+            }
+            for lang, data in cache["indices_by_language"].items()
+        },
+    }
+    indexes = {f"index_{lang}": data["index"] for lang, data in cache["indices_by_language"].items()}
+    return meta, None, indexes
+
+def restore_chatbot_cache(snapshot) -> dict:
+    meta = snapshot.meta
+    cat_keywords = {cat_id: keywords for cat_id, keywords in meta["category_keywords"]}
+    return {
+        "chatbot": meta["chatbot"],
+        "category_keywords": cat_keywords,
+        "keyword_matcher": KeywordMatcher(cat_keywords),
+        "feedback_negativo_ids": meta["feedback_negativo_ids"],
+        "indices_by_language": {
+            lang: {
+                # Índice mapeado do snapshot: só de leitura, clonado antes de uma atualização
+                "index": snapshot.indexes[f"index_{lang}"],
+                "shared": True,
+                "faqs": {vid: (faq_id, q, a) for vid, faq_id, q, a in data["faqs"]},
+                "categories": {cat_id: np.array(ids, dtype=np.int64) for cat_id, ids in data["categories"]},
+            }
+            for lang, data in meta["languages"].items()
+        },
+        "content_hash": snapshot.content_hash,
+    }
+
+async def build_chatbot_cache(chatbot_id: str) -> dict:
+    if chatbot_id not in chatbot_caches:
+        # Primeiro carregamento desde o arranque: serve o último snapshot já e valida-o depois
+        snapshot = await asyncio.to_thread(snapshots.load, chatbot_id)
+        if snapshot is not None:
+            snapshots.schedule_revalidation(chatbot_caches, chatbot_id, snapshot.content_hash, fetch_chatbot_sources)
+            return restore_chatbot_cache(snapshot)
+
+    sources = await fetch_chatbot_sources(chatbot_id)
+    digest = snapshots.content_hash(*sources)
+    snapshot = await asyncio.to_thread(snapshots.load, chatbot_id, digest)
+    if snapshot is not None:
+        return restore_chatbot_cache(snapshot)
+
+    cache = await build_cache_from_sources(chatbot_id, *sources)
+    cache["content_hash"] = digest
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            chatbot_data = response.json()
-            return chatbot_data.get(
-                "mensagem_inicial_pt" if lang == "pt" else "mensagem_inicial_en",
-                "Olá! Como posso ajudar?" if lang == "pt" else "Hello! How can I help you?"
-            )
+        await asyncio.to_thread(snapshots.save, chatbot_id, digest, *dump_chatbot_cache(cache))
     except Exception as e:
-        logger.error(f"Erro ao buscar mensagem de saudação: {e}")
-        return "Olá! Como posso ajudar?" if lang == "pt" else "Hello! How can I help you?"
+        logger.error(f"Chatbot {chatbot_id}: erro ao gravar o snapshot: {e}")
+    return cache
+
+def describe_chatbot_cache(cache: dict) -> dict:
+    indices = cache["indices_by_language"]
+    return {
+        "categories": len(cache["category_keywords"]),
+        "faqs": sum(len(data["faqs"]) for data in indices.values()),
+        "memberships": sum(len(ids) for data in indices.values() for ids in data["categories"].values()),
+        "indices": {lang: describe_index(data["index"]) for lang, data in indices.items()},
+        "content_hash": cache.get("content_hash"),
+    }
+
+# Um único builder por chatbot_id, mesmo com pedidos concorrentes
+# A configuração dos índices entra no hash: mudar p.ex. FAISS_INDEX_TYPE invalida os snapshots
+snapshots = SnapshotStore("FAISS_API_BD", settings=build_signature())
+chatbot_caches = ChatbotCache(build_chatbot_cache, describe_chatbot_cache)
+data_cache = chatbot_caches.entries
+
+# Atualizações incrementais (webhook /faq-events ou LISTEN/NOTIFY)
+async def fetch_category_rows(cat_id: int) -> dict:
+    rows = {}
+    for item in await fetch_category_faqs(cat_id):
+        parsed = parse_faq_item(item)
+        if parsed:
+            (_, lang), faq_id, q, a = parsed
+            rows.setdefault(lang, []).append((faq_id, q, a))
+    return rows
+
+def current_category_rows(cache: dict, cat_id: int) -> dict:
+    return {
+        lang: [data["faqs"][int(vid)] for vid in data["categories"][cat_id]]
+        for lang, data in cache["indices_by_language"].items() if cat_id in data["categories"]
+    }
+
+async def apply_category_rows(cache: dict, cat_id: int, rows_by_lang: dict):
+    """Atualiza o índice de cada idioma no lugar: muda a lista de FAQs da categoria,
+    codifica só as perguntas novas ou alteradas e retira as FAQs que deixaram de
+    pertencer a qualquer categoria."""
+    indices = cache["indices_by_language"]
+    for lang in {lang for lang, data in indices.items() if cat_id in data["categories"]} | set(rows_by_lang):
+        rows = rows_by_lang.get(lang, [])
+        data = indices.get(lang) or {"index": None, "shared": False, "faqs": {}, "categories": {}}
+        vids = [vector_id(faq_id, q) for faq_id, q, _ in rows]
+        changed = {}
+        for vid, row in zip(vids, rows):
+            current = data["faqs"].get(vid)
+            if current is None or current[1] != row[1]:
+                changed[vid] = row
+        embeds = await encode_questions([row[1] for row in changed.values()]) if changed else None
+
+        # Sem awaits daqui para baixo: índice, FAQs e categorias mudam juntos
+        categories = dict(data["categories"])
+        if vids:
+            categories[cat_id] = np.array(list(dict.fromkeys(vids)), dtype=np.int64)
+        else:
+            categories.pop(cat_id, None)
+        live = set(np.concatenate(list(categories.values())).tolist()) if categories else set()
+        replaced = [vid for vid in changed if vid in data["faqs"]]
+        orphans = [vid for vid in data["faqs"] if vid not in live]
+        removed = replaced + orphans
+
+        if not categories:
+            indices.pop(lang, None)
+            logger.info(f"Categoria {cat_id}/{lang}: índice do idioma removido")
+            continue
+        changed_ids = np.fromiter(changed, dtype=np.int64, count=len(changed))
+        if data["index"] is None:
+            data["index"] = build_index(embeds, changed_ids)
+        else:
+            if data.get("shared") and (removed or changed):
+                # O índice mapeado é só de leitura: este worker passa a ter a sua cópia
+                data["index"] = writable_copy(data["index"])
+                data["shared"] = False
+            if removed:
+                # O HNSW não remove vetores: nesse caso o índice é reconstruído
+                data["index"] = remove_ids(data["index"], removed)
+            if changed:
+                # Nos tipos treinados (IVF-PQ) os vetores novos usam os centróides já existentes
+                data["index"].add_with_ids(embeds, changed_ids)
+
+        faqs = {vid: faq for vid, faq in data["faqs"].items() if vid in live}
+        # As respostas podem mudar sem a pergunta mudar: essas não precisam de novo vetor
+        faqs.update({vid: row for vid, row in zip(vids, rows)})
+        data["faqs"] = faqs
+        data["categories"] = categories
+        indices[lang] = data
+        logger.info(f"Categoria {cat_id}/{lang}: -{len(removed)} +{len(changed)} FAQs no índice")
+
+async def refresh_category_keywords(chatbot_id: str, cache: dict):
+    cat_keywords, feedback_ids = parse_categories(await fetch_categories(chatbot_id))
+    cache["category_keywords"] = cat_keywords
+    cache["keyword_matcher"] = KeywordMatcher(cat_keywords)
+    cache["feedback_negativo_ids"] = feedback_ids
+    stale = {cat_id for data in cache["indices_by_language"].values() for cat_id in data["categories"]}
+    for cat_id in stale - set(cat_keywords):
+        await apply_category_rows(cache, cat_id, {})
+
+def summarize_sources(categories, faqs, chatbot_data):
+    """O conteúdo que a cache deve ter segundo o backend, comparável sem codificar nada."""
+    cat_keywords, feedback_ids = parse_categories(categories)
+    rows = set()
+    for item in faqs:
+        parsed = parse_faq_item(item)
+        if parsed:
+            key, faq_id, q, a = parsed
+            rows.add((*key, faq_id, q, a))
+    return chatbot_data, cat_keywords, feedback_ids, rows
+
+def summarize_cache(cache: dict):
+    rows = {
+        (cat_id, lang, *data["faqs"][int(vid)])
+        for lang, data in cache["indices_by_language"].items()
+        for cat_id, vids in data["categories"].items()
+        for vid in vids
+    }
+    return cache["chatbot"], cache["category_keywords"], cache["feedback_negativo_ids"], rows
+
+async def save_updated_snapshot(chatbot_id: str, cache: dict):
+    """Snapshot da cache depois de alterações incrementais, com o hash das fontes atuais.
+
+    Só grava se a cache tiver o mesmo conteúdo que o backend: com uma alteração
+    ainda por aplicar, o hash seria de um conteúdo que a cache não tem.
+    """
+    if not snapshots.enabled:
+        return
+    sources = await fetch_chatbot_sources(chatbot_id)
+    if summarize_cache(cache) != summarize_sources(*sources):
+        logger.info(f"Chatbot {chatbot_id}: cache ainda difere do backend; snapshot não gravado")
+        return
+    digest = snapshots.content_hash(*sources)
+    await asyncio.to_thread(snapshots.save, chatbot_id, digest, *dump_chatbot_cache(cache))
+    cache["content_hash"] = digest
+
+faq_changes = FaqChangeFeed(chatbot_caches, fetch_category_rows, current_category_rows,
+                            apply_category_rows, refresh_category_keywords, save_updated_snapshot)
+
+async def warm_model():
+    # A primeira inferência é sempre mais lenta (alocações, kernels): que seja esta
+    await inference.encode_query("aquecimento do modelo")
+    # O identificador de idioma treina-se no primeiro uso
+    get_language_model()
+
+# Caches dos chatbots ativos construídas no arranque (PREWARM_CHATBOTS), não no primeiro pedido
+prewarm = Prewarmer(chatbot_caches, warmup=warm_model)
+
+@app.post("/reload/{chatbot_id}")
+async def reload_chatbot(chatbot_id: str, wait: bool = False):
+    """Reconstrói a cache do chatbot em background; o tráfego continua na versão anterior."""
+    future = chatbot_caches.reload(chatbot_id.strip())
+    if wait:
+        try:
+            await chatbot_caches.wait(future)
+        except Exception as e:
+            raise HTTPException(502, f"Erro ao recarregar o chatbot {chatbot_id}: {e}")
+    return chatbot_caches.status(chatbot_id.strip())
+
+@app.get("/reload/{chatbot_id}")
+async def reload_status(chatbot_id: str):
+    return chatbot_caches.status(chatbot_id.strip())
+
+@app.post("/faq-events")
+async def faq_events(changes: Union[FaqChange, List[FaqChange]]):
+    """Webhook para o backend avisar de alterações em FAQ, Faq_Categoria ou Categoria."""
+    if isinstance(changes, FaqChange):
+        changes = [changes]
+    affected = set()
+    for change in changes:
+        affected.update(await faq_changes.apply(change))
+    return {"applied": len(changes), "chatbots": sorted(affected)}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: só responde 200 depois do prewarm das caches dos chatbots ativos."""
+    if not prewarm.ready:
+        raise HTTPException(503, prewarm.status())
+    return prewarm.status()
+
+@app.get("/inference/stats")
+async def inference_stats():
+    return inference.stats()
+
+@app.get("/sessions/stats")
+async def sessions_stats():
+    return conversation_states.memory_usage()
 
 @app.post("/chat_dumb")
 async def chat(req: MessageRequest):
-    user_input = req.message.strip()
-    lang = detect_language(user_input)
+    # Normalização, idioma e saudação calculados uma só vez para todo o pedido
+    message = analyze_message(req.message)
+    lang = message.language
     chatbot_id = req.chatbot_id.strip()
     session_id = req.session_id.strip()
 
-    if req.force_reload and chatbot_id in data_cache:
-        del data_cache[chatbot_id]
-
-    if chatbot_id not in data_cache:
-        categories = await fetch_categories(chatbot_id)
-        faqs = await fetch_faq_data(int(chatbot_id))
-
-        cat_keywords, feedback_ids = {}, {"pt": None, "en": None}
-        questions, answers, indices = {}, {}, {}
-
-        for cat in categories:
-            cat_id = cat["categoria_id"]
-            keys = cat.get("categoria", {}).get("keywords", [])
-            cat_keywords[cat_id] = [normalize_text(k) for k in keys]
-            if cat_id == 999: feedback_ids["pt"] = cat_id
-            if cat_id == 998: feedback_ids["en"] = cat_id
-
-        for item in faqs:
-            cat_id = item["categoria_id"]
-            faq = item.get("faq", {})
-            q = faq.get("pergunta", "").strip()
-            a = faq.get("resposta", "").strip()
-            idioma = "pt" if normalize_text(faq.get("idioma", "pt").lower()) in ["pt", "portugues", "português"] else "en"
-            key = (cat_id, idioma)
-            if q and a:
-                questions.setdefault(key, []).append(q)
-                answers.setdefault(key, []).append(a)
-
-        for key, qlist in questions.items():
-            embeds = model.encode(qlist, convert_to_numpy=True)
-            embeds /= np.linalg.norm(embeds, axis=1, keepdims=True)
-            idx = faiss.IndexFlatL2(embeds.shape[1])
-            idx.add(embeds)
-            indices[key] = {"index": idx, "questions": qlist, "answers": answers[key]}
-
-        data_cache[chatbot_id] = {
-            "category_keywords": cat_keywords,
-            "feedback_negativo_ids": feedback_ids,
-            "indices_by_category": indices
-        }
+    # Reconstrução em background: este pedido ainda é servido pela versão atual
+    if req.force_reload:
+        chatbot_caches.reload(chatbot_id)
+
+    cache = await chatbot_caches.get(chatbot_id)
+    state = await conversation_states.load(session_id, lang)
+    try:
+        return await respond(message, lang, chatbot_id, cache, state)
+    finally:
+        # Com um backend partilhado o próximo pedido da sessão pode ir para outro worker
+        await conversation_states.save(session_id, state)
+
+async def respond(message: AnalyzedMessage, lang: str, chatbot_id: str, cache: dict, state):
+    user_input = message.text
+    if message.greeting:
+        return {"response": await fetch_greeting_message(int(chatbot_id), lang, cache)}
+
+    categorias = detect_categories(message, cache["keyword_matcher"])
+    if is_feedback_negativo(categorias, lang, cache["feedback_negativo_ids"]):
+        ref = state.next_ref()
+        answer = resolve_answer(cache["indices_by_language"], state.language, ref) if ref is not None else None
+        if answer:
+            return {"response": answer}
+        return {"response": await fetch_no_response_message(int(chatbot_id), lang, cache)}
 
-    cache = data_cache[chatbot_id]
-    state = conversation_states.setdefault(session_id, {
-        "language": lang,
-        "last_possible_answers": [],
-        "last_answer_index": 0,
-        "last_question": "",
-        "negative_feedback_count": 0
-    })
-
-    if is_greeting(user_input):
-        return {"response": await fetch_greeting_message(int(chatbot_id), lang)}
-
-    if is_feedback_negativo(user_input, lang, cache["category_keywords"], cache["feedback_negativo_ids"]):
-        idx = state["last_answer_index"] + 1
-        if idx < len(state["last_possible_answers"]):
-            state["last_answer_index"] = idx
-            return {"response": state["last_possible_answers"][idx]}
-        return {"response": await fetch_no_response_message(int(chatbot_id), lang)}
-
-    categorias = detect_categories(user_input, cache["category_keywords"])
     if not categorias:
-        return {"response": await fetch_no_response_message(int(chatbot_id), lang)}
+        return {"response": await fetch_no_response_message(int(chatbot_id), lang, cache)}
 
-    answers = find_answers_faiss_with_threshold(user_input, cache["indices_by_category"], lang, categorias)
+    answers, refs = await find_answers_faiss_with_threshold(user_input, cache["indices_by_language"], lang, categorias)
     if not answers:
-        return {"response": await fetch_no_response_message(int(chatbot_id), lang)}
+        return {"response": await fetch_no_response_message(int(chatbot_id), lang, cache)}
 
-    state.update({
-        "last_question": user_input,
-        "last_possible_answers": answers,
-        "last_answer_index": 0
-    })
+    state.last_question = user_input
+    state.set_answers(refs, lang)
 
     return {"response": answers[0]}
@@ -1,13 +1,28 @@
 import os
 import unicodedata
-from langdetect import detect
 import faiss
-from sentence_transformers import SentenceTransformer
+from onnx_encoder import load_encoder
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from inference import InferenceExecutor
+from faiss_factory import merge_into, tune_for_search
+from keyword_matcher import KeywordMatcher
+from language_id import identify_language
 
-app2 = FastAPI()
+LANGUAGES = ("pt", "en")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Índices dos dois idiomas lidos e modelo aquecido antes do primeiro pedido
+    for lang in LANGUAGES:
+        DATA_CACHE[lang] = load_data(lang)
+    await INFERENCE.encode_query("aquecimento do modelo", normalize=False)
+    yield
+    INFERENCE.shutdown()
+
+app2 = FastAPI(lifespan=lifespan)
 app2.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -19,7 +34,8 @@ app2.add_middleware(
 BOTS_FOLDER = "bots"
 SELECTED_BOT = "dumb_faq"
 BOT_PATH = os.path.join(BOTS_FOLDER, SELECTED_BOT)
-MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL = load_encoder("all-MiniLM-L6-v2")  # ENCODER_BACKEND=torch|onnx
+INFERENCE = InferenceExecutor(MODEL)  # o modelo nunca corre no event loop
 DATA_CACHE = {}
 
 
@@ -40,9 +56,9 @@ def load_qa(path):
     return questions, answers
 
 
-def search_faiss(msg, index, answers, top_k=3, max_distance=10):
+async def search_faiss(msg, index, answers, top_k=3, max_distance=10):
     msg_norm = normalize_text(msg)
-    emb = MODEL.encode([msg_norm]).astype('float32')
+    emb = await INFERENCE.encode_query(msg_norm, normalize=False)
     distances, indices = index.search(emb, top_k)
 
     print("Distances returned by FAISS:", distances[0])  # Debugging
@@ -61,13 +77,9 @@ def load_negative_feedback(path):
         return set(normalize_text(line.strip()) for line in f if line.strip())
 
 
-def is_negative_feedback(user_input, neg_phrases):
-    user_norm = normalize_text(user_input)
-    for phrase in neg_phrases:
-        if phrase in user_norm:
-            if f" {phrase} " in f" {user_norm} " or user_norm.startswith(phrase) or user_norm.endswith(phrase):
-                return True
-    return False
+def is_negative_feedback(user_input, feedback_matcher):
+    # Só frases isoladas (whole_words)
+    return feedback_matcher.any(normalize_text(user_input))
 
 
 def load_data(language):
@@ -97,17 +109,14 @@ def load_data(language):
 
             # Carrega índice FAISS
             if os.path.exists(index_path):
-                sub_index = faiss.read_index(index_path)
-                if not index:
-                    index = sub_index
-                else:
-                    index.merge_from(sub_index)
+                # merge_from só serve para índices flat; os outros juntam-se pelos vetores
+                index = merge_into(index, faiss.read_index(index_path))
 
-    # Carregar frases negativas
+    # Carregar frases negativas (compiladas uma vez por idioma)
     neg_path = os.path.join(BOT_PATH, f"negative_feedback_{language}.txt")
-    neg_feedback = load_negative_feedback(neg_path)
+    feedback_matcher = KeywordMatcher({"feedback": load_negative_feedback(neg_path)}, whole_words=True)
 
-    return all_questions, all_answers, index, neg_feedback
+    return all_questions, all_answers, tune_for_search(index) if index else None, feedback_matcher
 
 
 # -------- Estado Temporário --------
@@ -127,22 +136,18 @@ class MessageRequest(BaseModel):
 @app2.post("/chat_2")
 async def chat(req: MessageRequest):
     msg = req.message.strip()
-    try:
-        lang = detect(msg)
-        lang = "pt" if lang == "pt" else "en"
-    except:
-        lang = "pt"
+    lang = "en" if identify_language(msg)[0] == "en" else "pt"
 
     if lang not in DATA_CACHE:
         DATA_CACHE[lang] = load_data(lang)
 
-    questions, answers, index, neg_feedback = DATA_CACHE[lang]
+    questions, answers, index, feedback_matcher = DATA_CACHE[lang]
 
     if not index or not answers:
         return {"response": "Dados não disponíveis." if lang == "pt" else "Data not available."}
 
     # Verifica feedback negativo
-    if is_negative_feedback(msg, neg_feedback):
+    if is_negative_feedback(msg, feedback_matcher):
         CONVERSATION_STATE["negative_count"] += 1
         if CONVERSATION_STATE["last_answers"] and CONVERSATION_STATE["last_index"] + 1 < len(CONVERSATION_STATE["last_answers"]):
             CONVERSATION_STATE["last_index"] += 1
@@ -154,7 +159,7 @@ async def chat(req: MessageRequest):
     CONVERSATION_STATE["last_question"] = msg
     CONVERSATION_STATE["last_index"] = 0
 
-    faiss_results = search_faiss(msg, index, answers)
+    faiss_results = await search_faiss(msg, index, answers)
     if faiss_results:
         CONVERSATION_STATE["last_answers"] = faiss_results
         return {"response": faiss_results[0]}
@@ -3,6 +3,7 @@ import unicodedata
 import faiss
 import random
 from sentence_transformers import SentenceTransformer
+from keyword_matcher import KeywordMatcher
 
 # Normaliza texto
 def normalize_text(text):
@@ -34,15 +35,8 @@ def load_category_keywords(path):
     return category_keywords
 
 # Detecta múltiplas categorias
-def detect_categories(user_input, category_keywords):
-    normalized_input = normalize_text(user_input)
-    detected = []
-    for cat, keywords in category_keywords.items():
-        for word in keywords:
-            if word in normalized_input:
-                detected.append(cat)
-                break
-    return detected
+def detect_categories(user_input, category_matcher):
+    return category_matcher.find(normalize_text(user_input))
 
 # Carrega índices FAISS, QAs e keywords
 def load_data(index_folder, lang_suffix):
@@ -67,9 +61,10 @@ def load_data(index_folder, lang_suffix):
             cat_to_answers[category] = answers
 
     keywords_path = os.path.join(index_folder, f"categories_{lang_suffix}.txt")
-    category_keywords = load_category_keywords(keywords_path)
+    # Keywords compiladas uma vez, ao carregar
+    category_matcher = KeywordMatcher(load_category_keywords(keywords_path))
 
-    return cat_to_index, cat_to_questions, cat_to_answers, category_keywords
+    return cat_to_index, cat_to_questions, cat_to_answers, category_matcher
 
 # Busca respostas com FAISS
 def search_answers(index, model, answers, user_question, top_k=3):
@@ -100,9 +95,8 @@ def load_negative_feedback(path):
     with open(path, "r", encoding="utf-8") as f:
         return set(normalize_text(line.strip()) for line in f if line.strip())
 
-def is_negative_feedback(user_input, neg_phrases):
-    user_norm = normalize_text(user_input)
-    return any(phrase in user_norm for phrase in neg_phrases)
+def is_negative_feedback(user_input, feedback_matcher):
+    return feedback_matcher.any(normalize_text(user_input))
 
 # -------------------- Principal --------------------
 
@@ -112,8 +106,8 @@ if __name__ == "__main__":
     lang_suffix = "pt"  # podes adaptar conforme idioma
     neg_feedback_path = os.path.join(index_folder, f"negative_feedback_{lang_suffix}.txt")
 
-    cat_to_index, cat_to_questions, cat_to_answers, category_keywords = load_data(index_folder, lang_suffix)
-    neg_feedback = load_negative_feedback(neg_feedback_path)
+    cat_to_index, cat_to_questions, cat_to_answers, category_matcher = load_data(index_folder, lang_suffix)
+    feedback_matcher = KeywordMatcher({"feedback": load_negative_feedback(neg_feedback_path)})
 
     print("Chatbot iniciado! Escreva 'exit' para sair.")
 
@@ -128,12 +122,12 @@ if __name__ == "__main__":
             print("Bot: Até logo!")
             break
 
-        if is_negative_feedback(user_input, neg_feedback):
+        if is_negative_feedback(user_input, feedback_matcher):
             if last_question:
                 negative_count += 1
                 if negative_count >= 2:
                     print("Bot: A procurar uma resposta melhor com IA...")
-                    detected_cats = detect_categories(last_question, category_keywords)
+                    detected_cats = detect_categories(last_question, category_matcher)
                     for cat in detected_cats:
                         if cat in cat_to_index:
                             faiss_results = search_answers(cat_to_index[cat], model, cat_to_answers[cat], last_question)
@@ -151,7 +145,7 @@ if __name__ == "__main__":
             continue
 
         # Nova questão
-        detected_cats = detect_categories(user_input, category_keywords)
+        detected_cats = detect_categories(user_input, category_matcher)
         if not detected_cats:
             print("Bot: Não consegui identificar a categoria. Tente usar palavras-chave.")
             last_possible_answers = []
@@ -1,6 +1,7 @@
 import os
 import faiss
 from sentence_transformers import SentenceTransformer
+from faiss_factory import build_index
 
 def load_faq_file(path):
     questions = []
@@ -32,8 +33,7 @@ def build_and_save_indexes(faq_folder, model, index_folder):
             questions, answers = load_faq_file(path)
             if questions:
                 q_embeds = model.encode(questions).astype('float32')
-                index = faiss.IndexFlatL2(q_embeds.shape[1])
-                index.add(q_embeds)
+                index = build_index(q_embeds)
 
                 # Salva o índice no disco
                 faiss.write_index(index, os.path.join(index_folder, f"{category}.index"))
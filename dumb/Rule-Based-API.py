@@ -1,8 +1,10 @@
 import os
 import unicodedata
-from difflib import SequenceMatcher
 from fastapi import FastAPI
 from pydantic import BaseModel
+from keyword_matcher import KeywordMatcher
+from language_id import identify_language
+from lexical_ranker import LexicalRanker
 
 app = FastAPI()
 
@@ -16,9 +18,6 @@ def normalize_text(text):
     text = text.lower()
     return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
 
-def similarity(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
 def load_rule_data(language):
     suffix = f"_{language}"
     cat_to_questions = {}
@@ -46,17 +45,12 @@ def load_rule_data(language):
             cat_to_questions[category] = questions
             cat_to_answers[category] = answers
 
-    return category_keywords, cat_to_questions, cat_to_answers
+    # Keywords compiladas e perguntas normalizadas e indexadas uma vez por idioma
+    cat_to_ranker = {cat: LexicalRanker([normalize_text(q) for q in qs]) for cat, qs in cat_to_questions.items()}
+    return KeywordMatcher(category_keywords), cat_to_ranker, cat_to_answers
 
-def detect_categories(user_input, category_keywords):
-    normalized_input = normalize_text(user_input)
-    detected = []
-    for cat, keywords in category_keywords.items():
-        for word in keywords:
-            if word in normalized_input:
-                detected.append(cat)
-                break
-    return detected
+def detect_categories(user_input, category_matcher):
+    return category_matcher.find(normalize_text(user_input))
 
 class MessageRequest(BaseModel):
     message: str
@@ -65,35 +59,23 @@ class MessageRequest(BaseModel):
 async def chat_rule(req: MessageRequest):
     user_input = req.message.strip()
 
-    lang = "pt"
-    try:
-        from langdetect import detect
-        lang = "pt" if detect(user_input) == "pt" else "en"
-    except:
-        pass
+    lang = "en" if identify_language(user_input)[0] == "en" else "pt"
 
     if lang not in DATA_CACHE:
         DATA_CACHE[lang] = load_rule_data(lang)
 
-    category_keywords, cat_to_questions, cat_to_answers = DATA_CACHE[lang]
+    category_matcher, cat_to_ranker, cat_to_answers = DATA_CACHE[lang]
 
-    categories = detect_categories(user_input, category_keywords)
+    categories = detect_categories(user_input, category_matcher)
     if not categories:
         return {"response": "Não consegui identificar categorias. Tente usar palavras-chave."}
 
     user_norm = normalize_text(user_input)
     for cat in categories:
-        questions = cat_to_questions.get(cat, [])
-        answers = cat_to_answers.get(cat, [])
-        scored = []
-        for q, a in zip(questions, answers):
-            q_norm = normalize_text(q)
-            score = similarity(q_norm, user_norm)
-            if score > 0.3:
-                scored.append((score, a))
-
-        if scored:
-            scored.sort(key=lambda x: x[0], reverse=True)
-            return {"response": scored[0][1]}
+        if cat not in cat_to_ranker:
+            continue
+        ranked = cat_to_ranker[cat].rank(user_norm, 0.3)
+        if ranked:
+            return {"response": cat_to_answers[cat][ranked[0]]}
 
     return {"response": "Lamento, não encontrei nenhuma resposta adequada."}
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from embedding_store import EMBEDDINGS_MODEL
+from onnx_encoder import ENCODER_BACKEND
+
+logger = logging.getLogger("cache_snapshot")
+
+# ========== Configuração ==========
+# Diretório dos snapshots das caches por chatbot ("" desativa)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", 2))
+# Sobe sempre que muda o que os serviços gravam no snapshot
+SNAPSHOT_FORMAT = 1
+
+
+class Snapshot(NamedTuple):
+    content_hash: str
+    meta: dict
+    arrays: Dict[str, np.ndarray]
+    indexes: dict
+
+
+def content_hash(*sources, settings: str = "") -> str:
+    """Hash das respostas do backend a partir das quais a cache foi construída.
+
+    O modelo e o backend do encoder entram no hash: com outro modelo os mesmos
+    dados dão outras embeddings e o snapshot já não serve. `settings` acrescenta
+    a configuração do serviço que muda o conteúdo (p.ex. o tipo de índice).
+    """
+    digest = hashlib.sha256(f"{SNAPSHOT_FORMAT}\0{EMBEDDINGS_MODEL}\0{ENCODER_BACKEND}\0{settings}\0".encode("utf-8"))
+    digest.update(json.dumps(sources, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _read_index(path: str):
+    import faiss
+
+    # mmap do ficheiro (só de leitura); nem todos os tipos de índice o suportam
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+class SnapshotStore:
+    """Snapshots versionados das caches por chatbot de um serviço.
+
+    Cada versão é um diretório <serviço>/<chatbot>/<content_hash>/ com um
+    meta.json (textos, keywords, metadados), as matrizes em .npy e os índices
+    FAISS. É escrito num diretório temporário e renomeado no fim, por isso uma
+    versão visível está sempre completa. LATEST aponta para a última gravada.
+    Ao carregar, matrizes e índices são mapeados do disco em vez de lidos.
+    """
+
+    def __init__(self, service: str, settings: str = "", root: str = SNAPSHOT_DIR, keep: int = SNAPSHOT_KEEP):
+        self.root = os.path.join(root, service) if root else ""
+        self.settings = settings
+        self.keep = keep
+        self._revalidations = set()
+
+    def content_hash(self, *sources) -> str:
+        return content_hash(*sources, settings=self.settings)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def _chatbot_dir(self, chatbot_id: str) -> str:
+        return os.path.join(self.root, str(chatbot_id))
+
+    def save(self, chatbot_id: str, digest: str, meta: dict, arrays: Dict[str, np.ndarray] = None, indexes: dict = None):
+        if not self.enabled:
+            return
+        base = self._chatbot_dir(chatbot_id)
+        target = os.path.join(base, digest)
+        if os.path.exists(os.path.join(target, "meta.json")):
+            self._point_latest(base, digest)
+            return
+        os.makedirs(base, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=base, prefix=".tmp-")
+        try:
+            for name, array in (arrays or {}).items():
+                with open(os.path.join(tmp_dir, f"{name}.npy"), "wb") as f:
+                    np.save(f, np.ascontiguousarray(array, dtype=np.float32))
+            if indexes:
+                import faiss
+                for name, index in indexes.items():
+                    faiss.write_index(index, os.path.join(tmp_dir, f"{name}.faiss"))
+            # meta.json por último: é ele que marca a versão como válida
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "format": SNAPSHOT_FORMAT,
+                    "content_hash": digest,
+                    "model": EMBEDDINGS_MODEL,
+                    "encoder_backend": ENCODER_BACKEND,
+                    "created_at": time.time(),
+                    "arrays": sorted(arrays or {}),
+                    "indexes": sorted(indexes or {}),
+                    "data": meta,
+                }, f, ensure_ascii=False, default=str)
+            try:
+                os.replace(tmp_dir, target)
+            except OSError:
+                # Outro worker gravou a mesma versão entretanto
+                if not os.path.exists(os.path.join(target, "meta.json")):
+                    raise
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self._point_latest(base, digest)
+        self._prune(base, digest)
+        logger.info(f"Snapshot do chatbot {chatbot_id} gravado em {target}")
+
+    def _point_latest(self, base: str, digest: str):
+        fd, tmp_path = tempfile.mkstemp(dir=base, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            f.write(digest)
+        os.replace(tmp_path, os.path.join(base, "LATEST"))
+
+    def _prune(self, base: str, current: str):
+        versions = [
+            entry for entry in os.scandir(base)
+            if entry.is_dir() and not entry.name.startswith(".") and entry.name != current
+        ]
+        versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        # Os workers que ainda tenham uma versão antiga mapeada mantêm os ficheiros abertos
+        for entry in versions[max(self.keep - 1, 0):]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def load(self, chatbot_id: str, digest: Optional[str] = None) -> Optional[Snapshot]:
+        """Versão `digest` do snapshot (ou a mais recente), se existir e for compatível."""
+        if not self.enabled:
+            return None
+        base = self._chatbot_dir(chatbot_id)
+        if digest is None:
+            try:
+                with open(os.path.join(base, "LATEST"), "r") as f:
+                    digest = f.read().strip()
+            except FileNotFoundError:
+                return None
+        path = os.path.join(base, digest)
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Snapshot inválido em {path}: {e}")
+            return None
+        if (meta.get("format"), meta.get("content_hash"), meta.get("model"), meta.get("encoder_backend")) != \
+                (SNAPSHOT_FORMAT, digest, EMBEDDINGS_MODEL, ENCODER_BACKEND):
+            logger.info(f"Snapshot em {path} é de outra versão/modelo; ignorado")
+            return None
+        try:
+            arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in meta["arrays"]}
+            indexes = {name: _read_index(os.path.join(path, f"{name}.faiss")) for name in meta["indexes"]}
+        except Exception as e:
+            logger.warning(f"Snapshot incompleto em {path}: {e}")
+            return None
+        return Snapshot(digest, meta["data"], arrays, indexes)
+
+    def schedule_revalidation(self, caches, chatbot_id: str, digest: str, fetch_sources: Callable[[str], Awaitable[tuple]]):
+        """Depois de servir um snapshot, confirma-o contra o backend em background.
+
+        Se o conteúdo tiver mudado enquanto o serviço estava parado, a cache é
+        reconstruída; até lá os pedidos usam o snapshot.
+        """
+        task = asyncio.create_task(self._revalidate(caches, chatbot_id, digest, fetch_sources))
+        self._revalidations.add(task)
+        task.add_done_callback(self._revalidations.discard)
+
+    async def _revalidate(self, caches, chatbot_id: str, digest: str, fetch_sources: Callable[[str], Awaitable[tuple]]):
+        building = caches.reloading(chatbot_id)
+        if building is not None:
+            await asyncio.wait([building])
+        try:
+            current = self.content_hash(*await fetch_sources(chatbot_id))
+        except Exception as e:
+            logger.warning(f"Chatbot {chatbot_id}: não foi possível validar o snapshot: {e}")
+            return
+        if current != digest:
+            logger.info(f"Chatbot {chatbot_id}: snapshot desatualizado, a reconstruir")
+            caches.reload(chatbot_id)
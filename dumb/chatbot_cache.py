@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger("chatbot_cache")
+
+# Tempo máximo (s) para construir a cache de um chatbot e para um pedido esperar por ela
+CACHE_BUILD_TIMEOUT = float(os.getenv("CACHE_BUILD_TIMEOUT", 120))
+CACHE_WAIT_TIMEOUT = float(os.getenv("CACHE_WAIT_TIMEOUT", 120))
+
+
+class ChatbotCache:
+    """Cache por chatbot_id com carregamento single-flight.
+
+    Quando vários pedidos chegam para um chatbot que ainda não está em cache,
+    só o primeiro lança o `builder`; os restantes esperam pelo mesmo future.
+    A construção corre numa task própria, por isso um cliente que desista não
+    cancela o trabalho dos outros. Se a construção falhar, o erro chega a todos
+    os que estavam à espera e nada fica em cache (o pedido seguinte tenta de novo).
+
+    `reload` reconstrói uma entrada em background (double-buffering): enquanto a
+    nova versão é construída, os pedidos continuam a usar a anterior, que só é
+    substituída quando a nova está completa. `describe` (opcional) devolve as
+    contagens de itens de uma entrada, usadas nas estatísticas de construção.
+
+    Os chatbot_id são normalizados (str, sem espaços) em todos os métodos: o
+    chat e o /reload usam a mesma entrada mesmo que um deles venha com espaços.
+    """
+
+    def __init__(self, builder: Callable[[str], Awaitable[dict]],
+                 describe: Optional[Callable[[dict], dict]] = None,
+                 build_timeout: float = CACHE_BUILD_TIMEOUT,
+                 wait_timeout: float = CACHE_WAIT_TIMEOUT):
+        self.builder = builder
+        self.describe = describe
+        self.build_timeout = build_timeout
+        self.wait_timeout = wait_timeout
+        self.entries: Dict[str, dict] = {}
+        self.stats: Dict[str, dict] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # O loop só guarda referências fracas às tasks: sem isto uma construção
+        # podia ser recolhida pelo GC a meio
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def key(chatbot_id) -> str:
+        return str(chatbot_id).strip()
+
+    def __contains__(self, chatbot_id: str) -> bool:
+        return self.key(chatbot_id) in self.entries
+
+    async def get(self, chatbot_id: str) -> dict:
+        chatbot_id = self.key(chatbot_id)
+        entry = self.entries.get(chatbot_id)
+        if entry is not None:
+            return entry
+        return await self.load(chatbot_id)
+
+    async def load(self, chatbot_id: str) -> dict:
+        chatbot_id = self.key(chatbot_id)
+        if chatbot_id in self._inflight:
+            logger.info(f"Chatbot {chatbot_id}: à espera da construção em curso")
+        return await self.wait(self.reload(chatbot_id))
+
+    def reload(self, chatbot_id: str) -> asyncio.Future:
+        """Agenda a (re)construção em background e devolve o future partilhado.
+
+        Se já houver uma construção em curso para este chatbot, devolve essa.
+        """
+        chatbot_id = self.key(chatbot_id)
+        future = self._inflight.get(chatbot_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            # Evita o aviso "exception was never retrieved" se ninguém estiver à espera
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._inflight[chatbot_id] = future
+            task = asyncio.create_task(self._build(chatbot_id, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return future
+
+    def reloading(self, chatbot_id: str) -> Optional[asyncio.Future]:
+        """Future da construção em curso para este chatbot, se houver."""
+        return self._inflight.get(self.key(chatbot_id))
+
+    async def wait(self, future: asyncio.Future) -> dict:
+        # shield: o timeout/cancelamento de um pedido não cancela o future partilhado
+        return await asyncio.wait_for(asyncio.shield(future), timeout=self.wait_timeout)
+
+    async def _build(self, chatbot_id: str, future: asyncio.Future):
+        started = time.perf_counter()
+        stats = self.stats.setdefault(chatbot_id, {"chatbot_id": chatbot_id})
+        try:
+            entry = await asyncio.wait_for(self.builder(chatbot_id), timeout=self.build_timeout)
+            # Troca atómica: quem já tinha a entrada antiga continua a usá-la até ao fim do pedido
+            self.entries[chatbot_id] = entry
+            stats.update({
+                "status": "ready",
+                "built_at": time.time(),
+                "duration_s": round(time.perf_counter() - started, 3),
+                "counts": self.describe(entry) if self.describe else {},
+                "last_error": None,
+            })
+            logger.info(f"Chatbot {chatbot_id}: cache construída em {stats['duration_s']}s {stats['counts']}")
+            future.set_result(entry)
+        except asyncio.TimeoutError:
+            logger.error(f"Chatbot {chatbot_id}: construção da cache excedeu {self.build_timeout}s")
+            self._record_failure(stats, started, f"timeout após {self.build_timeout}s")
+            future.set_exception(TimeoutError(f"Timeout ao carregar o chatbot {chatbot_id}"))
+        except Exception as e:
+            logger.error(f"Chatbot {chatbot_id}: erro ao construir a cache: {e}")
+            self._record_failure(stats, started, str(e))
+            future.set_exception(e)
+        except asyncio.CancelledError:
+            # P.ex. no fecho do loop: quem está à espera recebe o erro em vez de ficar até ao timeout
+            logger.warning(f"Chatbot {chatbot_id}: construção da cache cancelada")
+            self._record_failure(stats, started, "cancelada")
+            if not future.done():
+                future.set_exception(RuntimeError(f"Construção da cache do chatbot {chatbot_id} cancelada"))
+            raise
+        finally:
+            self._inflight.pop(chatbot_id, None)
+
+    def _record_failure(self, stats: dict, started: float, error: str):
+        # A entrada anterior (se existir) continua a servir tráfego
+        stats.update({
+            "status": "ready" if stats["chatbot_id"] in self.entries else "failed",
+            "failed_at": time.time(),
+            "failed_duration_s": round(time.perf_counter() - started, 3),
+            "last_error": error,
+        })
+
+    def status(self, chatbot_id: str) -> dict:
+        chatbot_id = self.key(chatbot_id)
+        return {
+            **self.stats.get(chatbot_id, {"chatbot_id": chatbot_id, "status": "not_loaded"}),
+            "cached": chatbot_id in self.entries,
+            "reloading": chatbot_id in self._inflight,
+        }
+
+    def invalidate(self, chatbot_id: str):
+        self.entries.pop(self.key(chatbot_id), None)
@@ -80,3 +80,21 @@ CREATE TABLE Administrador (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+
+-- Vista: todas as FAQs de cada chatbot com a categoria e as keywords, numa só consulta
+-- Usada pelo carregamento em bloco das APIs (FAQ_SOURCE=bulk). O LEFT JOIN mantém as
+-- categorias sem FAQs (p.ex. as de feedback negativo, que só têm keywords).
+CREATE OR REPLACE VIEW Chatbot_FAQ_Bulk AS
+SELECT
+    cc.chatbot_id,
+    c.categoria_id,
+    c.nome AS categoria_nome,
+    c.keywords,
+    f.faq_id,
+    f.pergunta,
+    f.resposta,
+    f.idioma
+FROM Chatbot_Categoria cc
+JOIN Categoria c ON c.categoria_id = cc.categoria_id
+LEFT JOIN Faq_Categoria fc ON fc.categoria_id = c.categoria_id
+LEFT JOIN FAQ f ON f.faq_id = fc.faq_id;
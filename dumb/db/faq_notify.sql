@@ -0,0 +1,39 @@
+-- Notificações de alterações às FAQs para as APIs (canal faq_changes)
+-- As APIs com FAQ_NOTIFY_DSN definido fazem LISTEN neste canal e atualizam
+-- as caches no lugar, em vez de reconstruírem o chatbot inteiro.
+
+CREATE OR REPLACE FUNCTION notify_faq_change() RETURNS trigger AS $$
+DECLARE
+    row_data JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+
+    PERFORM pg_notify('faq_changes', json_build_object(
+        'table', lower(TG_TABLE_NAME),
+        'op', TG_OP,
+        'faq_id', row_data ->> 'faq_id',
+        'categoria_id', row_data ->> 'categoria_id',
+        'old_categoria_id', CASE WHEN TG_OP = 'UPDATE' THEN to_jsonb(OLD) ->> 'categoria_id' END
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS faq_notify ON FAQ;
+CREATE TRIGGER faq_notify
+    AFTER INSERT OR UPDATE OR DELETE ON FAQ
+    FOR EACH ROW EXECUTE FUNCTION notify_faq_change();
+
+DROP TRIGGER IF EXISTS faq_categoria_notify ON Faq_Categoria;
+CREATE TRIGGER faq_categoria_notify
+    AFTER INSERT OR UPDATE OR DELETE ON Faq_Categoria
+    FOR EACH ROW EXECUTE FUNCTION notify_faq_change();
+
+DROP TRIGGER IF EXISTS categoria_notify ON Categoria;
+CREATE TRIGGER categoria_notify
+    AFTER INSERT OR UPDATE OR DELETE ON Categoria
+    FOR EACH ROW EXECUTE FUNCTION notify_faq_change();
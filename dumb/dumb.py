@@ -1,10 +1,11 @@
 import os
 import unicodedata
-from langdetect import detect
-from difflib import SequenceMatcher
 import random
 import faiss
 from sentence_transformers import SentenceTransformer
+from keyword_matcher import KeywordMatcher
+from language_id import identify_language
+from lexical_ranker import LexicalRanker
 
 
 def normalize_text(text):
@@ -14,9 +15,6 @@ def normalize_text(text):
         if unicodedata.category(c) != 'Mn'
     )
 
-def similarity(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
 def load_qa_from_file(path):
     questions = []
     answers = []
@@ -31,36 +29,16 @@ def load_qa_from_file(path):
     return questions, answers
 
 
-def detect_category(user_input, category_keywords):
-    normalized_input = normalize_text(user_input)
-    for cat, keywords in category_keywords.items():
-        for word in keywords:
-            if word in normalized_input:
-                return cat
-    return None
-
-def detect_categories(user_input, category_keywords):
-    normalized_input = normalize_text(user_input)
-    detected = []
-    for cat, keywords in category_keywords.items():
-        for word in keywords:
-            if word in normalized_input:
-                detected.append(cat)
-                break  # Evita repetição se já detectou a categoria
-    return detected
-
-def find_answers_ranked(user_input, questions, answers):
-    user_norm = normalize_text(user_input)
-    scored = []
-
-    for q, a in zip(questions, answers):
-        q_norm = normalize_text(q)
-        score = similarity(q_norm, user_norm)
-        if score > 0.3:
-            scored.append((score, a))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [a for _, a in scored]
+def detect_category(user_input, category_matcher):
+    return category_matcher.first(normalize_text(user_input))
+
+def detect_categories(user_input, category_matcher):
+    # Cada categoria aparece uma só vez, pela ordem do ficheiro de categorias
+    return category_matcher.find(normalize_text(user_input))
+
+def find_answers_ranked(user_input, question_ranker, answers):
+    # Todas as perguntas da categoria de uma vez, já normalizadas ao carregar
+    return [answers[pos] for pos in question_ranker.rank(normalize_text(user_input), 0.3)]
 
 def load_negative_feedback(path):
     if not os.path.exists(path):
@@ -68,14 +46,9 @@ def load_negative_feedback(path):
     with open(path, "r", encoding="utf-8") as f:
         return set(normalize_text(line.strip()) for line in f if line.strip())
 
-def is_negative_feedback(user_input, neg_phrases):
-    user_norm = normalize_text(user_input)
-    for phrase in neg_phrases:
-        if phrase in user_norm:
-            # Garante que a frase esteja isolada ou no início/fim, evita falsos positivos
-            if f" {phrase} " in f" {user_norm} " or user_norm.startswith(phrase) or user_norm.endswith(phrase):
-                return True
-    return False
+def is_negative_feedback(user_input, feedback_matcher):
+    # Só frases isoladas (whole_words), evita falsos positivos
+    return feedback_matcher.any(normalize_text(user_input))
 
 def print_welcome(language, bot_name):
     if language == "pt":
@@ -173,11 +146,7 @@ if __name__ == "__main__":
             print("Bot: Até à próxima!")
             break
 
-        try:
-            lang = detect(user_input)
-            lang = "pt" if lang == "pt" else "en"
-        except:
-            lang = "pt"
+        lang = "en" if identify_language(user_input)[0] == "en" else "pt"
 
         if lang != current_language:
             current_language = lang
@@ -185,17 +154,21 @@ if __name__ == "__main__":
                 category_keywords, cat_to_questions, cat_to_answers, cat_to_index = load_qas_and_categories(bot_path, lang)
                 neg_path = os.path.join(bot_path, f"negative_feedback_{lang}.txt")
                 neg_feedback = load_negative_feedback(neg_path)
-                data_cache[lang] = (category_keywords, cat_to_questions, cat_to_answers, cat_to_index, neg_feedback)
-            category_keywords, cat_to_questions, cat_to_answers, cat_to_index, neg_feedback = data_cache[lang]
+                # Keywords e frases de feedback compiladas uma vez por idioma
+                category_matcher = KeywordMatcher(category_keywords)
+                feedback_matcher = KeywordMatcher({"feedback": neg_feedback}, whole_words=True)
+                cat_to_ranker = {cat: LexicalRanker([normalize_text(q) for q in qs]) for cat, qs in cat_to_questions.items()}
+                data_cache[lang] = (category_keywords, category_matcher, cat_to_questions, cat_to_answers, cat_to_index, feedback_matcher, cat_to_ranker)
+            category_keywords, category_matcher, cat_to_questions, cat_to_answers, cat_to_index, feedback_matcher, cat_to_ranker = data_cache[lang]
             print_welcome(lang, selected_bot)
 
-        if is_negative_feedback(user_input, neg_feedback):
+        if is_negative_feedback(user_input, feedback_matcher):
             negative_feedback_count += 1
             if last_possible_answers and last_answer_index + 1 < len(last_possible_answers):
                 last_answer_index += 1
                 print(f"Bot: {last_possible_answers[last_answer_index]}")
             elif negative_feedback_count >= 2 and last_question:
-                current_categories = detect_categories(last_question, category_keywords)
+                current_categories = detect_categories(last_question, category_matcher)
                 found_answer = False
                 for cat in current_categories:
                     if cat in cat_to_index:
@@ -214,7 +187,7 @@ if __name__ == "__main__":
 
         negative_feedback_count = 0
         last_question = user_input
-        current_categories = detect_categories(user_input, category_keywords)
+        current_categories = detect_categories(user_input, category_matcher)
 
         if not current_categories:
             available_cats = ", ".join(category_keywords.keys())
@@ -228,8 +201,8 @@ if __name__ == "__main__":
 
         possible_answers = []
         for cat in current_categories:
-            if cat in cat_to_questions:
-                ranked_answers = find_answers_ranked(user_input, cat_to_questions[cat], cat_to_answers[cat])
+            if cat in cat_to_ranker:
+                ranked_answers = find_answers_ranked(user_input, cat_to_ranker[cat], cat_to_answers[cat])
                 possible_answers.extend(ranked_answers)
 
         if not possible_answers:
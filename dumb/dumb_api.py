@@ -1,15 +1,31 @@
 import os
 import unicodedata
-from langdetect import detect
-from difflib import SequenceMatcher
 import faiss
-from sentence_transformers import SentenceTransformer
+from onnx_encoder import load_encoder
 from fastapi import FastAPI
 from pydantic import BaseModel
 from starlette.middleware.cors import CORSMiddleware
+from inference import InferenceExecutor
+from session_store import create_session_store, pack_ref, unpack_ref
+from keyword_matcher import KeywordMatcher
+from language_id import identify_language
+from lexical_ranker import LexicalRanker
+from contextlib import asynccontextmanager
 
 # ---------------- Configuração ------------------
-app = FastAPI()
+LANGUAGES = ("pt", "en")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Os dois idiomas e o modelo ficam prontos antes do primeiro pedido
+    for lang in LANGUAGES:
+        load_language(lang)
+    await inference.encode_query("aquecimento do modelo", normalize=False)
+    yield
+    inference.shutdown()
+    await conversation_states.close()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -21,19 +37,19 @@ app.add_middleware(
 bots_folder = "bots"
 selected_bot = "dumb_faq"
 bot_path = os.path.join(bots_folder, selected_bot)
-model = SentenceTransformer("all-MiniLM-L6-v2")
+model = load_encoder("all-MiniLM-L6-v2")  # ENCODER_BACKEND=torch|onnx
+inference = InferenceExecutor(model)  # o modelo nunca corre no event loop
+
+INDEX_IO_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
 
 data_cache = {}  # Cache por idioma
-conversation_states = {}  # Estado separado por sessão/usuário
+conversation_states = create_session_store()  # Estado por sessão (SESSION_BACKEND)
 
 # ---------------- Utilidades ------------------
 
 def normalize_text(text):
     return ''.join(c for c in unicodedata.normalize('NFD', text.lower()) if unicodedata.category(c) != 'Mn')
 
-def similarity(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
 def load_qa_from_file(path):
     questions, answers = [], []
     with open(path, "r", encoding="utf-8") as f:
@@ -44,19 +60,12 @@ def load_qa_from_file(path):
                 answers.append(parts[1])
     return questions, answers
 
-def detect_categories(user_input, category_keywords):
-    norm_input = normalize_text(user_input)
-    return [cat for cat, keywords in category_keywords.items() if any(word in norm_input for word in keywords)]
+def detect_categories(user_input, category_matcher):
+    return category_matcher.find(normalize_text(user_input))
 
-def find_answers_ranked(user_input, questions, answers):
-    user_norm = normalize_text(user_input)
-    scored = []
-    for q, a in zip(questions, answers):
-        sim = similarity(normalize_text(q), user_norm)
-        if sim > 0.3:
-            scored.append((sim, a))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [a for _, a in scored]
+def find_answers_ranked(user_input, question_ranker):
+    # Devolve posições (não texto) para a sessão guardar só referências
+    return question_ranker.rank(normalize_text(user_input), 0.3)
 
 def load_negative_feedback(path):
     if not os.path.exists(path):
@@ -64,13 +73,9 @@ def load_negative_feedback(path):
     with open(path, "r", encoding="utf-8") as f:
         return set(normalize_text(line.strip()) for line in f if line.strip())
 
-def is_negative_feedback(user_input, neg_phrases):
-    user_norm = normalize_text(user_input)
-    for phrase in neg_phrases:
-        if (phrase in user_norm) and (
-            user_norm.startswith(phrase) or user_norm.endswith(phrase) or f" {phrase} " in f" {user_norm} "):
-            return True
-    return False
+def is_negative_feedback(user_input, feedback_matcher):
+    # Só frases isoladas (whole_words), para evitar falsos positivos
+    return feedback_matcher.any(normalize_text(user_input))
 
 def load_qas_and_categories(bot_folder, language):
     suffix = f"_{language}"
@@ -93,33 +98,58 @@ def load_qas_and_categories(bot_folder, language):
             cat_to_answers[cat] = answers
             index_path = os.path.join(bot_folder, f"{cat}_qa{suffix}.index")
             if os.path.exists(index_path):
-                cat_to_index[cat] = faiss.read_index(index_path)
+                # Só leitura e mapeado: os workers partilham as páginas do ficheiro
+                cat_to_index[cat] = faiss.read_index(index_path, INDEX_IO_FLAGS)
 
     return category_keywords, cat_to_questions, cat_to_answers, cat_to_index
 
 
-def search_faiss_answer(user_input, index, answers, top_k=3, max_distance=10.0):
-    emb = model.encode([user_input]).astype('float32')
+async def search_faiss_answer(user_input, index, answers, top_k=3, max_distance=10.0):
+    # Os índices dos bots foram gerados sem normalização
+    emb = await inference.encode_query(user_input, normalize=False)
     distances, indices = index.search(emb, top_k)
 
     results = []
     for dist, idx in zip(distances[0], indices[0]):
-        if idx < len(answers):
-            results.append((dist, answers[idx]))
+        if 0 <= idx < len(answers):
+            results.append((dist, int(idx)))
 
     results.sort(key=lambda x: x[0])
 
-    filtered = [a for dist, a in results if dist <= max_distance]
+    filtered = [pos for dist, pos in results if dist <= max_distance]
 
     return filtered
 
 
+def load_language(lang):
+    if lang not in data_cache:
+        ck, cq, ca, ci = load_qas_and_categories(bot_path, lang)
+        neg_feedback = load_negative_feedback(os.path.join(bot_path, f"negative_feedback_{lang}.txt"))
+        # Número de cada categoria nas referências guardadas na sessão
+        cat_order = sorted(ca)
+        # Keywords, frases de feedback e perguntas (normalizadas) indexadas uma vez por idioma
+        rankers = {cat: LexicalRanker([normalize_text(q) for q in qs]) for cat, qs in cq.items()}
+        data_cache[lang] = (KeywordMatcher(ck), rankers, ca, ci, KeywordMatcher({"feedback": neg_feedback}, whole_words=True), cat_order)
+    return data_cache[lang]
+
+
+def resolve_answer(lang, ref):
+    # A sessão guarda (número da categoria, posição); a cache do idioma é só de leitura
+    _, _, cat_to_answers, _, _, cat_order = data_cache[lang]
+    group, pos = unpack_ref(ref)
+    return cat_to_answers[cat_order[group]][pos]
+
+
 # ---------------- API ------------------
 
 class MessageRequest(BaseModel):
     message: str
     session_id: str  # Estado por sessão
 
+@app.get("/sessions/stats")
+async def sessions_stats():
+    return conversation_states.memory_usage()
+
 @app.post("/chat_dumb")
 async def chat(req: MessageRequest):
     user_input = req.message.strip()
@@ -128,55 +158,42 @@ async def chat(req: MessageRequest):
     if not user_input:
         return {"response": "Por favor, escreva algo."}
 
-    try:
-        lang = detect(user_input) if len(user_input) >= 10 else "pt"
-        lang = "pt" if lang == "pt" else "en"
-    except:
-        lang = "pt"
-
-    if lang not in data_cache:
-        ck, cq, ca, ci = load_qas_and_categories(bot_path, lang)
-        neg_feedback = load_negative_feedback(os.path.join(bot_path, f"negative_feedback_{lang}.txt"))
-        data_cache[lang] = (ck, cq, ca, ci, neg_feedback)
+    lang = "en" if len(user_input) >= 10 and identify_language(user_input)[0] == "en" else "pt"
 
-    category_keywords, cat_to_questions, cat_to_answers, cat_to_index, neg_feedback = data_cache[lang]
+    load_language(lang)
 
-    if session_id not in conversation_states:
-        conversation_states[session_id] = {
-            "language": lang,
-            "last_possible_answers": [],
-            "last_answer_index": 0,
-            "last_question": "",
-            "negative_feedback_count": 0
-        }
-
-    state = conversation_states[session_id]
-
-    if is_negative_feedback(user_input, neg_feedback):
-        state["negative_feedback_count"] += 1
-        if state["last_possible_answers"] and state["last_answer_index"] + 1 < len(state["last_possible_answers"]):
-            state["last_answer_index"] += 1
-            return {"response": state["last_possible_answers"][state["last_answer_index"]]}
-
-        if state["negative_feedback_count"] >= 2 and state["last_question"]:
-            current_categories = detect_categories(state["last_question"], category_keywords)
+    state = await conversation_states.load(session_id, lang)
+    try:
+        return await respond(user_input, lang, state)
+    finally:
+        # Com um backend partilhado o próximo pedido da sessão pode ir para outro worker
+        await conversation_states.save(session_id, state)
+
+async def respond(user_input, lang, state):
+    category_matcher, cat_to_ranker, cat_to_answers, cat_to_index, feedback_matcher, cat_order = data_cache[lang]
+
+    if is_negative_feedback(user_input, feedback_matcher):
+        state.negative_feedback_count += 1
+        ref = state.next_ref()
+        if ref is not None:
+            return {"response": resolve_answer(state.language, ref)}
+
+        if state.negative_feedback_count >= 2 and state.last_question:
+            current_categories = detect_categories(state.last_question, category_matcher)
             for cat in current_categories:
                 if cat in cat_to_index:
-                    faiss_results = search_faiss_answer(state["last_question"], cat_to_index[cat], cat_to_answers[cat])
+                    faiss_results = await search_faiss_answer(state.last_question, cat_to_index[cat], cat_to_answers[cat])
                     if faiss_results:
-                        return {"response": faiss_results[0]}
+                        return {"response": cat_to_answers[cat][faiss_results[0]]}
             return {"response": "Não tenho mais respostas possíveis." if lang == "pt" else "No more possible answers."}
 
         return {"response": "Não tenho mais respostas possíveis." if lang == "pt" else "No more possible answers."}
 
-    state.update({
-        "last_question": user_input,
-        "negative_feedback_count": 0,
-        "last_possible_answers": [],
-        "last_answer_index": 0
-    })
+    state.last_question = user_input
+    state.negative_feedback_count = 0
+    state.clear_answers()
 
-    categories = detect_categories(user_input, category_keywords)
+    categories = detect_categories(user_input, category_matcher)
 
     if not categories:
         msg = "Não consegui identificar uma categoria para sua pergunta. Tente reformular." if lang == "pt" else "Couldn't identify a category for your question. Please rephrase."
@@ -184,27 +201,29 @@ async def chat(req: MessageRequest):
 
     possible_answers = []
     for cat in categories:
-        if cat in cat_to_questions:
-            ranked = find_answers_ranked(user_input, cat_to_questions[cat], cat_to_answers[cat])
-            possible_answers.extend(ranked)
+        if cat in cat_to_ranker:
+            ranked = find_answers_ranked(user_input, cat_to_ranker[cat])
+            possible_answers.extend((cat, pos) for pos in ranked)
         if cat in cat_to_index:
-            faiss_results = search_faiss_answer(user_input, cat_to_index[cat], cat_to_answers[cat], top_k=3,
+            faiss_results = await search_faiss_answer(user_input, cat_to_index[cat], cat_to_answers[cat], top_k=3,
                                                 max_distance=10.0)
-            possible_answers.extend(faiss_results)
+            possible_answers.extend((cat, pos) for pos in faiss_results)
 
     # Remover duplicados mantendo ordem
     unique_answers = []
+    answer_refs = []
     seen = set()
-    for ans in possible_answers:
+    for cat, pos in possible_answers:
+        ans = cat_to_answers[cat][pos]
         if ans not in seen:
             seen.add(ans)
             unique_answers.append(ans)
+            answer_refs.append(pack_ref(cat_order.index(cat), pos))
 
     if not unique_answers:
         msg = "Lamento, não encontrei resposta adequada." if lang == "pt" else "Sorry, I couldn't find a suitable answer."
         return {"response": msg}
 
-    state["last_possible_answers"] = unique_answers
-    state["last_answer_index"] = 0
+    state.set_answers(answer_refs, lang)
 
     return {"response": unique_answers[0]}
@@ -1,15 +1,25 @@
-from fastapi import FastAPI
-import httpx
+from fastapi import FastAPI, HTTPException
+from typing import List, Union
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
+from onnx_encoder import load_encoder
 import numpy as np
-import unicodedata
 import sys
 import logging
 import asyncio
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.concurrency import run_in_threadpool
-import re
+from http_client import start_http_client, close_http_client
+from faq_source import fetch_categories, fetch_category_faqs, fetch_chatbot, load_chatbot_faqs, close_data_source
+from chatbot_cache import ChatbotCache
+from faq_events import FaqChange, FaqChangeFeed, diff_rows
+from embedding_store import shared_embeddings
+from cache_snapshot import SnapshotStore
+from inference import InferenceExecutor
+from prewarm import Prewarmer
+from keyword_matcher import KeywordMatcher
+from message_analysis import AnalyzedMessage, analyze_message, normalize_text
+from language_id import get_model as get_language_model
+from session_store import create_session_store, faq_ref_id, find_faq, pack_ref, unpack_ref
 
 # ========== Logging ==========
 logging.basicConfig(
@@ -21,7 +31,20 @@ logging.basicConfig(
 logger = logging.getLogger("chatbot_api")
 
 # ========== FastAPI App ==========
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_http_client()
+    faq_changes.start_listener()
+    prewarm.start()
+    yield
+    await prewarm.stop()
+    await faq_changes.stop_listener()
+    inference.shutdown()
+    await conversation_states.close()
+    await close_data_source()
+    await close_http_client()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -31,148 +54,384 @@ app.add_middleware(
 )
 
 # ========== Modelo ==========
-model = SentenceTransformer("all-MiniLM-L6-v2")
+model = load_encoder("all-MiniLM-L6-v2")  # ENCODER_BACKEND=torch|onnx
+# O modelo só corre na thread do executor, com as perguntas concorrentes em lote
+inference = InferenceExecutor(model)
 
 # ========== Dados ==========
-data_cache = {}
-conversation_states = {}
+# data_cache (por chatbot) é criado na secção Cache, junto do builder
+conversation_states = create_session_store()
 
 # ========== Utils ==========
-def normalize_text(text):
-    text = unicodedata.normalize('NFD', text.lower())
-    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
-    return re.sub(r'[^\w\s]', '', text).strip()
+def detect_categories(message, keyword_matcher):
+    # Uma passagem pelo texto já normalizado: categorias e feedback negativo de uma vez
+    return keyword_matcher.find(message.normalized)
 
-def detect_language(text: str) -> str:
-    try:
-        from langdetect import detect
-        norm = normalize_text(text)
-
-        greetings_en = {"hi", "hello", "hey", "good morning", "good afternoon", "good evening", "howdy", "greetings", "what's up", "yo", "sup"}
-        greetings_pt = {"oi", "olá", "ola", "bom dia", "boa tarde", "boa noite", "alô", "alo", "e aí", "fala", "boas"}
-
-        if norm in greetings_en:
-            return "en"
-        if norm in greetings_pt:
-            return "pt"
-
-        if len(text) < 10:
-            return "pt"
-
-        detected = detect(text)
-        return "en" if detected == "en" else "pt"
-    except:
-        return "pt"
-
-def is_greeting(text: str) -> bool:
-    greetings_pt = {"ola", "olá", "bom dia", "boa tarde", "boa noite", "oi", "alô", "alo", "hey", "boas", "e aí", "fala", "opa", "tudo bem", "beleza"}
-    greetings_en = {"hello", "hi", "good morning", "good afternoon", "good evening", "hey", "howdy", "greetings", "what's up", "yo", "sup", "hiya"}
-    norm_text = normalize_text(text.strip())
-    lang = detect_language(text)
-    greetings = greetings_en if lang == "en" else greetings_pt
-    if norm_text in greetings:
-        return True
-    if len(norm_text.split()) > 3:
-        return False
-    for greet in greetings:
-        if norm_text.startswith(greet):
-            return True
-    return False
-
-def detect_categories(user_input, category_keywords):
-    norm_input = normalize_text(user_input)
-    return [cat_id for cat_id, keywords in category_keywords.items() if any(word in norm_input for word in keywords)]
-
-def is_negative_feedback(user_input, lang, category_keywords, feedback_ids):
+def is_negative_feedback(categorias, lang, feedback_ids):
     feedback_id = feedback_ids.get(lang)
     if not feedback_id:
         return False
-    keywords = category_keywords.get(feedback_id, [])
-    return any(k in normalize_text(user_input) for k in keywords)
-
-async def find_answers_ruled_based(input_text, questions_by_cat, answers_by_cat, embeddings_by_cat, lang, detected_cats, top_k=5):
-    input_embedding = await run_in_threadpool(lambda: model.encode([input_text], convert_to_numpy=True))
-    input_embedding /= np.linalg.norm(input_embedding)
+    return feedback_id in categorias
+
+async def find_answers_ruled_based(input_text, cache, lang, detected_cats, top_k=5):
+    matrix = cache["matrix_by_language"].get(lang)
+    spans = [matrix["ranges"][cat_id] for cat_id in detected_cats if matrix and cat_id in matrix["ranges"]]
+    if not spans:
+        return [], [], 0.0
+
+    input_embedding = await inference.encode_query(input_text)
+    # Um só produto matriz-vetor sobre todas as perguntas do idioma
+    similarities = matrix["embeddings"] @ input_embedding[0]
+
+    if len(spans) == 1:
+        # Categoria única: a fatia é uma vista, sem cópias
+        offset, end = spans[0]
+        scores = similarities[offset:end]
+    else:
+        offset = 0
+        mask = np.zeros(len(similarities), dtype=bool)
+        for start, end in spans:
+            mask[start:end] = True
+        scores = np.where(mask, similarities, -np.inf)
+
+    k = min(top_k, sum(end - start for start, end in spans))
+    top_k_idx = np.argpartition(-scores, k - 1)[:k]
+    top_k_idx = top_k_idx[np.argsort(-scores[top_k_idx])] + offset
+    best_similarity = similarities[top_k_idx[0]]
 
-    all_questions, all_answers, all_embeddings = [], [], []
-    for cat_id in detected_cats:
+    unique_answers, answer_refs = [], []
+    for row in top_k_idx:
+        cat_id = int(matrix["row_category"][row])
+        pos = int(row) - matrix["ranges"][cat_id][0]
         key = (cat_id, lang)
-        all_questions.extend(questions_by_cat.get(key, []))
-        all_answers.extend(answers_by_cat.get(key, []))
-        emb = embeddings_by_cat.get(key)
-        if emb is not None:
-            all_embeddings.append(emb)
+        unique_answers.append(cache["answers_by_category"][key][pos])
+        # Id e não posição: as posições mudam com atualizações e reloads, e entre workers
+        answer_refs.append(pack_ref(cat_id, faq_ref_id(cache["faq_ids_by_category"][key][pos], cache["questions_by_category"][key][pos])))
 
-    if not all_embeddings:
-        return [], 0.0
+    return unique_answers, answer_refs, best_similarity
 
-    embeddings = np.vstack(all_embeddings)
-    similarities = np.dot(embeddings, input_embedding.T).flatten()
-    if not len(similarities):
-        return [], 0.0
-
-    top_k_idx = np.argsort(-similarities)[:top_k]
-    best_similarity = similarities[top_k_idx[0]]
-    unique_answers = [all_answers[i] for i in top_k_idx]
-
-    return unique_answers, best_similarity
+def resolve_answer(cache, lang, ref):
+    """Texto da resposta guardada na sessão como referência (categoria, id da FAQ)."""
+    cat_id, ref_id = unpack_ref(ref)
+    key = (cat_id, lang)
+    pos = find_faq(cache["faq_ids_by_category"].get(key, []), cache["questions_by_category"].get(key, []), ref_id)
+    return cache["answers_by_category"][key][pos] if pos is not None else None
 
 # ========== Fetchers ==========
-async def fetch_categories(chatbot_id: str):
-    url = f"http://localhost:3004/chatbot-categoria/{int(chatbot_id)}"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        response.raise_for_status()
-        return response.json()
-
-async def fetch_faq_data(chatbot_id: int):
-    categories = await fetch_categories(str(chatbot_id))
-
-    async def fetch_cat(cat_id):
-        url = f"http://localhost:3004/faq-categoria/?categoria_id={cat_id}"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
-            return resp.json()
-
-    tasks = [fetch_cat(cat["categoria_id"]) for cat in categories]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    faqs = []
-    for r in results:
-        if isinstance(r, list):
-            faqs.extend(r)
-    return faqs
-
-async def fetch_no_response_message(chatbot_id: int, lang: str):
-    url = f"http://localhost:3004/chatbots/{chatbot_id}"
+async def fetch_chatbot_or_none(chatbot_id: int):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            chatbot_data = response.json()
-            return chatbot_data.get(
-                "mensagem_no_response_pt" if lang == "pt" else "mensagem_no_response_en",
-                "Desculpe, não tenho uma resposta para isso." if lang == "pt" else "Sorry, I don't have an answer for that."
-            )
+        return await fetch_chatbot(chatbot_id)
     except Exception as e:
-        logger.error(f"Erro ao buscar mensagem padrão: {e}")
+        logger.error(f"Erro ao buscar dados do chatbot {chatbot_id}: {e}")
+        return None
+
+async def load_chatbot_metadata(chatbot_id: int, cache: dict):
+    """Metadados do chatbot (mensagens, estado, idioma) guardados no data_cache.
+
+    Normalmente já vêm com a construção da cache; só voltam a ser pedidos ao
+    backend se essa busca tiver falhado.
+    """
+    if cache.get("chatbot") is None:
+        cache["chatbot"] = await fetch_chatbot_or_none(chatbot_id)
+    return cache["chatbot"]
+
+async def fetch_no_response_message(chatbot_id: int, lang: str, cache: dict):
+    chatbot_data = await load_chatbot_metadata(chatbot_id, cache)
+    if chatbot_data is None:
         return "Desculpe, não consegui processar sua solicitação no momento."
+    return chatbot_data.get(
+        "mensagem_no_response_pt" if lang == "pt" else "mensagem_no_response_en",
+        "Desculpe, não tenho uma resposta para isso." if lang == "pt" else "Sorry, I don't have an answer for that."
+    )
 
-async def fetch_greeting_message(chatbot_id: int, lang: str):
-    url = f"http://localhost:3004/chatbots/{chatbot_id}"
+async def fetch_greeting_message(chatbot_id: int, lang: str, cache: dict):
+    chatbot_data = await load_chatbot_metadata(chatbot_id, cache)
+    if chatbot_data is None:
+        return "Olá! Como posso ajudar?" if lang == "pt" else "Hello! How can I help you?"
+    return chatbot_data.get(
+        "mensagem_inicial_pt" if lang == "pt" else "mensagem_inicial_en",
+        "Olá! Como posso ajudar?" if lang == "pt" else "Hello! How can I help you?"
+    )
+
+# ========== Cache ==========
+def parse_categories(categories):
+    category_keywords, feedback_ids = {}, {"pt": None, "en": None}
+    for cat in categories:
+        cat_id = cat["categoria_id"]
+        raw_keywords = cat.get("categoria", {}).get("keywords", [])
+        category_keywords[cat_id] = [normalize_text(k) for k in raw_keywords]
+        if cat_id == 999: feedback_ids["pt"] = cat_id
+        if cat_id == 998: feedback_ids["en"] = cat_id
+    return category_keywords, feedback_ids
+
+def parse_faq_item(item):
+    """((categoria, idioma), faq_id, pergunta, resposta) de um item de /faq-categoria, ou None."""
+    faq = item.get("faq", {})
+    pergunta = faq.get("pergunta", "").strip()
+    resposta = faq.get("resposta", "").strip()
+    if not (pergunta and resposta):
+        return None
+    idioma = "pt" if normalize_text(faq.get("idioma", "pt").lower()) in ["pt", "portugues", "português"] else "en"
+    return (item["categoria_id"], idioma), item.get("faq_id") or faq.get("faq_id"), pergunta, resposta
+
+async def encode_questions(questions):
+    return await inference.encode_many(questions)
+
+def layout_language_matrix(cache: dict, lang: str, embeddings=None):
+    """Uma matriz contígua por idioma, com as categorias em intervalos de linhas.
+
+    `embeddings` já vem pela ordem das categorias em questions_by_category;
+    sem ele junta os blocos atuais. Os blocos por categoria passam a ser vistas
+    sobre a matriz, por isso não há memória duplicada.
+    """
+    keys = [key for key in cache["questions_by_category"] if key[1] == lang]
+    if not keys:
+        cache["matrix_by_language"].pop(lang, None)
+        return
+    if embeddings is None:
+        embeddings = np.vstack([cache["question_embeddings_by_category"][key] for key in keys])
+
+    ranges, sizes, start = {}, [], 0
+    for key in keys:
+        end = start + len(cache["questions_by_category"][key])
+        ranges[key[0]] = (start, end)
+        sizes.append(end - start)
+        cache["question_embeddings_by_category"][key] = embeddings[start:end]
+        start = end
+
+    cache["matrix_by_language"][lang] = {
+        "embeddings": embeddings,
+        "ranges": ranges,
+        "row_category": np.repeat(np.array([key[0] for key in keys], dtype=np.int64), sizes),
+    }
+
+async def fetch_chatbot_sources(chatbot_id: str):
+    """Respostas do backend a partir das quais a cache é construída (e o seu hash calculado)."""
+    # Categorias e FAQs numa só passagem (FAQ_SOURCE): sem repetir /chatbot-categoria
+    (categories, faqs), chatbot_data = await asyncio.gather(
+        load_chatbot_faqs(chatbot_id),
+        fetch_chatbot_or_none(int(chatbot_id)),
+    )
+    return categories, faqs, chatbot_data
+
+async def build_cache_from_sources(chatbot_id: str, categories, faqs, chatbot_data) -> dict:
+    category_keywords, feedback_ids = parse_categories(categories)
+    faq_ids_by_cat, questions_by_cat, answers_by_cat = {}, {}, {}
+    question_embeddings_by_cat = {}
+
+    for item in faqs:
+        parsed = parse_faq_item(item)
+        if parsed:
+            key, faq_id, pergunta, resposta = parsed
+            faq_ids_by_cat.setdefault(key, []).append(faq_id)
+            questions_by_cat.setdefault(key, []).append(pergunta)
+            answers_by_cat.setdefault(key, []).append(resposta)
+
+    cache = {
+        "chatbot": chatbot_data,
+        "category_keywords": category_keywords,
+        "keyword_matcher": KeywordMatcher(category_keywords),
+        "feedback_negativo_ids": feedback_ids,
+        "faq_ids_by_category": faq_ids_by_cat,
+        "questions_by_category": questions_by_cat,
+        "answers_by_category": answers_by_cat,
+        "question_embeddings_by_category": question_embeddings_by_cat,
+        "matrix_by_language": {}
+    }
+
+    for lang in sorted({key[1] for key in questions_by_cat}):
+        questions = [q for key, qs in questions_by_cat.items() if key[1] == lang for q in qs]
+        # Com EMBEDDINGS_DIR a matriz é um mmap partilhado pelos workers
+        layout_language_matrix(cache, lang, await shared_embeddings(questions, encode_questions, f"{chatbot_id}-{lang}"))
+
+    return cache
+
+def dump_chatbot_cache(cache: dict):
+    """(meta, matrizes) para o snapshot; as chaves com tuplos/inteiros vão como listas."""
+    meta = {
+        "chatbot": cache["chatbot"],
+        "category_keywords": list(cache["category_keywords"].items()),
+        "feedback_negativo_ids": cache["feedback_negativo_ids"],
+        "blocks": [
+            [cat_id, lang, cache["faq_ids_by_category"][(cat_id, lang)], questions, cache["answers_by_category"][(cat_id, lang)]]
+            for (cat_id, lang), questions in cache["questions_by_category"].items()
+        ],
+    }
+    arrays = {f"matrix_{lang}": m["embeddings"] for lang, m in cache["matrix_by_language"].items()}
+    return meta, arrays
+
+def restore_chatbot_cache(snapshot) -> dict:
+    meta = snapshot.meta
+    category_keywords = {cat_id: keywords for cat_id, keywords in meta["category_keywords"]}
+    cache = {
+        "chatbot": meta["chatbot"],
+        "category_keywords": category_keywords,
+        "keyword_matcher": KeywordMatcher(category_keywords),
+        "feedback_negativo_ids": meta["feedback_negativo_ids"],
+        "faq_ids_by_category": {},
+        "questions_by_category": {},
+        "answers_by_category": {},
+        "question_embeddings_by_category": {},
+        "matrix_by_language": {},
+        "content_hash": snapshot.content_hash,
+    }
+    for cat_id, lang, faq_ids, questions, answers in meta["blocks"]:
+        cache["faq_ids_by_category"][(cat_id, lang)] = faq_ids
+        cache["questions_by_category"][(cat_id, lang)] = questions
+        cache["answers_by_category"][(cat_id, lang)] = answers
+    for lang in {key[1] for key in cache["questions_by_category"]}:
+        # A matriz fica mapeada do snapshot: as categorias são vistas sobre o ficheiro
+        layout_language_matrix(cache, lang, snapshot.arrays[f"matrix_{lang}"])
+    return cache
+
+async def build_chatbot_cache(chatbot_id: str) -> dict:
+    if chatbot_id not in chatbot_caches:
+        # Primeiro carregamento desde o arranque: serve o último snapshot já e valida-o depois
+        snapshot = await asyncio.to_thread(snapshots.load, chatbot_id)
+        if snapshot is not None:
+            snapshots.schedule_revalidation(chatbot_caches, chatbot_id, snapshot.content_hash, fetch_chatbot_sources)
+            return restore_chatbot_cache(snapshot)
+
+    sources = await fetch_chatbot_sources(chatbot_id)
+    digest = snapshots.content_hash(*sources)
+    snapshot = await asyncio.to_thread(snapshots.load, chatbot_id, digest)
+    if snapshot is not None:
+        return restore_chatbot_cache(snapshot)
+
+    cache = await build_cache_from_sources(chatbot_id, *sources)
+    cache["content_hash"] = digest
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            chatbot_data = response.json()
-            return chatbot_data.get(
-                "mensagem_inicial_pt" if lang == "pt" else "mensagem_inicial_en",
-                "Olá! Como posso ajudar?" if lang == "pt" else "Hello! How can I help you?"
-            )
+        await asyncio.to_thread(snapshots.save, chatbot_id, digest, *dump_chatbot_cache(cache))
     except Exception as e:
-        logger.error(f"Erro ao buscar mensagem de saudação: {e}")
-        return "Olá! Como posso ajudar?" if lang == "pt" else "Hello! How can I help you?"
+        logger.error(f"Chatbot {chatbot_id}: erro ao gravar o snapshot: {e}")
+    return cache
+
+def describe_chatbot_cache(cache: dict) -> dict:
+    return {
+        "categories": len(cache["category_keywords"]),
+        "faqs": sum(len(q) for q in cache["questions_by_category"].values()),
+        "embedding_blocks": len(cache["question_embeddings_by_category"]),
+        "matrix_rows": {lang: len(m["embeddings"]) for lang, m in cache["matrix_by_language"].items()},
+        "content_hash": cache.get("content_hash"),
+    }
+
+# Um único builder por chatbot_id, mesmo com pedidos concorrentes
+snapshots = SnapshotStore("dumb_api_bd")
+chatbot_caches = ChatbotCache(build_chatbot_cache, describe_chatbot_cache)
+data_cache = chatbot_caches.entries
+
+# ========== Atualizações incrementais ==========
+async def fetch_category_rows(cat_id: int) -> dict:
+    rows = {}
+    for item in await fetch_category_faqs(cat_id):
+        parsed = parse_faq_item(item)
+        if parsed:
+            (_, lang), faq_id, pergunta, resposta = parsed
+            rows.setdefault(lang, []).append((faq_id, pergunta, resposta))
+    return rows
+
+def current_category_rows(cache: dict, cat_id: int) -> dict:
+    rows = {}
+    for key, questions in cache["questions_by_category"].items():
+        if key[0] == cat_id:
+            rows[key[1]] = list(zip(cache["faq_ids_by_category"][key], questions, cache["answers_by_category"][key]))
+    return rows
+
+async def apply_category_rows(cache: dict, cat_id: int, rows_by_lang: dict):
+    """Substitui os blocos (cat_id, idioma), codificando só as perguntas novas ou alteradas."""
+    langs = {key[1] for key in cache["questions_by_category"] if key[0] == cat_id} | set(rows_by_lang)
+    fields = ("faq_ids_by_category", "questions_by_category", "answers_by_category", "question_embeddings_by_category")
+    for lang in langs:
+        key = (cat_id, lang)
+        rows = rows_by_lang.get(lang, [])
+        if not rows:
+            for field in fields:
+                cache[field].pop(key, None)
+            layout_language_matrix(cache, lang)
+            continue
+
+        # Ids, perguntas e embeddings do bloco lidos juntos, antes do await: as
+        # posições em `reused` são deste bloco mesmo que outro o substitua
+        # entretanto (os blocos nunca são alterados no lugar, só trocados)
+        old_ids = cache["faq_ids_by_category"].get(key, [])
+        old_questions = cache["questions_by_category"].get(key, [])
+        old_embeddings = cache["question_embeddings_by_category"].get(key)
+        reused, changed = diff_rows(old_ids, old_questions, rows)
+        new_embeddings = await encode_questions([rows[i][1] for i in changed]) if changed else None
+
+        dim = new_embeddings.shape[1] if new_embeddings is not None else old_embeddings.shape[1]
+        embeddings = np.empty((len(rows), dim), dtype=np.float32)
+        kept = [i for i, pos in enumerate(reused) if pos is not None]
+        if kept:
+            embeddings[kept] = old_embeddings[[reused[i] for i in kept]]
+        if changed:
+            embeddings[changed] = new_embeddings
+
+        # Sem awaits daqui para baixo: os pedidos veem o bloco antigo ou o novo, nunca metade
+        cache["faq_ids_by_category"][key] = [row[0] for row in rows]
+        cache["questions_by_category"][key] = [row[1] for row in rows]
+        cache["answers_by_category"][key] = [row[2] for row in rows]
+        cache["question_embeddings_by_category"][key] = embeddings
+        # Volta a juntar a matriz do idioma (cópia de memória, sem codificar nada)
+        layout_language_matrix(cache, lang)
+        logger.info(f"Categoria {cat_id}/{lang}: {len(rows)} FAQs, {len(changed)} codificadas")
+
+async def refresh_category_keywords(chatbot_id: str, cache: dict):
+    category_keywords, feedback_ids = parse_categories(await fetch_categories(chatbot_id))
+    cache["category_keywords"] = category_keywords
+    cache["keyword_matcher"] = KeywordMatcher(category_keywords)
+    cache["feedback_negativo_ids"] = feedback_ids
+    # Categorias desassociadas do chatbot deixam de ter blocos
+    for cat_id in {key[0] for key in cache["questions_by_category"]} - set(category_keywords):
+        await apply_category_rows(cache, cat_id, {})
+
+def summarize_sources(categories, faqs, chatbot_data):
+    """O conteúdo que a cache deve ter segundo o backend, comparável sem codificar nada."""
+    category_keywords, feedback_ids = parse_categories(categories)
+    rows = set()
+    for item in faqs:
+        parsed = parse_faq_item(item)
+        if parsed:
+            key, faq_id, pergunta, resposta = parsed
+            rows.add((*key, faq_id, pergunta, resposta))
+    return chatbot_data, category_keywords, feedback_ids, rows
+
+def summarize_cache(cache: dict):
+    rows = {
+        (*key, faq_id, pergunta, resposta)
+        for key, questions in cache["questions_by_category"].items()
+        for faq_id, pergunta, resposta in zip(cache["faq_ids_by_category"][key], questions, cache["answers_by_category"][key])
+    }
+    return cache["chatbot"], cache["category_keywords"], cache["feedback_negativo_ids"], rows
+
+async def save_updated_snapshot(chatbot_id: str, cache: dict):
+    """Snapshot da cache depois de alterações incrementais, com o hash das fontes atuais.
+
+    Só grava se a cache tiver o mesmo conteúdo que o backend: com uma alteração
+    ainda por aplicar, o hash seria de um conteúdo que a cache não tem (essa
+    alteração agenda outro snapshot quando for aplicada).
+    """
+    if not snapshots.enabled:
+        return
+    sources = await fetch_chatbot_sources(chatbot_id)
+    if summarize_cache(cache) != summarize_sources(*sources):
+        logger.info(f"Chatbot {chatbot_id}: cache ainda difere do backend; snapshot não gravado")
+        return
+    digest = snapshots.content_hash(*sources)
+    await asyncio.to_thread(snapshots.save, chatbot_id, digest, *dump_chatbot_cache(cache))
+    cache["content_hash"] = digest
+
+faq_changes = FaqChangeFeed(chatbot_caches, fetch_category_rows, current_category_rows,
+                            apply_category_rows, refresh_category_keywords, save_updated_snapshot)
+
+async def warm_model():
+    # A primeira inferência é sempre mais lenta (alocações, kernels): que seja esta
+    await inference.encode_query("aquecimento do modelo")
+    # O identificador de idioma treina-se no primeiro uso
+    get_language_model()
+
+# Caches dos chatbots ativos construídas no arranque (PREWARM_CHATBOTS), não no primeiro pedido
+prewarm = Prewarmer(chatbot_caches, warmup=warm_model)
 
 # ========== Models ==========
 class MessageRequest(BaseModel):
@@ -182,102 +441,96 @@ class MessageRequest(BaseModel):
     force_reload: bool = False
 
 # ========== Rota ==========
+@app.post("/reload/{chatbot_id}")
+async def reload_chatbot(chatbot_id: str, wait: bool = False):
+    """Reconstrói a cache do chatbot em background; o tráfego continua na versão anterior."""
+    future = chatbot_caches.reload(chatbot_id.strip())
+    if wait:
+        try:
+            await chatbot_caches.wait(future)
+        except Exception as e:
+            raise HTTPException(502, f"Erro ao recarregar o chatbot {chatbot_id}: {e}")
+    return chatbot_caches.status(chatbot_id.strip())
+
+@app.get("/reload/{chatbot_id}")
+async def reload_status(chatbot_id: str):
+    return chatbot_caches.status(chatbot_id.strip())
+
+@app.post("/faq-events")
+async def faq_events(changes: Union[FaqChange, List[FaqChange]]):
+    """Webhook para o backend avisar de alterações em FAQ, Faq_Categoria ou Categoria."""
+    if isinstance(changes, FaqChange):
+        changes = [changes]
+    affected = set()
+    for change in changes:
+        affected.update(await faq_changes.apply(change))
+    return {"applied": len(changes), "chatbots": sorted(affected)}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: só responde 200 depois do prewarm das caches dos chatbots ativos."""
+    if not prewarm.ready:
+        raise HTTPException(503, prewarm.status())
+    return prewarm.status()
+
+@app.get("/inference/stats")
+async def inference_stats():
+    return inference.stats()
+
+@app.get("/sessions/stats")
+async def sessions_stats():
+    return conversation_states.memory_usage()
+
 @app.post("/chat_dumb")
 async def chat(req: MessageRequest):
     logger.info(f"Chatbot: {req.chatbot_id} | Sessão: {req.session_id} | Mensagem: {req.message}")
-    user_input = req.message.strip()
-    if not user_input:
+    # Normalização, idioma e saudação calculados uma só vez para todo o pedido
+    message = analyze_message(req.message)
+    if not message.text:
         return {"response": "Por favor, escreva algo."}
 
-    lang = detect_language(user_input)
+    lang = message.language
 
+    # Reconstrução em background: este pedido ainda é servido pela versão atual
     if req.force_reload:
-        data_cache.pop(req.chatbot_id, None)
-
-    if req.chatbot_id not in data_cache:
-        categories = await fetch_categories(req.chatbot_id)
-        faqs = await fetch_faq_data(int(req.chatbot_id))
-
-        category_keywords, feedback_ids = {}, {"pt": None, "en": None}
-        questions_by_cat, answers_by_cat = {}, {}
-        question_embeddings_by_cat = {}
-
-        for cat in categories:
-            cat_id = cat["categoria_id"]
-            raw_keywords = cat.get("categoria", {}).get("keywords", [])
-            category_keywords[cat_id] = [normalize_text(k) for k in raw_keywords]
-            if cat_id == 999: feedback_ids["pt"] = cat_id
-            if cat_id == 998: feedback_ids["en"] = cat_id
-
-        for item in faqs:
-            cat_id = item["categoria_id"]
-            faq = item.get("faq", {})
-            pergunta = faq.get("pergunta", "").strip()
-            resposta = faq.get("resposta", "").strip()
-            idioma = "pt" if normalize_text(faq.get("idioma", "pt").lower()) in ["pt", "portugues", "português"] else "en"
-            key = (cat_id, idioma)
-            if pergunta and resposta:
-                questions_by_cat.setdefault(key, []).append(pergunta)
-                answers_by_cat.setdefault(key, []).append(resposta)
-
-        for key, questions in questions_by_cat.items():
-            embeddings = await run_in_threadpool(lambda q=questions: model.encode(q, convert_to_numpy=True))
-            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
-            question_embeddings_by_cat[key] = embeddings
-
-        data_cache[req.chatbot_id] = {
-            "category_keywords": category_keywords,
-            "feedback_negativo_ids": feedback_ids,
-            "questions_by_category": questions_by_cat,
-            "answers_by_category": answers_by_cat,
-            "question_embeddings_by_category": question_embeddings_by_cat
-        }
-
-    cache = data_cache[req.chatbot_id]
-    state = conversation_states.setdefault(req.session_id, {
-        "language": lang,
-        "last_possible_answers": [],
-        "last_answer_index": 0,
-        "last_question": "",
-        "negative_feedback_count": 0
-    })
-
-    if user_input != state["last_question"]:
-        state["negative_feedback_count"] = 0
-
-    if is_greeting(user_input):
-        greeting_message = await fetch_greeting_message(int(req.chatbot_id), lang)
+        chatbot_caches.reload(req.chatbot_id)
+
+    cache = await chatbot_caches.get(req.chatbot_id)
+    state = await conversation_states.load(req.session_id, lang)
+    try:
+        return await respond(req, message, lang, cache, state)
+    finally:
+        # Com um backend partilhado o próximo pedido da sessão pode ir para outro worker
+        await conversation_states.save(req.session_id, state)
+
+async def respond(req: MessageRequest, message: AnalyzedMessage, lang: str, cache: dict, state):
+    user_input = message.text
+    if user_input != state.last_question:
+        state.negative_feedback_count = 0
+
+    if message.greeting:
+        greeting_message = await fetch_greeting_message(int(req.chatbot_id), lang, cache)
         return {"response": greeting_message}
 
-    if is_negative_feedback(user_input, lang, cache["category_keywords"], cache["feedback_negativo_ids"]):
-        state["negative_feedback_count"] += 1
-        idx = state["last_answer_index"] + 1
-        if idx < len(state["last_possible_answers"]):
-            state["last_answer_index"] = idx
-            return {"response": state["last_possible_answers"][idx]}
-        return {"response": await fetch_no_response_message(int(req.chatbot_id), lang)}
+    categorias = detect_categories(message, cache["keyword_matcher"])
+    if is_negative_feedback(categorias, lang, cache["feedback_negativo_ids"]):
+        state.negative_feedback_count += 1
+        ref = state.next_ref()
+        answer = resolve_answer(cache, state.language, ref) if ref is not None else None
+        if answer:
+            return {"response": answer}
+        return {"response": await fetch_no_response_message(int(req.chatbot_id), lang, cache)}
 
-    categorias = detect_categories(user_input, cache["category_keywords"])
     if not categorias:
-        return {"response": await fetch_no_response_message(int(req.chatbot_id), lang)}
-
-    answers, similarity = await find_answers_ruled_based(
-        user_input,
-        cache["questions_by_category"],
-        cache["answers_by_category"],
-        cache["question_embeddings_by_category"],
-        lang,
-        categorias
-    )
+        return {"response": await fetch_no_response_message(int(req.chatbot_id), lang, cache)}
+
+    answers, refs, similarity = await find_answers_ruled_based(user_input, cache, lang, categorias)
 
     SIMILARITY_THRESHOLD = 0.65
     if not answers or similarity < SIMILARITY_THRESHOLD:
-        return {"response": await fetch_no_response_message(int(req.chatbot_id), lang)}
+        return {"response": await fetch_no_response_message(int(req.chatbot_id), lang, cache)}
 
-    state.update({
-        "last_question": user_input,
-        "last_possible_answers": answers,
-        "last_answer_index": 0
-    })
+    state.last_question = user_input
+    state.set_answers(refs, lang)
 
     return {"response": answers[0]}
@@ -0,0 +1,183 @@
+import os
+import re
+import hashlib
+import asyncio
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+
+from onnx_encoder import ENCODER_BACKEND
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos, o os.replace mantém os ficheiros consistentes
+    fcntl = None
+
+logger = logging.getLogger("embedding_store")
+
+# ========== Configuração ==========
+# Diretório partilhado pelos workers (de preferência em /dev/shm). Sem ele,
+# cada processo guarda as suas próprias matrizes em memória, como antes.
+EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_DIR")
+EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "all-MiniLM-L6-v2")
+# Versões guardadas por grupo (chatbot e idioma), das usadas mais recentemente
+EMBEDDINGS_KEEP = int(os.getenv("EMBEDDINGS_KEEP", 2))
+
+_UNSAFE_NAME = re.compile(r'[^\w.-]')
+
+
+def block_key(kind: str, questions: List[str], ids: Optional[np.ndarray] = None) -> str:
+    """Chave do bloco pelo conteúdo: o mesmo conjunto de perguntas dá o mesmo ficheiro."""
+    # O backend entra na chave: ONNX int8 e PyTorch FP32 não dão exatamente os mesmos vetores
+    digest = hashlib.sha256(f"{kind}\0{EMBEDDINGS_MODEL}\0{ENCODER_BACKEND}\0".encode("utf-8"))
+    for question in questions:
+        digest.update(question.encode("utf-8"))
+        digest.update(b"\0")
+    if ids is not None:
+        digest.update(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def _block_path(key: str, ext: str, group: Optional[str]) -> str:
+    # O grupo vai no nome para o prune encontrar as versões anteriores do mesmo bloco
+    name = f"{_UNSAFE_NAME.sub('_', group)}--{key}{ext}" if group else key + ext
+    return os.path.join(EMBEDDINGS_DIR, name)
+
+
+@asynccontextmanager
+async def _file_lock(path: str):
+    # Só um processo codifica cada bloco; os outros esperam e depois fazem mmap do ficheiro
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(path + ".lock", os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _atomic_write(path: str, write: Callable[[str], None]):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_if_unlocked(path: str):
+    if fcntl is None:
+        os.unlink(path)
+        return
+    fd = os.open(path + ".lock", os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Outro processo está a abri-la neste momento: fica para o próximo prune
+            return
+        os.unlink(path)
+        os.unlink(path + ".lock")
+    finally:
+        os.close(fd)
+
+
+def _prune(path: str, group: Optional[str]):
+    """Apaga as versões do grupo além das EMBEDDINGS_KEEP usadas mais recentemente.
+
+    Sem isto cada reload ou edição de FAQs deixava um ficheiro novo em
+    EMBEDDINGS_DIR (em /dev/shm, memória) para sempre. Um worker que ainda
+    tenha uma versão apagada mapeada continua a usá-la até a largar; quem a
+    quiser abrir de novo volta a criá-la, porque só se abre sob o lock.
+    """
+    if not group:
+        return
+    prefix, ext = _UNSAFE_NAME.sub('_', group) + "--", os.path.splitext(path)[1]
+    versions = []
+    for entry in os.scandir(EMBEDDINGS_DIR):
+        if entry.name.startswith(prefix) and entry.name.endswith(ext) and entry.path != path:
+            try:
+                versions.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+    versions.sort(reverse=True)
+    for _, old_path in versions[max(EMBEDDINGS_KEEP - 1, 0):]:
+        try:
+            _remove_if_unlocked(old_path)
+        except FileNotFoundError:
+            pass
+        else:
+            logger.info(f"Versão antiga removida: {old_path}")
+
+
+def _save_npy(path: str, embeddings: np.ndarray):
+    # Por ficheiro aberto: np.save com um caminho acrescentaria ".npy" ao nome temporário
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(embeddings, dtype=np.float32))
+
+
+async def shared_embeddings(questions: List[str], encode: Callable[[List[str]], Awaitable[np.ndarray]],
+                            group: Optional[str] = None) -> np.ndarray:
+    """Matriz de embeddings das perguntas, partilhada entre processos via mmap.
+
+    A matriz fica num .npy em EMBEDDINGS_DIR e é aberta só de leitura: todos os
+    workers usam as mesmas páginas da page cache em vez de uma cópia cada.
+    `group` (p.ex. chatbot e idioma) identifica as versões do mesmo bloco: ao
+    gravar uma nova, as mais antigas são apagadas.
+    """
+    if not EMBEDDINGS_DIR:
+        return await encode(questions)
+
+    path = _block_path(block_key("npy", questions), ".npy", group)
+    async with _file_lock(path):
+        if os.path.exists(path):
+            # Conta como uso recente para o prune
+            os.utime(path)
+        else:
+            embeddings = await encode(questions)
+            _atomic_write(path, lambda tmp: _save_npy(tmp, embeddings))
+            logger.info(f"Bloco de {len(questions)} embeddings gravado em {path}")
+            _prune(path, group)
+        return np.load(path, mmap_mode="r")
+
+
+async def shared_index(questions: List[str], encode: Callable[[List[str]], Awaitable[np.ndarray]], build_index,
+                       ids: Optional[np.ndarray] = None, kind: str = "faiss", group: Optional[str] = None):
+    """Índice FAISS das perguntas, partilhado entre processos.
+
+    Devolve (index, shared). Com `shared` a True o índice está mapeado do
+    ficheiro e é só de leitura: quem o quiser alterar tem de o clonar primeiro.
+    Se o índice guardar ids próprios (IndexIDMap), `ids` entra na chave; `kind`
+    distingue tipos de índice construídos sobre as mesmas perguntas e `group`
+    é como em shared_embeddings.
+    """
+    import faiss
+
+    if not EMBEDDINGS_DIR:
+        return build_index(await encode(questions)), False
+
+    path = _block_path(block_key(kind, questions, ids), ".faiss", group)
+    async with _file_lock(path):
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            index = build_index(await encode(questions))
+            _atomic_write(path, lambda tmp: faiss.write_index(index, tmp))
+            logger.info(f"Índice de {len(questions)} perguntas gravado em {path}")
+            _prune(path, group)
+        # IO_FLAG_MMAP_IFC (faiss >= 1.8) mapeia também os índices flat; sem ele o
+        # índice é lido para memória, mas continua a não ser preciso codificar nada
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+        return faiss.read_index(path, flags), True
+
+
+if EMBEDDINGS_DIR:
+    os.makedirs(EMBEDDINGS_DIR, exist_ok=True)
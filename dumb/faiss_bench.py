@@ -0,0 +1,114 @@
+"""Recall e latência dos tipos de índice FAISS para escolher a configuração de um chatbot.
+
+Compara flat (referência exata), HNSW e IVF-PQ sobre as mesmas embeddings:
+recall@k face à força bruta, latência p50/p95 por pergunta, tempo de
+construção e tamanho serializado. Os valores de efSearch/nprobe indicados
+são varridos sobre o mesmo índice, que só é construído uma vez.
+
+Uso (a partir da pasta dumb/):
+    python faiss_bench.py --synthetic 50000
+    python faiss_bench.py --npy /dev/shm/dumb_embeddings/<bloco>.npy --ef-search 32 64 128 --nprobe 8 16 32
+    python faiss_bench.py --faq bots/dumb_faq/*_qa_pt.txt
+"""
+import time
+import argparse
+import statistics
+
+import numpy as np
+import faiss
+
+import faiss_factory
+from faiss_factory import build_index
+
+
+def synthetic_embeddings(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    # Perguntas agrupadas em tópicos, como numa FAQ real, e não ruído uniforme
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 50), dim)).astype(np.float32)
+    X = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def faq_embeddings(paths) -> np.ndarray:
+    from onnx_parity import load_faq_questions
+    from onnx_encoder import load_encoder
+
+    questions = load_faq_questions(paths)
+    return load_encoder("all-MiniLM-L6-v2").encode(questions, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def make_queries(X: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    # Perguntas parecidas com as da FAQ, mas não iguais
+    rng = np.random.default_rng(seed)
+    Q = X[rng.integers(0, len(X), n)] + 0.05 * rng.standard_normal((n, X.shape[1])).astype(np.float32)
+    return (Q / np.linalg.norm(Q, axis=1, keepdims=True)).astype(np.float32)
+
+
+def timed_search(index, Q: np.ndarray, k: int, params=None):
+    timings, labels = [], []
+    for q in Q:
+        t0 = time.perf_counter()
+        _, I = index.search(q[None, :], k, params=params)
+        timings.append((time.perf_counter() - t0) * 1000)
+        labels.append(I[0])
+    cuts = statistics.quantiles(timings, n=100)
+    return np.array(labels), {"p50_ms": round(cuts[49], 3), "p95_ms": round(cuts[94], 3)}
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return round(hits / truth.size, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latência de flat, HNSW e IVF-PQ")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, help="número de vetores sintéticos")
+    source.add_argument("--npy", help="matriz de embeddings (.npy)")
+    source.add_argument("--faq", nargs="+", help="ficheiros pergunta<TAB>resposta")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500, help="pelo menos 2")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--types", nargs="+", default=["hnsw", "ivfpq"], choices=["hnsw", "ivfpq"])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 32, 64, 128])
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[4, 8, 16, 32, 64])
+    parser.add_argument("--threads", type=int, default=1, help="threads OpenMP do faiss (1 = como num worker)")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    if args.synthetic:
+        X = synthetic_embeddings(args.synthetic, args.dim)
+    elif args.npy:
+        X = np.ascontiguousarray(np.load(args.npy), dtype=np.float32)
+    else:
+        X = faq_embeddings(args.faq)
+    Q = make_queries(X, args.queries)
+    k = min(args.k, len(X))
+    print(f"{len(X)} vetores de dimensão {X.shape[1]}, {len(Q)} perguntas, k={k}, "
+          f"auto escolheria: {faiss_factory.index_spec(len(X), X.shape[1], 'auto')}")
+
+    t0 = time.perf_counter()
+    flat = build_index(X, requested="flat")
+    truth, flat_stats = timed_search(flat, Q, k)
+    print(f"flat                      build {time.perf_counter() - t0:6.2f}s  "
+          f"{faiss.serialize_index(flat).nbytes / 1e6:7.1f} MB  recall 1.0000  {flat_stats}")
+
+    for index_type in args.types:
+        t0 = time.perf_counter()
+        index = build_index(X, requested=index_type)
+        build_s = time.perf_counter() - t0
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        if faiss_factory.describe_index(index) == "flat":
+            print(f"{index_type}: poucos vetores, build_index recorreu a flat")
+            continue
+        for value in (args.ef_search if index_type == "hnsw" else args.nprobe):
+            if index_type == "hnsw":
+                params, label = faiss.SearchParametersHNSW(efSearch=value), f"hnsw efSearch={value}"
+            else:
+                params, label = faiss.SearchParametersIVF(nprobe=value), f"ivfpq nprobe={value}"
+            found, stats = timed_search(index, Q, k, params)
+            print(f"{label:<25} build {build_s:6.2f}s  {size_mb:7.1f} MB  recall {recall_at_k(truth, found):.4f}  {stats}")
+
+
+if __name__ == "__main__":
+    main()
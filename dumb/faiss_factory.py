@@ -0,0 +1,237 @@
+import os
+import logging
+from typing import Optional
+
+import numpy as np
+import faiss
+
+logger = logging.getLogger("faiss_factory")
+
+# ========== Configuração ==========
+# auto escolhe pelo número de vetores; flat, hnsw e ivfpq forçam o tipo
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+FAISS_AUTO_HNSW_MIN = int(os.getenv("FAISS_AUTO_HNSW_MIN", 20000))
+FAISS_AUTO_IVFPQ_MIN = int(os.getenv("FAISS_AUTO_IVFPQ_MIN", 500000))
+# HNSW: M vizinhos por nó; efConstruction na construção, efSearch nas pesquisas
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", 80))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", 64))
+# IVF-PQ: nlist listas (0 = 4*sqrt(n)), PQ com pq_m subvetores de pq_nbits bits; nprobe listas por pesquisa
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", 0))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", 16))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", 48))
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", 8))
+# Pesquisas restritas a até este número de ids são exatas, sobre os vetores reconstruídos
+FAISS_EXACT_SELECTION_MAX = int(os.getenv("FAISS_EXACT_SELECTION_MAX", 4096))
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+
+def choose_index_type(n: int, requested: str = FAISS_INDEX_TYPE) -> str:
+    """Tipo de índice para n vetores.
+
+    Até alguns milhares de perguntas a força bruta é exata e mais rápida do que
+    qualquer estrutura; o HNSW vale a pena nas dezenas de milhares e o IVF-PQ
+    quando a memória dos vetores completos passa a pesar.
+    """
+    if requested == "auto":
+        if n >= FAISS_AUTO_IVFPQ_MIN:
+            return "ivfpq"
+        if n >= FAISS_AUTO_HNSW_MIN:
+            return "hnsw"
+        return "flat"
+    if requested not in INDEX_TYPES:
+        logger.warning(f"FAISS_INDEX_TYPE desconhecido: {requested}; a usar flat")
+        return "flat"
+    if requested == "ivfpq" and n < max(ivf_nlist(n), 2 ** FAISS_PQ_NBITS) * 4:
+        # Sem vetores suficientes para treinar os centróides e os codebooks
+        logger.warning(f"{n} vetores não chegam para treinar IVF-PQ; a usar flat")
+        return "flat"
+    return requested
+
+
+def ivf_nlist(n: int) -> int:
+    return FAISS_IVF_NLIST or max(1, int(4 * np.sqrt(n)))
+
+
+def pq_subvectors(dim: int) -> int:
+    # O PQ exige que o número de subvetores divida a dimensão
+    m = min(FAISS_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def index_spec(n: int, dim: int, requested: str = FAISS_INDEX_TYPE) -> str:
+    """Descrição do índice que build_index criaria, p.ex. para chaves de cache."""
+    index_type = choose_index_type(n, requested)
+    if index_type == "hnsw":
+        return f"hnsw-M{FAISS_HNSW_M}-efc{FAISS_HNSW_EF_CONSTRUCTION}"
+    if index_type == "ivfpq":
+        return f"ivf{ivf_nlist(n)}-pq{pq_subvectors(dim)}x{FAISS_PQ_NBITS}"
+    return "flat"
+
+
+def build_signature() -> str:
+    """Configuração de construção (não a de pesquisa), p.ex. para invalidar índices guardados."""
+    return ":".join(str(value) for value in (
+        FAISS_INDEX_TYPE, FAISS_AUTO_HNSW_MIN, FAISS_AUTO_IVFPQ_MIN, FAISS_HNSW_M,
+        FAISS_HNSW_EF_CONSTRUCTION, FAISS_IVF_NLIST, FAISS_PQ_M, FAISS_PQ_NBITS,
+    ))
+
+
+def empty_index(dim: int, index_type: str, n: int = 0) -> faiss.Index:
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+        return index
+    if index_type == "ivfpq":
+        index = faiss.index_factory(dim, f"IVF{ivf_nlist(n)},PQ{pq_subvectors(dim)}x{FAISS_PQ_NBITS}")
+        faiss.extract_index_ivf(index).nprobe = FAISS_IVF_NPROBE
+        return index
+    return faiss.IndexFlatL2(dim)
+
+
+def build_index(embeddings: np.ndarray, ids: Optional[np.ndarray] = None,
+                requested: str = FAISS_INDEX_TYPE) -> faiss.Index:
+    """Índice L2 das embeddings, do tipo escolhido por choose_index_type.
+
+    Com `ids` o índice fica embrulhado num IndexIDMap2 e os resultados das
+    pesquisas são esses ids em vez das posições.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, dim = embeddings.shape
+    index_type = choose_index_type(n, requested)
+    index = empty_index(dim, index_type, n)
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is None:
+        index.add(embeddings)
+        return index
+    index = faiss.IndexIDMap2(index)
+    index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype=np.int64))
+    return index
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """O índice de pesquisa propriamente dito, sem o IndexIDMap à volta."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def tune_for_search(index: faiss.Index) -> faiss.Index:
+    """Aplica efSearch/nprobe da configuração a um índice lido do disco."""
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = FAISS_IVF_NPROBE
+    return index
+
+
+def search_params(index: faiss.Index, selector=None, selectivity: float = 1.0):
+    """Parâmetros de pesquisa do tipo certo para o índice, com um seletor opcional.
+
+    `selectivity` é a fração dos vetores que o seletor deixa passar: efSearch
+    e nprobe crescem na proporção inversa, para que a pesquisa chegue a ver
+    vetores selecionados suficientes.
+    """
+    inner = base_index(index)
+    boost = 1.0 / max(selectivity, 1e-9)
+    if isinstance(inner, faiss.IndexHNSW):
+        ef = max(FAISS_HNSW_EF_SEARCH, min(inner.ntotal, int(FAISS_HNSW_EF_SEARCH * boost)))
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef)
+    if isinstance(inner, faiss.IndexIVF):
+        nprobe = max(FAISS_IVF_NPROBE, min(inner.nlist, int(FAISS_IVF_NPROBE * boost)))
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_selected(index: faiss.Index, query: np.ndarray, ids: np.ndarray, k: int):
+    """(D, I) dos k vizinhos de `query` só entre os vetores com estes ids (IndexIDMap2).
+
+    Com um filtro muito seletivo o HNSW (e o IVF) devolve -1 em lugares que
+    tinham vizinhos válidos: o grafo é percorrido quase todo por nós que o
+    filtro rejeita. Seleções até FAISS_EXACT_SELECTION_MAX são por isso
+    pesquisadas de forma exata sobre os vetores reconstruídos; nas maiores o
+    efSearch/nprobe cresce com o inverso da seletividade.
+    """
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, -1)
+    k = min(k, len(ids))
+    inner = base_index(index)
+    if not isinstance(inner, faiss.IndexFlat) and len(ids) <= FAISS_EXACT_SELECTION_MAX:
+        if isinstance(inner, faiss.IndexIVF) and inner.direct_map.no():
+            # O reconstruct do IVF precisa do mapa id -> lista (uma vez por índice)
+            inner.make_direct_map()
+        vectors = index.reconstruct_batch(ids)
+        # Distância L2 ao quadrado, como nas pesquisas do índice
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind="stable")[:k]
+        return distances[order][None, :].astype(np.float32), ids[order][None, :]
+    selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+    params = search_params(index, selector, len(ids) / max(index.ntotal, 1))
+    return index.search(query, k, params=params)
+
+
+def writable_copy(index: faiss.Index) -> faiss.Index:
+    """Cópia própria de um índice mapeado só de leitura (IO_FLAG_MMAP).
+
+    O clone_index continuaria a apontar para o ficheiro mapeado; a cópia por
+    serialização tem os vetores em memória e pode ser alterada.
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    # O HNSW não remove nós do grafo
+    return not isinstance(base_index(index), faiss.IndexHNSW)
+
+
+def index_vectors(index: faiss.Index) -> np.ndarray:
+    """Vetores guardados no índice, pela ordem interna (aproximados no caso do PQ)."""
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.make_direct_map()
+    return inner.reconstruct_n(0, inner.ntotal)
+
+
+def remove_ids(index: faiss.Index, ids: np.ndarray) -> faiss.Index:
+    """Remove os ids de um IndexIDMap2; devolve o índice a usar daí para a frente.
+
+    Os tipos sem remoção (HNSW) são reconstruídos com os vetores que ficam.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if supports_removal(index):
+        index.remove_ids(ids)
+        return index
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(all_ids, ids)
+    vectors = index_vectors(index)[keep]
+    rebuilt = faiss.IndexIDMap2(empty_index(vectors.shape[1], "hnsw"))
+    if len(vectors):
+        rebuilt.add_with_ids(vectors, all_ids[keep])
+    return rebuilt
+
+
+def merge_into(index: Optional[faiss.Index], other: faiss.Index) -> faiss.Index:
+    """Junta dois índices sem ids (p.ex. um por ficheiro de FAQs) num só."""
+    if index is None:
+        return other
+    if isinstance(index, faiss.IndexFlat) and isinstance(other, faiss.IndexFlat):
+        index.merge_from(other)
+        return index
+    # Índices treinados separadamente não partilham centróides: junta-se pelos vetores
+    vectors = np.vstack([index_vectors(index), index_vectors(other)])
+    return build_index(vectors)
+
+
+def describe_index(index: faiss.Index) -> str:
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return f"hnsw(M={inner.hnsw.nb_neighbors(1)}, efSearch={inner.hnsw.efSearch})"
+    if isinstance(inner, faiss.IndexIVF):
+        return f"ivfpq(nlist={inner.nlist}, nprobe={inner.nprobe})"
+    return "flat"
@@ -0,0 +1,73 @@
+"""Confirma que as pesquisas restritas a categorias dão o mesmo que a força bruta.
+
+Constrói um índice de cada tipo com vetores unitários aleatórios, escolhe
+seleções de ids de vários tamanhos (como as FAQs de uma categoria) e compara
+search_selected com a pesquisa exata sobre os mesmos vetores. As seleções até
+FAISS_EXACT_SELECTION_MAX têm de dar exatamente os mesmos ids; nas maiores o
+HNSW continua aproximado e a recall é comparada com a do índice sem filtro.
+Termina com código 1 se houver lugares vazios (-1) ou uma dessas diferenças.
+
+Uso (a partir da pasta dumb/):
+    python faiss_selection_check.py
+    python faiss_selection_check.py --n 50000 --dim 384 --sizes 3 40 5000
+"""
+import sys
+import argparse
+
+import numpy as np
+
+from faiss_factory import FAISS_EXACT_SELECTION_MAX, build_index, search_selected
+
+
+def exact_search(vectors, ids, query, k):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return ids[order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="search_selected vs força bruta")
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 40, 500, 8000])
+    parser.add_argument("--types", nargs="+", default=["flat", "hnsw"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.n, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = rng.choice(1 << 40, size=args.n, replace=False).astype(np.int64)
+
+    def recall(found, expected):
+        return len(set(expected.tolist()) & set(found.tolist())) / len(expected)
+
+    failed = False
+    for index_type in args.types:
+        index = build_index(vectors, ids, requested=index_type)
+        # Recall do índice sem filtro: o máximo a esperar das seleções grandes
+        queries = vectors[rng.integers(args.n, size=args.queries)]
+        _, found = index.search(queries, args.k)
+        baseline = np.mean([recall(f, exact_search(vectors, ids, q, args.k)) for f, q in zip(found, queries)])
+        print(f"{index_type:<6} sem filtro: recall {baseline:.3f}")
+        for size in args.sizes:
+            missing, recalls = 0, []
+            for _ in range(args.queries):
+                rows = rng.choice(args.n, size=min(size, args.n), replace=False)
+                query = vectors[rng.integers(args.n)][None, :]
+                _, found = search_selected(index, query, ids[rows], args.k)
+                expected = exact_search(vectors[rows], ids[rows], query, args.k)
+                missing += int((found[0] < 0).sum()) + len(expected) - len(found[0])
+                recalls.append(recall(found[0], expected))
+            exact = index_type == "flat" or size <= FAISS_EXACT_SELECTION_MAX
+            selected_recall = float(np.mean(recalls))
+            ok = not missing and (selected_recall == 1.0 if exact else selected_recall >= baseline - 0.05)
+            failed |= not ok
+            print(f"{index_type:<6} seleção {size:>6}: {missing} lugares vazios, recall {selected_recall:.3f}"
+                  f" ({'exata' if exact else 'aproximada'})  {'ok' if ok else 'FALHOU'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
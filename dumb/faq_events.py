@@ -0,0 +1,209 @@
+import os
+import json
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from pydantic import BaseModel
+
+logger = logging.getLogger("faq_events")
+
+# ========== Configuração ==========
+# Sem DSN só o webhook /faq-events fica ativo
+FAQ_NOTIFY_DSN = os.getenv("FAQ_NOTIFY_DSN")
+FAQ_NOTIFY_CHANNEL = os.getenv("FAQ_NOTIFY_CHANNEL", "faq_changes")
+FAQ_NOTIFY_RETRY = float(os.getenv("FAQ_NOTIFY_RETRY", 5))
+# Espera antes de gravar o snapshot depois de alterações: uma rajada grava uma vez
+FAQ_SNAPSHOT_DELAY = float(os.getenv("FAQ_SNAPSHOT_DELAY", 2))
+
+
+class FaqChange(BaseModel):
+    """Alteração numa das tabelas FAQ, Faq_Categoria ou Categoria.
+
+    É o payload dos triggers em db/faq_notify.sql e também o corpo aceite
+    pelo webhook /faq-events. Só diz que categorias voltar a ler: o conteúdo
+    vem sempre do backend, por isso um evento forjado, atrasado ou repetido
+    não altera o que a cache serve.
+    """
+    table: str
+    op: str
+    faq_id: Optional[int] = None
+    categoria_id: Optional[int] = None
+    old_categoria_id: Optional[int] = None
+
+
+def diff_rows(old_ids: list, old_questions: list, rows: list):
+    """Compara um bloco (categoria, idioma) em memória com as linhas novas.
+
+    `rows` é uma lista de (faq_id, pergunta, resposta). Devolve (reused, changed):
+    reused[i] é a posição antiga cuja embedding serve para a linha i (ou None)
+    e changed são os índices das linhas que têm de ser codificadas.
+    """
+    old_pos = {(faq_id, q): pos for pos, (faq_id, q) in enumerate(zip(old_ids, old_questions))}
+    reused = [old_pos.pop((faq_id, q), None) for faq_id, q, _ in rows]
+    changed = [i for i, pos in enumerate(reused) if pos is None]
+    return reused, changed
+
+
+class FaqChangeFeed:
+    """Aplica alterações de FAQs às caches dos chatbots sem as reconstruir.
+
+    Cada serviço fornece as funções que sabem mexer na sua estrutura:
+    `fetch_rows(cat_id)` e `current_rows(cache, cat_id)` devolvem
+    {idioma: [(faq_id, pergunta, resposta)]}, `apply_rows(cache, cat_id, rows)`
+    substitui os blocos da categoria codificando só as perguntas novas ou
+    alteradas, e `refresh_categories(chatbot_id, cache)` volta a ler as
+    keywords das categorias do chatbot. `save_snapshot(chatbot_id, cache)`,
+    se dado, grava o snapshot da cache depois de um lote de alterações.
+    """
+
+    def __init__(self, caches,
+                 fetch_rows: Callable[[int], Awaitable[dict]],
+                 current_rows: Callable[[dict, int], dict],
+                 apply_rows: Callable[[dict, int, dict], Awaitable[None]],
+                 refresh_categories: Callable[[str, dict], Awaitable[None]],
+                 save_snapshot: Optional[Callable[[str, dict], Awaitable[None]]] = None):
+        self.caches = caches
+        self.fetch_rows = fetch_rows
+        self.current_rows = current_rows
+        self.apply_rows = apply_rows
+        self.refresh_categories = refresh_categories
+        self.save_snapshot = save_snapshot
+        self._snapshot_pending: Set[str] = set()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._listener: Optional[asyncio.Task] = None
+
+    async def apply(self, change: FaqChange) -> List[str]:
+        """Aplica a alteração a todos os chatbots em cache; devolve os afetados."""
+        fetched: Dict[int, dict] = {}
+
+        async def rows_for(cat_id: int) -> dict:
+            # A mesma categoria pode estar em vários chatbots: lê-se uma vez
+            if cat_id not in fetched:
+                fetched[cat_id] = await self.fetch_rows(cat_id)
+            return fetched[cat_id]
+
+        affected = []
+        for chatbot_id in list(self.caches.entries):
+            lock = self._locks.setdefault(chatbot_id, asyncio.Lock())
+            async with lock:
+                # Um reload em curso pode ter lido o backend antes desta alteração
+                pending = self.caches.reloading(chatbot_id)
+                if pending is not None:
+                    await asyncio.wait([pending])
+                cache = self.caches.entries.get(chatbot_id)
+                if cache is not None and await self._apply_to(chatbot_id, cache, change, rows_for):
+                    affected.append(chatbot_id)
+                    self._schedule_snapshot(chatbot_id)
+        logger.info(f"{change.table} {change.op} (faq={change.faq_id}, categoria={change.categoria_id}): chatbots {affected}")
+        return affected
+
+    async def _apply_to(self, chatbot_id: str, cache: dict, change: FaqChange, rows_for) -> bool:
+        table, op = change.table.lower(), change.op.upper()
+        known = cache["category_keywords"]
+
+        if table == "categoria":
+            # Uma categoria nova só conta quando for associada ao chatbot
+            if op == "INSERT" or change.categoria_id not in known:
+                return False
+            # Se o backend já não a associar ao chatbot, refresh_categories retira-lhe os blocos
+            await self.refresh_categories(chatbot_id, cache)
+            return True
+
+        if table == "faq":
+            cats = [cat_id for cat_id in known if self._contains(cache, cat_id, change.faq_id)]
+        elif table == "faq_categoria":
+            cats = [cat_id for cat_id in (change.categoria_id, change.old_categoria_id)
+                    if cat_id is not None and cat_id in known]
+        else:
+            logger.warning(f"Tabela desconhecida no evento: {change.table}")
+            return False
+
+        for cat_id in cats:
+            # Também nas remoções: o evento não chega para apagar nada da cache
+            await self.apply_rows(cache, cat_id, await rows_for(cat_id))
+        return bool(cats)
+
+    def _contains(self, cache: dict, cat_id: int, faq_id: Optional[int]) -> bool:
+        return any(row[0] == faq_id for rows in self.current_rows(cache, cat_id).values() for row in rows)
+
+    def _schedule_snapshot(self, chatbot_id: str):
+        # Sem isto um reinício serviria o snapshot de antes das alterações até à revalidação
+        if self.save_snapshot is None or chatbot_id in self._snapshot_pending:
+            return
+        self._snapshot_pending.add(chatbot_id)
+        task = asyncio.create_task(self._save_snapshot(chatbot_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    async def _save_snapshot(self, chatbot_id: str):
+        await asyncio.sleep(FAQ_SNAPSHOT_DELAY)
+        # Uma alteração que chegue durante a gravação agenda outro snapshot
+        self._snapshot_pending.discard(chatbot_id)
+        async with self._locks.setdefault(chatbot_id, asyncio.Lock()):
+            cache = self.caches.entries.get(chatbot_id)
+            if cache is not None:
+                await self.save_snapshot(chatbot_id, cache)
+
+    # ========== LISTEN/NOTIFY ==========
+    def start_listener(self, dsn: Optional[str] = FAQ_NOTIFY_DSN):
+        if not dsn:
+            logger.info("FAQ_NOTIFY_DSN não definido: alterações só via webhook /faq-events")
+            return
+        self._listener = asyncio.create_task(self._listen(dsn))
+
+    async def stop_listener(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._listener
+            self._listener = None
+
+    async def _listen(self, dsn: str):
+        try:
+            import asyncpg
+        except ImportError:
+            logger.error("asyncpg não está instalado: LISTEN/NOTIFY desativado")
+            return
+
+        connected_before = False
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                await conn.add_listener(FAQ_NOTIFY_CHANNEL, self._on_notify)
+                logger.info(f"A ouvir o canal {FAQ_NOTIFY_CHANNEL}")
+                if connected_before:
+                    # Notificações enviadas enquanto a ligação esteve em baixo perderam-se
+                    for chatbot_id in list(self.caches.entries):
+                        self.caches.reload(chatbot_id)
+                connected_before = True
+                while True:
+                    await asyncio.sleep(FAQ_NOTIFY_RETRY)
+                    await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ligação LISTEN perdida ({e}); nova tentativa em {FAQ_NOTIFY_RETRY}s")
+                await asyncio.sleep(FAQ_NOTIFY_RETRY)
+            finally:
+                if conn is not None:
+                    with suppress(Exception):
+                        await conn.close()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            change = FaqChange(**json.loads(payload))
+        except Exception as e:
+            logger.error(f"Notificação inválida em {channel}: {e}")
+            return
+        task = asyncio.create_task(self.apply(change))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Erro ao aplicar alteração de FAQ: {task.exception()}")
@@ -0,0 +1,227 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import date, datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from http_client import get_http_client
+
+logger = logging.getLogger("faq_source")
+
+# ========== Configuração ==========
+# backend: /chatbot-categoria + um /faq-categoria por categoria (em paralelo)
+# bulk: um só pedido a FAQ_BULK_PATH, que devolve as linhas da vista Chatbot_FAQ_Bulk em NDJSON
+# postgres: lê as tabelas de db/chatbot_schema.sql diretamente (asyncpg), sem passar pelo backend
+FAQ_SOURCE = os.getenv("FAQ_SOURCE", "backend")
+FAQ_BULK_PATH = os.getenv("FAQ_BULK_PATH", "/chatbot-faqs/{chatbot_id}")
+FAQ_FETCH_CONCURRENCY = int(os.getenv("FAQ_FETCH_CONCURRENCY", 8))
+FAQ_DB_DSN = os.getenv("FAQ_DB_DSN") or os.getenv("FAQ_NOTIFY_DSN")
+FAQ_DB_POOL_MIN = int(os.getenv("FAQ_DB_POOL_MIN", 1))
+FAQ_DB_POOL_MAX = int(os.getenv("FAQ_DB_POOL_MAX", 10))
+FAQ_DB_PREFETCH = int(os.getenv("FAQ_DB_PREFETCH", 500))
+
+
+class PostgresSource:
+    """Fonte de dados direta sobre o Postgres, com um pool asyncpg.
+
+    Devolve os mesmos formatos que os endpoints do backend, por isso os
+    builders das caches não sabem de onde vêm os dados. O asyncpg prepara cada
+    consulta uma vez por ligação (cache de statements) e usa o protocolo
+    binário; as FAQs de um chatbot vêm por cursor, FAQ_DB_PREFETCH linhas de cada vez.
+    """
+
+    CATEGORIES_SQL = """
+        SELECT cc.categoria_id, cc.chatbot_id, c.nome, c.keywords, c.idioma
+        FROM Chatbot_Categoria cc JOIN Categoria c ON c.categoria_id = cc.categoria_id
+        WHERE cc.chatbot_id = $1
+        ORDER BY cc.categoria_id"""
+    CATEGORY_FAQS_SQL = """
+        SELECT fc.categoria_id, f.faq_id, f.pergunta, f.resposta, f.idioma
+        FROM Faq_Categoria fc JOIN FAQ f ON f.faq_id = fc.faq_id
+        WHERE fc.categoria_id = $1
+        ORDER BY f.faq_id"""
+    BULK_SQL = """
+        SELECT chatbot_id, categoria_id, categoria_nome, keywords, faq_id, pergunta, resposta, idioma
+        FROM Chatbot_FAQ_Bulk
+        WHERE chatbot_id = $1
+        ORDER BY categoria_id, faq_id"""
+    # O ícone pode ser grande e não é usado aqui
+    CHATBOT_SQL = """
+        SELECT chatbot_id, nome, tipo, descricao, mensagem_inicial_en, mensagem_inicial_pt,
+               mensagem_no_response_pt, mensagem_no_response_en, data_criacao, estado, cor_rgb
+        FROM Chatbot WHERE chatbot_id = $1"""
+    CHATBOTS_SQL = "SELECT chatbot_id, nome, estado FROM Chatbot ORDER BY chatbot_id"
+
+    def __init__(self, dsn: Optional[str] = FAQ_DB_DSN):
+        self.dsn = dsn
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    async def pool(self):
+        if self._pool is None:
+            async with self._lock:
+                if self._pool is None:
+                    import asyncpg
+
+                    if not self.dsn:
+                        raise RuntimeError("FAQ_SOURCE=postgres precisa de FAQ_DB_DSN")
+                    self._pool = await asyncpg.create_pool(self.dsn, min_size=FAQ_DB_POOL_MIN, max_size=FAQ_DB_POOL_MAX)
+                    logger.info(f"Pool Postgres criado ({FAQ_DB_POOL_MIN}-{FAQ_DB_POOL_MAX} ligações)")
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def categories(self, chatbot_id: int) -> List[dict]:
+        rows = await (await self.pool()).fetch(self.CATEGORIES_SQL, chatbot_id)
+        return [{
+            "categoria_id": row["categoria_id"],
+            "chatbot_id": row["chatbot_id"],
+            "categoria": {"categoria_id": row["categoria_id"], "nome": row["nome"],
+                          "keywords": list(row["keywords"] or []), "idioma": row["idioma"]},
+        } for row in rows]
+
+    async def category_faqs(self, categoria_id: int) -> List[dict]:
+        rows = await (await self.pool()).fetch(self.CATEGORY_FAQS_SQL, categoria_id)
+        return [faq_item(row) for row in rows]
+
+    async def bulk_rows(self, chatbot_id: int) -> AsyncIterator[dict]:
+        async with (await self.pool()).acquire() as conn:
+            # Os cursores do Postgres só existem dentro de uma transação
+            async with conn.transaction(readonly=True):
+                async for row in conn.cursor(self.BULK_SQL, chatbot_id, prefetch=FAQ_DB_PREFETCH):
+                    yield dict(row)
+
+    async def chatbot(self, chatbot_id: int) -> dict:
+        row = await (await self.pool()).fetchrow(self.CHATBOT_SQL, chatbot_id)
+        if row is None:
+            raise LookupError(f"Chatbot {chatbot_id} não existe")
+        # Como no JSON do backend: datas em ISO 8601
+        return {key: value.isoformat() if isinstance(value, (date, datetime)) else value for key, value in row.items()}
+
+    async def chatbots(self) -> List[dict]:
+        return [dict(row) for row in await (await self.pool()).fetch(self.CHATBOTS_SQL)]
+
+
+postgres = PostgresSource()
+
+
+async def close_data_source():
+    """Fecha o pool do Postgres (se FAQ_SOURCE=postgres o tiver aberto). Chamar no encerramento."""
+    await postgres.close()
+
+
+def faq_item(row) -> dict:
+    # Formato de um item de /faq-categoria
+    return {
+        "categoria_id": row["categoria_id"],
+        "faq_id": row["faq_id"],
+        "faq": {
+            "faq_id": row["faq_id"],
+            "pergunta": row.get("pergunta") or "",
+            "resposta": row.get("resposta") or "",
+            "idioma": row.get("idioma") or "pt",
+        },
+    }
+
+
+async def fetch_categories(chatbot_id: str) -> List[dict]:
+    if FAQ_SOURCE == "postgres":
+        return await postgres.categories(int(chatbot_id))
+    response = await get_http_client().get(f"/chatbot-categoria/{int(chatbot_id)}")
+    response.raise_for_status()
+    return response.json()
+
+
+async def fetch_category_faqs(categoria_id: int) -> List[dict]:
+    if FAQ_SOURCE == "postgres":
+        return await postgres.category_faqs(int(categoria_id))
+    response = await get_http_client().get("/faq-categoria/", params={"categoria_id": categoria_id})
+    response.raise_for_status()
+    return response.json()
+
+
+async def fetch_chatbot(chatbot_id: int) -> dict:
+    if FAQ_SOURCE == "postgres":
+        return await postgres.chatbot(int(chatbot_id))
+    response = await get_http_client().get(f"/chatbots/{chatbot_id}")
+    response.raise_for_status()
+    chatbot_data = response.json()
+    # O ícone pode ser grande e não é usado aqui
+    chatbot_data.pop("icone", None)
+    return chatbot_data
+
+
+async def fetch_chatbots() -> List[dict]:
+    """Todos os chatbots (pelo menos chatbot_id e estado)."""
+    if FAQ_SOURCE == "postgres":
+        return await postgres.chatbots()
+    response = await get_http_client().get("/chatbots/")
+    response.raise_for_status()
+    return response.json()
+
+
+async def fetch_per_category(chatbot_id: str) -> Tuple[List[dict], List[dict]]:
+    """Categorias uma só vez e as FAQs de todas elas em paralelo (no máximo FAQ_FETCH_CONCURRENCY)."""
+    categories = await fetch_categories(chatbot_id)
+    semaphore = asyncio.Semaphore(FAQ_FETCH_CONCURRENCY)
+
+    async def fetch(categoria_id):
+        async with semaphore:
+            return await fetch_category_faqs(categoria_id)
+
+    # Uma categoria que falhe faz falhar a construção: uma cache parcial ficaria no snapshot
+    results = await asyncio.gather(*(fetch(cat["categoria_id"]) for cat in categories))
+    return categories, [item for items in results for item in items]
+
+
+async def stream_bulk_rows(chatbot_id: str) -> AsyncIterator[dict]:
+    """Linhas da vista Chatbot_FAQ_Bulk à medida que chegam (uma por linha, NDJSON)."""
+    path = FAQ_BULK_PATH.format(chatbot_id=int(chatbot_id))
+    async with get_http_client().stream("GET", path) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+
+class BulkCollector:
+    """Converte linhas (chatbot, categoria, keywords, FAQ) no formato dos endpoints por categoria.
+
+    Assim os builders das caches recebem o mesmo que com FAQ_SOURCE=backend.
+    Cada linha é processada quando chega; não se guarda a resposta inteira.
+    """
+
+    def __init__(self):
+        self.categories: List[dict] = []
+        self.faqs: List[dict] = []
+        self._seen = set()
+
+    def add(self, row: dict):
+        categoria_id = row["categoria_id"]
+        if categoria_id not in self._seen:
+            self._seen.add(categoria_id)
+            self.categories.append({
+                "categoria_id": categoria_id,
+                "chatbot_id": row.get("chatbot_id"),
+                "categoria": {"nome": row.get("categoria_nome"), "keywords": list(row.get("keywords") or [])},
+            })
+        if row.get("faq_id") is not None:
+            self.faqs.append(faq_item(row))
+
+
+async def load_chatbot_faqs(chatbot_id: str) -> Tuple[List[dict], List[dict]]:
+    """(categorias, FAQs) de um chatbot, pela fonte configurada em FAQ_SOURCE."""
+    if FAQ_SOURCE in ("bulk", "postgres"):
+        # As mesmas linhas da vista Chatbot_FAQ_Bulk, pelo backend ou diretamente do Postgres
+        rows = postgres.bulk_rows(int(chatbot_id)) if FAQ_SOURCE == "postgres" else stream_bulk_rows(chatbot_id)
+        collector = BulkCollector()
+        async for row in rows:
+            collector.add(row)
+        return collector.categories, collector.faqs
+    if FAQ_SOURCE != "backend":
+        logger.warning(f"FAQ_SOURCE desconhecido: {FAQ_SOURCE}; a usar backend")
+    return await fetch_per_category(chatbot_id)
@@ -2,6 +2,7 @@ import os
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from faiss_factory import build_index, describe_index
 
 # Diretório onde estão os arquivos
 DATA_DIR = "bots/dumb_faq"
@@ -34,10 +35,8 @@ for file_name in os.listdir(DATA_DIR):
         # Embeddings
         embeddings = model.encode(questions, convert_to_numpy=True)
 
-        # Cria o índice FAISS
-        dim = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dim)
-        index.add(np.array(embeddings))
+        # Cria o índice FAISS (flat, HNSW ou IVF-PQ conforme FAISS_INDEX_TYPE e o tamanho)
+        index = build_index(np.array(embeddings))
 
         # Salva os arquivos
         index_path = os.path.join(DATA_DIR, f"{base_name}.index")
@@ -48,6 +47,6 @@ for file_name in os.listdir(DATA_DIR):
             for a in answers:
                 f.write(a + "\n")
 
-        print(f"✅ Índice gerado: {index_path} (linguagem: {lang})")
+        print(f"✅ Índice gerado: {index_path} (linguagem: {lang}, {describe_index(index)})")
 
 print("🎉 Todos os índices foram gerados.")
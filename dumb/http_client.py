@@ -0,0 +1,63 @@
+import os
+import importlib.util
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger("http_client")
+
+# ========== Configuração ==========
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:3004")
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 50))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    # httpx só negocia HTTP/2 com o pacote opcional h2 instalado (httpx[http2])
+    return importlib.util.find_spec("h2") is not None
+
+
+def _create_client() -> httpx.AsyncClient:
+    http2 = _http2_available()
+    logger.info(f"Cliente HTTP partilhado para {BACKEND_URL} (http2={http2}, max_connections={HTTP_MAX_CONNECTIONS})")
+    # Todos os pedidos vão para o mesmo backend, por isso os limites do pool
+    # funcionam como limites por host
+    return httpx.AsyncClient(
+        base_url=BACKEND_URL,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
+async def start_http_client():
+    """Cria o cliente partilhado. Chamar no arranque da aplicação."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+
+
+async def close_http_client():
+    """Fecha o cliente e as ligações keep-alive. Chamar no encerramento."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    # Criação preguiçosa para quem usa os fetchers fora do ciclo de vida da app
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
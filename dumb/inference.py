@@ -0,0 +1,111 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("inference")
+
+# ========== Configuração ==========
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", 64))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", 5))
+# Codificações grandes (construção da cache) vão em pedaços para as perguntas
+# dos utilizadores poderem passar entre eles
+INFERENCE_CHUNK = int(os.getenv("INFERENCE_CHUNK", 256))
+
+
+class InferenceExecutor:
+    """Dono do modelo de embeddings.
+
+    O modelo só corre numa thread dedicada, nunca no event loop. As frases dos
+    pedidos concorrentes juntam-se num lote até INFERENCE_MAX_BATCH frases ou
+    INFERENCE_MAX_WAIT_MS de espera, e são codificadas numa só chamada.
+    """
+
+    def __init__(self, model, max_batch: int = INFERENCE_MAX_BATCH,
+                 max_wait_ms: float = INFERENCE_MAX_WAIT_MS, chunk_size: int = INFERENCE_CHUNK):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._pending: List[Tuple[str, bool, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.queries = 0
+        self.bulk_sentences = 0
+
+    def _encode(self, sentences: List[str], normalize: List[bool]) -> np.ndarray:
+        # Corre na thread de inferência
+        embeddings = self.model.encode(sentences, convert_to_numpy=True, batch_size=len(sentences))
+        embeddings = embeddings.astype(np.float32, copy=False)
+        mask = np.asarray(normalize)
+        if mask.any():
+            embeddings[mask] /= np.linalg.norm(embeddings[mask], axis=1, keepdims=True)
+        return embeddings
+
+    async def encode_query(self, text: str, normalize: bool = True) -> np.ndarray:
+        """Embedding (1, dim) de uma frase, codificada em lote com as dos outros pedidos."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, normalize, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        job = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._encode, [text for text, _, _ in batch], [norm for _, norm, _ in batch]
+        )
+        job.add_done_callback(lambda done: self._resolve(batch, done))
+
+    def _resolve(self, batch: list, job: asyncio.Future):
+        if job.exception() is not None:
+            logger.error(f"Erro ao codificar lote de {len(batch)} frases: {job.exception()}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(job.exception())
+            return
+        embeddings = job.result()
+        self.batches += 1
+        self.queries += len(batch)
+        for i, (_, _, future) in enumerate(batch):
+            # Um pedido cancelado (cliente desligou) não impede os outros
+            if not future.done():
+                future.set_result(embeddings[i:i + 1])
+
+    async def encode_many(self, sentences: List[str], normalize: bool = True) -> np.ndarray:
+        """Embeddings (n, dim) de muitas frases, p.ex. as perguntas de uma categoria."""
+        loop = asyncio.get_running_loop()
+        parts = []
+        for start in range(0, len(sentences), self.chunk_size):
+            chunk = sentences[start:start + self.chunk_size]
+            parts.append(await loop.run_in_executor(self._executor, self._encode, chunk, [normalize] * len(chunk)))
+        self.bulk_sentences += len(sentences)
+        if not parts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.vstack(parts)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            "bulk_sentences": self.bulk_sentences,
+            "pending": len(self._pending),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
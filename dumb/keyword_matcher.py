@@ -0,0 +1,112 @@
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+
+# stop_at de _scan: pára no primeiro rótulo encontrado, seja ele qual for
+_ANY = -1
+
+
+def _is_word_char(c: str) -> bool:
+    # O mesmo que \w nas expressões regulares
+    return c.isalnum() or c == "_"
+
+
+class KeywordMatcher:
+    """Autómato de Aho-Corasick sobre as keywords de várias categorias (ou frases de feedback).
+
+    Construído uma vez quando a cache do chatbot/idioma é carregada; cada
+    mensagem é depois percorrida uma só vez, seja qual for o número de
+    keywords, e devolve todas as categorias com pelo menos uma keyword no
+    texto. As keywords e o texto têm de vir já normalizados (normalize_text).
+
+    Sem `whole_words` uma keyword conta em qualquer posição, como o antigo
+    `keyword in texto`; com `whole_words` só conta se não estiver colada a
+    letras ou dígitos de um lado ou do outro.
+    """
+
+    def __init__(self, patterns: Dict[Hashable, Iterable[str]], whole_words: bool = False):
+        self.labels: List[Hashable] = list(patterns)
+        self._positions = {label: label_pos for label_pos, label in enumerate(self.labels)}
+        self.whole_words = whole_words
+        self.size = 0
+        # Trie: transições por nó, ligação de falha e (rótulo, comprimento) que terminam no nó
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[tuple]] = [[]]
+        # Uma keyword vazia está contida em qualquer texto
+        self._always: Set[int] = set()
+        for label_pos, label in enumerate(self.labels):
+            for pattern in patterns[label]:
+                if pattern:
+                    self._add(pattern, label_pos)
+                elif not whole_words:
+                    self._always.add(label_pos)
+        self._link()
+
+    def _add(self, pattern: str, label_pos: int):
+        node = 0
+        for c in pattern:
+            nxt = self._goto[node].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if (label_pos, len(pattern)) not in self._out[node]:
+            self._out[node].append((label_pos, len(pattern)))
+            self.size += 1
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(c, 0)
+                # Herda as saídas dos sufixos: basta olhar para o nó atual durante a pesquisa
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _scan(self, text: str, stop_at: Optional[int] = None) -> Set[int]:
+        found = set(self._always)
+        if stop_at is not None and (stop_at in found or (stop_at == _ANY and found)):
+            return found
+        goto, fail, out = self._goto, self._fail, self._out
+        n = len(text)
+        node = 0
+        for i, c in enumerate(text):
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            for label_pos, length in out[node]:
+                if label_pos in found:
+                    continue
+                if self.whole_words:
+                    start, end = i - length + 1, i + 1
+                    if (start > 0 and _is_word_char(text[start - 1])) or (end < n and _is_word_char(text[end])):
+                        continue
+                found.add(label_pos)
+                if stop_at == label_pos or stop_at == _ANY:
+                    return found
+        return found
+
+    def find(self, text: str) -> List[Hashable]:
+        """Rótulos com pelo menos uma keyword no texto, pela ordem em que foram dados."""
+        return [self.labels[label_pos] for label_pos in sorted(self._scan(text))]
+
+    def first(self, text: str) -> Optional[Hashable]:
+        """O primeiro rótulo (pela ordem dada) com uma keyword no texto."""
+        found = self._scan(text)
+        return self.labels[min(found)] if found else None
+
+    def matches(self, text: str, label: Hashable) -> bool:
+        """Se o texto tem alguma keyword de `label`; pára na primeira."""
+        label_pos = self._positions.get(label)
+        return label_pos is not None and label_pos in self._scan(text, stop_at=label_pos)
+
+    def any(self, text: str) -> bool:
+        """Se o texto tem alguma keyword, de qualquer rótulo; pára na primeira."""
+        return bool(self._scan(text, stop_at=_ANY))
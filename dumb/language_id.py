@@ -0,0 +1,152 @@
+import os
+import re
+import glob
+import math
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("language_id")
+
+# ========== Configuração ==========
+# Ficheiros de treino: *_qa_<idioma>.txt, categories_<idioma>.txt e negative_feedback_<idioma>.txt
+LANGUAGE_ID_CORPUS = os.getenv("LANGUAGE_ID_CORPUS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bots"))
+LANGUAGE_ID_MAX_N = int(os.getenv("LANGUAGE_ID_MAX_N", 4))
+LANGUAGE_ID_CACHE_SIZE = int(os.getenv("LANGUAGE_ID_CACHE_SIZE", 4096))
+
+LANGUAGES = ("pt", "en")
+_NOT_WORD_OR_SPACE = re.compile(r'[^\w\s]')
+_CORPUS_FILE = re.compile(r'(?:_qa|^categories|^negative_feedback)_(pt|en)\.txt$')
+
+# Palavras funcionais frequentes: cobrem o que as FAQs não dizem ("eu", "you", ...)
+SEED_CORPUS = {
+    "pt": [
+        "o a os as um uma de do da dos das em no na nos nas por para com sem que se não sim",
+        "eu tu ele ela nós vocês eles elas meu minha seu sua isso isto aquilo aqui ali onde quando como porque",
+        "é são foi ser estar está estou tenho tem temos fazer faço posso pode quero queria preciso gostaria saber",
+        "obrigado obrigada olá bom dia boa tarde boa noite ajuda informação horário pedido também ainda já mais muito",
+    ],
+    "en": [
+        "the a an of in on at to for with without that this these those is are was were be been not yes no",
+        "i you he she we they my your his her our their it here there where when how why what which who",
+        "do does did have has had can could would should want need like know get make please",
+        "thanks thank you hello good morning good afternoon good evening help information schedule request also still already more much",
+    ],
+}
+
+
+def features(text: str, max_n: int = LANGUAGE_ID_MAX_N) -> List[str]:
+    """N-gramas de carateres (1..max_n) de cada palavra, com espaço antes e depois.
+
+    Os acentos ficam: "ção", "ã" e "ê" são dos melhores sinais de português.
+    """
+    grams = []
+    for word in _NOT_WORD_OR_SPACE.sub(' ', text.lower()).split():
+        padded = f" {word} "
+        for n in range(1, max_n + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class NgramLanguageModel:
+    """Naive Bayes multinomial sobre n-gramas de carateres, para pt/en.
+
+    Determinístico (sem amostragem aleatória, ao contrário do langdetect) e
+    pequeno: guarda só a diferença de log-probabilidades de cada n-grama.
+    """
+
+    def __init__(self, languages: Tuple[str, str] = LANGUAGES, max_n: int = LANGUAGE_ID_MAX_N, alpha: float = 0.5):
+        self.languages = languages
+        self.max_n = max_n
+        self.alpha = alpha
+        self.counts: Dict[str, Dict[str, int]] = {lang: {} for lang in languages}
+        self.samples = 0
+        self._weights: Dict[str, float] = {}
+        self._unseen = 0.0
+
+    def fit(self, samples: Iterable[Tuple[str, str]]) -> "NgramLanguageModel":
+        for text, lang in samples:
+            if lang not in self.counts:
+                continue
+            counts = self.counts[lang]
+            for gram in features(text, self.max_n):
+                counts[gram] = counts.get(gram, 0) + 1
+            self.samples += 1
+        self._compile()
+        return self
+
+    def _compile(self):
+        first, second = self.languages
+        vocabulary = set(self.counts[first]) | set(self.counts[second])
+        size = len(vocabulary) or 1
+        denominators = {
+            lang: sum(self.counts[lang].values()) + self.alpha * size for lang in self.languages
+        }
+        # log P(g|first) - log P(g|second); um n-grama nunca visto em nenhum dos dois usa _unseen
+        self._unseen = math.log(denominators[second] / denominators[first])
+        self._weights = {
+            gram: math.log((self.counts[first].get(gram, 0) + self.alpha) / denominators[first])
+            - math.log((self.counts[second].get(gram, 0) + self.alpha) / denominators[second])
+            for gram in vocabulary
+        }
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """(idioma, confiança entre 0.5 e 1); (None, 0.0) se o texto não tiver letras.
+
+        Cada carater entra em até max_n n-gramas sobrepostos, que o naive Bayes
+        conta como provas independentes: a posteriori crua dá ~0.99 até a
+        "ok" ou "loja". Dividir a razão de log-verosimilhanças por max_n põe a
+        confiança perto da exatidão observada (language_id_bench.py --calibration).
+        """
+        grams = features(text, self.max_n)
+        if not grams:
+            return None, 0.0
+        weights, unseen = self._weights, self._unseen
+        score = sum(weights.get(gram, unseen) for gram in grams) / self.max_n
+        # Probabilidade a posteriori com priors iguais
+        if score >= 0:
+            return self.languages[0], 1.0 / (1.0 + math.exp(-min(score, 700.0)))
+        return self.languages[1], 1.0 / (1.0 + math.exp(max(score, -700.0)))
+
+
+def corpus_samples(root: str = LANGUAGE_ID_CORPUS) -> List[Tuple[str, str]]:
+    """(texto, idioma) das FAQs, keywords e frases de feedback dos bots em ficheiro."""
+    samples = []
+    for path in sorted(glob.glob(os.path.join(root, "**", "*.txt"), recursive=True)):
+        match = _CORPUS_FILE.search(os.path.basename(path))
+        if not match:
+            continue
+        lang = match.group(1)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if os.path.basename(path).startswith("categories"):
+                    # nome: keyword, keyword, ...
+                    line = line.split(":", 1)[-1].replace(",", " ")
+                samples.extend((part, lang) for part in line.split("\t") if part.strip())
+    return samples
+
+
+def seed_samples() -> List[Tuple[str, str]]:
+    return [(text, lang) for lang, texts in SEED_CORPUS.items() for text in texts]
+
+
+_model: Optional[NgramLanguageModel] = None
+
+
+def get_model() -> NgramLanguageModel:
+    """Modelo treinado com o corpus na primeira utilização (alguns milissegundos)."""
+    global _model
+    if _model is None:
+        samples = seed_samples() + corpus_samples()
+        _model = NgramLanguageModel().fit(samples)
+        logger.info(f"Identificador de idioma treinado com {len(samples)} textos")
+    return _model
+
+
+@lru_cache(maxsize=LANGUAGE_ID_CACHE_SIZE)
+def identify_language(text: str) -> Tuple[Optional[str], float]:
+    """(idioma, confiança) de um texto; as mensagens repetidas ("ok", "obrigado") vêm da memo."""
+    return get_model().predict(text)
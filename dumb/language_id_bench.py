@@ -0,0 +1,132 @@
+"""Exatidão e latência do identificador de idioma (language_id) face ao langdetect.
+
+Avaliação cruzada em k partes sobre o corpus dos bots (FAQs, keywords,
+feedback): o modelo é treinado sem a parte avaliada e o langdetect vê os
+mesmos textos. Com --labeled usa-se em vez disso um ficheiro texto<TAB>idioma,
+com o modelo treinado no corpus inteiro. --calibration avalia também trechos
+de 1 a 5 palavras (como as mensagens curtas do chat): exatidão por intervalo
+de confiança e a regra de t.detectar_idioma (en só com confiança > 0.90).
+
+Uso (a partir da pasta dumb/):
+    python language_id_bench.py
+    python language_id_bench.py --folds 10 --min-chars 10
+    python language_id_bench.py --labeled mensagens.tsv
+    python language_id_bench.py --calibration
+"""
+import time
+import random
+import argparse
+
+import language_id
+from language_id import NgramLanguageModel, corpus_samples, seed_samples
+
+
+def langdetect_predict():
+    from langdetect import DetectorFactory, detect
+
+    # Sem semente o langdetect pode dar respostas diferentes para o mesmo texto
+    DetectorFactory.seed = 0
+
+    def predict(text):
+        try:
+            return "en" if detect(text) == "en" else "pt"
+        except Exception:
+            return "pt"
+    return predict
+
+
+def evaluate(predict, samples):
+    hits, t0 = 0, time.perf_counter()
+    for text, lang in samples:
+        hits += predict(text) == lang
+    elapsed = time.perf_counter() - t0
+    return hits / len(samples), elapsed / len(samples) * 1e6
+
+
+def folds(samples, k):
+    for i in range(k):
+        yield [s for j, s in enumerate(samples) if j % k != i], [s for j, s in enumerate(samples) if j % k == i]
+
+
+CONFIDENCE_BINS = ((0.5, 0.7), (0.7, 0.8), (0.8, 0.9), (0.9, 0.95), (0.95, 0.99), (0.99, 1.01))
+
+
+def windows(samples, sizes=(1, 2, 3, 5), per_size=3, seed=0):
+    """Trechos curtos dos textos, com o idioma do texto de onde vêm."""
+    rng = random.Random(seed)
+    out = []
+    for text, lang in samples:
+        words = text.split()
+        for size in sizes:
+            if len(words) < size:
+                break
+            for _ in range(per_size):
+                start = rng.randrange(len(words) - size + 1)
+                out.append((" ".join(words[start:start + size]), lang))
+    return out
+
+
+def calibration(splits):
+    """Exatidão por intervalo de confiança e da regra de detectar_idioma, em trechos curtos."""
+    by_bin = {bounds: [0, 0] for bounds in CONFIDENCE_BINS}
+    gate = [0, 0]
+    for train, test in splits:
+        model = NgramLanguageModel().fit(train)
+        for text, lang in windows(test):
+            predicted, confidence = model.predict(text)
+            if predicted is None:
+                continue
+            for bounds in CONFIDENCE_BINS:
+                if bounds[0] <= confidence < bounds[1]:
+                    by_bin[bounds][0] += predicted == lang
+                    by_bin[bounds][1] += 1
+            if len(text) >= 10:
+                gated = "en" if predicted == "en" and confidence > 0.90 else "pt"
+                gate[0] += gated == lang
+                gate[1] += 1
+    print("confiança       trechos  exatidão")
+    for (low, high), (hits, n) in by_bin.items():
+        if n:
+            print(f"[{low:.2f}, {min(high, 1.0):.2f})  {n:8d}  {hits / n:.3f}")
+    if gate[1]:
+        print(f"detectar_idioma (>= 10 carateres): {gate[1]} trechos, exatidão {gate[0] / gate[1]:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="language_id vs langdetect (pt/en)")
+    parser.add_argument("--corpus", default=language_id.LANGUAGE_ID_CORPUS)
+    parser.add_argument("--labeled", help="ficheiro texto<TAB>idioma para avaliar")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--min-chars", type=int, default=0, help="ignora textos mais curtos")
+    parser.add_argument("--calibration", action="store_true", help="confiança vs exatidão em trechos curtos")
+    args = parser.parse_args()
+
+    corpus = corpus_samples(args.corpus)
+    if args.labeled:
+        with open(args.labeled, "r", encoding="utf-8") as f:
+            rows = [line.rstrip("\n").split("\t") for line in f if "\t" in line]
+        splits = [(seed_samples() + corpus, [(text, lang.strip()) for text, lang in rows])]
+    else:
+        splits = [(seed_samples() + train, test) for train, test in folds(corpus, args.folds)]
+    splits = [(train, [s for s in test if len(s[0]) >= args.min_chars]) for train, test in splits]
+    n = sum(len(test) for _, test in splits)
+    print(f"{n} textos de avaliação, {len(splits)} partes, corpus de {len(corpus)} textos")
+
+    reference = langdetect_predict()
+    results = {"language_id": [0.0, 0.0], "langdetect": [0.0, 0.0]}
+    for train, test in splits:
+        if not test:
+            continue
+        model = NgramLanguageModel().fit(train)
+        for name, predict in (("language_id", lambda text: model.predict(text)[0] or "pt"), ("langdetect", reference)):
+            accuracy, us = evaluate(predict, test)
+            results[name][0] += accuracy * len(test)
+            results[name][1] += us * len(test)
+    for name, (hits, us) in results.items():
+        print(f"{name:<12} exatidão {hits / n:.4f}  {us / n:9.1f} µs/texto")
+    if args.calibration:
+        calibration(splits)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from difflib import SequenceMatcher
+from typing import List, Sequence
+
+import numpy as np
+
+
+def char_features(text: str) -> List[tuple]:
+    """Carateres do texto numerados por ocorrência: ("a", 1), ("a", 2), ...
+
+    Assim a interseção de dois conjuntos é a interseção dos multiconjuntos de
+    carateres, a mesma contagem de SequenceMatcher.quick_ratio().
+    """
+    seen = {}
+    features = []
+    for c in text:
+        seen[c] = seen.get(c, 0) + 1
+        features.append((c, seen[c]))
+    return features
+
+
+class LexicalRanker:
+    """SequenceMatcher.ratio() de uma pergunta com muitos textos, sem os comparar todos.
+
+    Os textos (já normalizados) são indexados uma vez ao carregar, num índice
+    invertido de carateres. Cada pergunta calcula o quick_ratio() de todos os
+    textos num só np.bincount; como quick_ratio() >= ratio(), só os textos
+    com quick_ratio() acima do limiar podem passar e só esses são comparados
+    com SequenceMatcher. As pontuações são as de ratio(), por isso os limiares
+    e a ordem das respostas são os de antes (lexical_ranker_bench.py).
+
+    query_first diz a ordem dos argumentos de ratio(), que não é simétrico:
+    False para ratio(texto, pergunta), True para ratio(pergunta, texto).
+    """
+
+    def __init__(self, texts: Sequence[str], query_first: bool = False):
+        self.texts = list(texts)
+        self.size = len(self.texts)
+        self.query_first = query_first
+        postings = {}
+        lengths = np.zeros(self.size, dtype=np.float64)
+        for pos, text in enumerate(self.texts):
+            lengths[pos] = len(text)
+            for feature in char_features(text):
+                postings.setdefault(feature, []).append(pos)
+        self._lengths = lengths
+        self._postings = {feature: np.array(docs, dtype=np.int32) for feature, docs in postings.items()}
+
+    def __len__(self):
+        return self.size
+
+    def upper_bounds(self, query: str) -> np.ndarray:
+        """quick_ratio() da pergunta com cada texto: nunca abaixo de ratio()."""
+        hits = [self._postings[feature] for feature in char_features(query) if feature in self._postings]
+        matches = np.bincount(np.concatenate(hits), minlength=self.size) if hits else np.zeros(self.size)
+        total = self._lengths + len(query)
+        # Dois textos vazios: ratio() dá 1.0
+        return np.divide(2.0 * matches, total, out=np.ones(self.size), where=total > 0)
+
+    def scores(self, query: str, floor: float = 0.0) -> np.ndarray:
+        """ratio() da pergunta com cada texto, pela ordem em que foram dados.
+
+        Os textos que não podem chegar a `floor` ficam a 0 sem serem comparados.
+        """
+        return self._scores(query, np.flatnonzero(self.upper_bounds(query) >= floor))
+
+    def rank(self, query: str, threshold: float) -> List[int]:
+        """Posições dos textos com ratio() acima do limiar, da mais para a menos parecida.
+
+        Os empates ficam pela ordem original, como no sort estável de antes.
+        """
+        scores = self._scores(query, np.flatnonzero(self.upper_bounds(query) > threshold))
+        above = np.flatnonzero(scores > threshold)
+        return above[np.argsort(-scores[above], kind="stable")].tolist()
+
+    def _scores(self, query: str, candidates: np.ndarray) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float64)
+        # SequenceMatcher guarda a análise do segundo texto: a pergunta é analisada uma só vez
+        if self.query_first:
+            matcher = SequenceMatcher(None, query, "")
+            for pos in candidates:
+                matcher.set_seq2(self.texts[pos])
+                scores[pos] = matcher.ratio()
+        else:
+            matcher = SequenceMatcher(None, "", query)
+            for pos in candidates:
+                matcher.set_seq1(self.texts[pos])
+                scores[pos] = matcher.ratio()
+        return scores
@@ -0,0 +1,125 @@
+"""LexicalRanker face ao ciclo de SequenceMatcher que substituiu.
+
+Para cada pergunta de teste compara as posições acima do limiar e a sua
+ordem (rank) com as do ciclo antigo, com o mesmo limiar, e a latência dos
+dois. As perguntas de teste saem das próprias FAQs dos bots: as perguntas
+inteiras, trechos de 1 a 5 palavras e versões com erros de escrita. Com
+--scale N os textos são multiplicados até N (palavras das FAQs baralhadas),
+para ver a latência com bots maiores.
+
+Uso (a partir da pasta dumb/):
+    python lexical_ranker_bench.py
+    python lexical_ranker_bench.py --threshold 0.10 --query-first
+    python lexical_ranker_bench.py --scale 20000
+"""
+import os
+import glob
+import time
+import random
+import argparse
+import unicodedata
+from difflib import SequenceMatcher
+
+from lexical_ranker import LexicalRanker
+
+
+def normalize_text(text):
+    text = text.lower()
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+
+
+def load_questions(root):
+    """Perguntas normalizadas de cada ficheiro de FAQs dos bots (pergunta<TAB>resposta)."""
+    groups = {}
+    for path in sorted(glob.glob(os.path.join(root, "**", "*_qa*.txt"), recursive=True)):
+        with open(path, "r", encoding="utf-8") as f:
+            questions = [normalize_text(line.split("\t")[0].strip()) for line in f if "\t" in line]
+        if questions:
+            groups[path] = questions
+    return groups
+
+
+def typo(text, rng):
+    if len(text) < 2:
+        return text
+    i = rng.randrange(len(text) - 1)
+    op = rng.randrange(3)
+    if op == 0:
+        return text[:i] + text[i + 1:]
+    if op == 1:
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text[:i] + rng.choice("aeiosrnt") + text[i:]
+
+
+def queries_for(texts, rng, per_text=6):
+    out = []
+    for text in texts:
+        out.append(text)
+        out.append(typo(text, rng))
+        words = text.split()
+        for _ in range(per_text - 2):
+            size = rng.randint(1, min(5, len(words)))
+            start = rng.randrange(len(words) - size + 1)
+            out.append(" ".join(words[start:start + size]))
+    return out
+
+
+def scaled(texts, size, rng):
+    words = [w for text in texts for w in text.split()]
+    out = list(texts)
+    while len(out) < size:
+        out.append(" ".join(rng.choice(words) for _ in range(rng.randint(3, 10))))
+    return out
+
+
+def loop_rank(texts, query, threshold, query_first):
+    """O ciclo de antes: ratio() com cada texto e sort estável."""
+    scored = []
+    for pos, text in enumerate(texts):
+        sim = SequenceMatcher(None, query, text).ratio() if query_first else SequenceMatcher(None, text, query).ratio()
+        if sim > threshold:
+            scored.append((sim, pos))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [pos for _, pos in scored]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LexicalRanker vs ciclo de SequenceMatcher")
+    parser.add_argument("--bots", default="bots")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--query-first", action="store_true", help="ratio(pergunta, texto), como em suggest_categories")
+    parser.add_argument("--scale", type=int, default=0, help="número de textos por índice")
+    parser.add_argument("--queries", type=int, default=500, help="máximo de perguntas de teste por índice")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    groups = load_questions(args.bots)
+    if args.scale:
+        corpus = [q for questions in groups.values() for q in questions]
+        groups = {"scaled": scaled(corpus, args.scale, rng)}
+
+    n = same = same_top = 0
+    t_loop = t_ranker = 0.0
+    for texts in groups.values():
+        ranker = LexicalRanker(texts, query_first=args.query_first)
+        queries = queries_for(texts, rng)
+        rng.shuffle(queries)
+        for query in queries[:args.queries]:
+            t0 = time.perf_counter()
+            expected = loop_rank(texts, query, args.threshold, args.query_first)
+            t1 = time.perf_counter()
+            got = ranker.rank(query, args.threshold)
+            t2 = time.perf_counter()
+            t_loop += t1 - t0
+            t_ranker += t2 - t1
+            n += 1
+            same += got == expected
+            same_top += got[:1] == expected[:1]
+    print(f"{n} perguntas, {len(groups)} índices, {sum(len(t) for t in groups.values())} textos, limiar {args.threshold}")
+    print(f"rank igual ao ciclo: {same}/{n}  top-1 igual: {same_top}/{n}")
+    print(f"ciclo {t_loop / n * 1e3:8.3f} ms/pergunta   LexicalRanker {t_ranker / n * 1e3:8.3f} ms/pergunta")
+
+
+if __name__ == "__main__":
+    main()
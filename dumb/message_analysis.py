@@ -0,0 +1,93 @@
+import re
+import unicodedata
+from typing import List, NamedTuple
+
+from language_id import identify_language
+
+# ========== Normalização ==========
+_WORD_OR_SPACE = re.compile(r'[\w\s]')
+_NOT_WORD_OR_SPACE = re.compile(r'[^\w\s]')
+
+
+def _strip_marks(text: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+
+
+# Tabelas calculadas uma vez com a mesma regra (NFD sem marcas, [^\w\s]): latim
+# com acentos e marcas combinantes soltas, e a pontuação ASCII
+_ACCENTS = {
+    code: _strip_marks(chr(code))
+    for code in (*range(0x80, 0x250), *range(0x300, 0x370), *range(0x1E00, 0x1F00))
+    if _strip_marks(chr(code)) != chr(code)
+}
+_ASCII_PUNCTUATION = {code: None for code in range(128) if not _WORD_OR_SPACE.match(chr(code))}
+# As duas numa só passagem
+_ACCENTS_AND_PUNCTUATION = {**_ACCENTS, **_ASCII_PUNCTUATION}
+
+
+def fold_text(text: str) -> str:
+    """Minúsculas e sem acentuação (o mesmo que NFD e retirar as marcas Mn)."""
+    text = text.lower().translate(_ACCENTS)
+    if not text.isascii():
+        # Carateres fora das tabelas (outros alfabetos): pelo caminho geral
+        text = _strip_marks(text)
+    return text
+
+
+def normalize_text(text: str) -> str:
+    """fold_text sem pontuação e sem espaços nas pontas."""
+    text = text.lower().translate(_ACCENTS_AND_PUNCTUATION)
+    if not text.isascii():
+        text = _NOT_WORD_OR_SPACE.sub('', _strip_marks(text))
+    return text.strip()
+
+
+# ========== Idioma e saudações ==========
+# Saudações que decidem o idioma sem passar pelo classificador
+LANGUAGE_GREETINGS = {
+    "en": {"hi", "hello", "hey", "good morning", "good afternoon", "good evening", "howdy", "greetings", "what's up", "yo", "sup"},
+    "pt": {"oi", "olá", "ola", "bom dia", "boa tarde", "boa noite", "alô", "alo", "e aí", "fala", "boas"},
+}
+GREETINGS = {
+    "pt": {"ola", "olá", "bom dia", "boa tarde", "boa noite", "oi", "alô", "alo", "hey", "boas", "e aí", "fala", "opa", "tudo bem", "beleza"},
+    "en": {"hello", "hi", "good morning", "good afternoon", "good evening", "hey", "howdy", "greetings", "what's up", "yo", "sup", "hiya"},
+}
+
+
+def detect_language(text: str, normalized: str) -> str:
+    if normalized in LANGUAGE_GREETINGS["en"]:
+        return "en"
+    if normalized in LANGUAGE_GREETINGS["pt"]:
+        return "pt"
+    if len(text) < 10:
+        return "pt"
+    return "en" if identify_language(text)[0] == "en" else "pt"
+
+
+def is_greeting(normalized: str, tokens: List[str], lang: str) -> bool:
+    greetings = GREETINGS["en"] if lang == "en" else GREETINGS["pt"]
+    # Só uma saudação curta, como "olá" ou "hi"
+    if normalized in greetings:
+        return True
+    # Frase longa não é saudação
+    if len(tokens) > 3:
+        return False
+    # Começa com uma saudação?
+    return any(normalized.startswith(greet) for greet in greetings)
+
+
+class AnalyzedMessage(NamedTuple):
+    """Uma mensagem já normalizada, com idioma e saudação, calculada uma vez por pedido."""
+    text: str
+    normalized: str
+    tokens: List[str]
+    language: str
+    greeting: bool
+
+
+def analyze_message(text: str) -> AnalyzedMessage:
+    text = text.strip()
+    normalized = normalize_text(text)
+    tokens = normalized.split()
+    language = detect_language(text, normalized)
+    return AnalyzedMessage(text, normalized, tokens, language, is_greeting(normalized, tokens, language))
@@ -0,0 +1,88 @@
+import os
+import logging
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger("onnx_encoder")
+
+# ========== Configuração ==========
+# torch (SentenceTransformer em FP32) ou onnx (grafo exportado e quantizado em int8)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "model_int8.onnx")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", 0))  # 0 = onnxruntime escolhe
+ONNX_MAX_LENGTH = int(os.getenv("ONNX_MAX_LENGTH", 256))
+
+
+def onnx_model_path(model_name: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "_"))
+
+
+class OnnxSentenceEncoder:
+    """Substituto do SentenceTransformer para inferência em CPU com onnxruntime.
+
+    Reproduz o pipeline do all-MiniLM-L6-v2 (transformer, mean pooling e
+    normalização L2) sobre o grafo gerado por export_onnx.py. Expõe só o que
+    os serviços usam: `encode` e `get_sentence_embedding_dimension`.
+    """
+
+    def __init__(self, model_dir: str, model_file: str = ONNX_MODEL_FILE, threads: int = ONNX_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # Um pedido de cada vez (o InferenceExecutor serializa): o paralelismo fica todo dentro do operador
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(model_dir, model_file), options,
+                                            providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, sentences: List[str], convert_to_numpy: bool = True, batch_size: int = 32,
+               normalize_embeddings: bool = True) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        parts = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            tokens = self.tokenizer(batch, padding=True, truncation=True, max_length=ONNX_MAX_LENGTH, return_tensors="np")
+            feeds = {name: tokens[name].astype(np.int64) for name in tokens if name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            # Mean pooling só sobre os tokens reais (sem padding)
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            parts.append(pooled.astype(np.float32))
+        if not parts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.vstack(parts)
+
+
+def load_encoder(model_name: str = "all-MiniLM-L6-v2", backend: str = ENCODER_BACKEND):
+    """Encoder escolhido por ENCODER_BACKEND, com fallback para o PyTorch.
+
+    Cada serviço corre no seu processo, por isso a escolha é por serviço.
+    """
+    if backend == "onnx":
+        model_dir = onnx_model_path(model_name)
+        try:
+            encoder = OnnxSentenceEncoder(model_dir)
+            logger.info(f"Encoder ONNX carregado de {model_dir}")
+            return encoder
+        except Exception as e:
+            logger.warning(f"Encoder ONNX indisponível ({e}); a usar PyTorch. Gerar com: python export_onnx.py {model_name}")
+    elif backend != "torch":
+        logger.warning(f"ENCODER_BACKEND desconhecido: {backend}; a usar PyTorch")
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
@@ -0,0 +1,104 @@
+"""Compara o encoder ONNX int8 com o SentenceTransformer FP32 nas FAQs dos bots.
+
+Paridade: cosseno entre os embeddings das duas versões para cada pergunta e
+concordância do vizinho mais próximo. Termina com código 1 se o cosseno
+mínimo ficar abaixo de --min-cosine. Com --bench mede também a latência.
+
+Uso (a partir da pasta dumb/, depois de python export_onnx.py):
+    python onnx_parity.py --bench
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+from onnx_encoder import OnnxSentenceEncoder, onnx_model_path
+
+BOTS_FOLDER = "bots"
+
+
+def load_faq_questions(paths):
+    questions = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split("\t")
+                if len(parts) == 2 and parts[0]:
+                    questions.append(parts[0])
+    return questions
+
+
+def parity(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    cosines = np.sum(reference * candidate, axis=1)
+    # Vizinho mais próximo de cada pergunta entre as restantes, nas duas versões
+    ref_sims = reference @ reference.T
+    cand_sims = candidate @ candidate.T
+    np.fill_diagonal(ref_sims, -np.inf)
+    np.fill_diagonal(cand_sims, -np.inf)
+    top1 = np.mean(ref_sims.argmax(axis=1) == cand_sims.argmax(axis=1)) if len(reference) > 1 else 1.0
+    return {
+        "questions": len(reference),
+        "cosine_min": float(cosines.min()),
+        "cosine_mean": float(cosines.mean()),
+        "cosine_p01": float(np.percentile(cosines, 1)),
+        "top1_agreement": float(top1),
+    }
+
+
+def latency(encoder, sentences, batch_size: int, repeats: int) -> dict:
+    encoder.encode(sentences[:batch_size], batch_size=batch_size)  # aquecimento
+    timings = []
+    for i in range(repeats):
+        start = (i * batch_size) % max(len(sentences) - batch_size, 1)
+        batch = sentences[start:start + batch_size]
+        t0 = time.perf_counter()
+        encoder.encode(batch, batch_size=batch_size)
+        timings.append((time.perf_counter() - t0) * 1000)
+    cuts = statistics.quantiles(timings, n=100)
+    return {"p50_ms": round(cuts[49], 2), "p95_ms": round(cuts[94], 2),
+            "sentences_per_s": round(batch_size * 1000 / statistics.mean(timings), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridade e latência do encoder ONNX int8")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--faq", nargs="*", help="ficheiros pergunta<TAB>resposta (por omissão os dos bots)")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    paths = args.faq or sorted(glob.glob(os.path.join(BOTS_FOLDER, "*", "*_qa_*.txt")))
+    questions = load_faq_questions(paths)
+    if not questions:
+        sys.exit("Nenhuma pergunta encontrada")
+
+    reference = SentenceTransformer(args.model, device="cpu")
+    candidate = OnnxSentenceEncoder(onnx_model_path(args.model))
+
+    ref_emb = reference.encode(questions, convert_to_numpy=True, normalize_embeddings=True)
+    cand_emb = candidate.encode(questions)
+    result = parity(ref_emb, cand_emb)
+    print(f"Paridade ({len(paths)} ficheiros): {result}")
+
+    if args.bench:
+        for batch_size in (1, 8, 32):
+            torch_stats = latency(reference, questions, batch_size, args.repeats)
+            onnx_stats = latency(candidate, questions, batch_size, args.repeats)
+            speedup = torch_stats["p50_ms"] / onnx_stats["p50_ms"] if onnx_stats["p50_ms"] else 0
+            print(f"batch={batch_size:>2}  torch {torch_stats}  onnx-int8 {onnx_stats}  speedup p50 x{speedup:.2f}")
+
+    if result["cosine_min"] < args.min_cosine:
+        print(f"❌ Cosseno mínimo {result['cosine_min']:.4f} < {args.min_cosine}")
+        sys.exit(1)
+    print("✅ Paridade dentro do limite")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from faq_source import fetch_chatbots
+
+logger = logging.getLogger("prewarm")
+
+# ========== Configuração ==========
+# active: chatbots com estado ativo na tabela Chatbot; "" desativa; ou uma lista "1,2,3"
+PREWARM_CHATBOTS = os.getenv("PREWARM_CHATBOTS", "active")
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", 4))
+PREWARM_ACTIVE_STATES = {s.strip().lower() for s in os.getenv("PREWARM_ACTIVE_STATES", "ativo,active").split(",")}
+
+
+async def fetch_active_chatbot_ids() -> List[str]:
+    """chatbot_id dos chatbots com `estado` ativo (tabela Chatbot), pela fonte de FAQ_SOURCE."""
+    return [
+        str(chatbot["chatbot_id"]) for chatbot in await fetch_chatbots()
+        if str(chatbot.get("estado", "")).strip().lower() in PREWARM_ACTIVE_STATES
+    ]
+
+
+async def configured_chatbot_ids() -> List[str]:
+    if not PREWARM_CHATBOTS.strip():
+        return []
+    if PREWARM_CHATBOTS.strip().lower() == "active":
+        return await fetch_active_chatbot_ids()
+    return [chatbot_id.strip() for chatbot_id in PREWARM_CHATBOTS.split(",") if chatbot_id.strip()]
+
+
+class Prewarmer:
+    """Constrói as caches dos chatbots ativos no arranque, antes do primeiro pedido.
+
+    Corre em background com no máximo `concurrency` construções ao mesmo tempo
+    (o modelo é um só; o paralelismo serve sobretudo para sobrepor os pedidos
+    ao backend). `ready` só fica True quando todas terminaram, com sucesso ou
+    não: um chatbot que falhe fica registado em `failed` e volta a ser tentado
+    no primeiro pedido, como antes. `warmup` (opcional) corre primeiro, p.ex.
+    uma codificação para aquecer o modelo.
+    """
+
+    def __init__(self, caches, list_chatbots: Callable[[], Awaitable[List[str]]] = configured_chatbot_ids,
+                 warmup: Optional[Callable[[], Awaitable[None]]] = None, concurrency: int = PREWARM_CONCURRENCY):
+        self.caches = caches
+        self.list_chatbots = list_chatbots
+        self.warmup = warmup
+        self.concurrency = max(1, concurrency)
+        self.ready = False
+        self.chatbots: List[str] = []
+        self.loaded: List[str] = []
+        self.failed: dict = {}
+        self.started_at: Optional[float] = None
+        self.duration_s: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        started = time.perf_counter()
+        try:
+            if self.warmup is not None:
+                await self.warmup()
+            self.chatbots = await self.list_chatbots()
+        except Exception as e:
+            # Sem lista não há nada a aquecer: o serviço arranca em modo lazy
+            logger.error(f"Prewarm: não foi possível obter a lista de chatbots: {e}")
+            self.failed["*"] = str(e)
+        else:
+            logger.info(f"Prewarm: {len(self.chatbots)} chatbots, {self.concurrency} de cada vez")
+            semaphore = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(self._load(chatbot_id, semaphore) for chatbot_id in self.chatbots))
+        self.duration_s = round(time.perf_counter() - started, 3)
+        self.ready = True
+        logger.info(f"Prewarm concluído em {self.duration_s}s: {len(self.loaded)} prontos, {len(self.failed)} falhados")
+
+    async def _load(self, chatbot_id: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                await self.caches.get(chatbot_id)
+                self.loaded.append(chatbot_id)
+            except Exception as e:
+                self.failed[chatbot_id] = str(e)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "chatbots": len(self.chatbots),
+            "loaded": len(self.loaded),
+            "failed": self.failed,
+            "started_at": self.started_at,
+            "duration_s": self.duration_s,
+        }
@@ -0,0 +1,137 @@
+"""Servidor multi-processo para as APIs dumb.
+
+Importa o módulo da API uma só vez (o SentenceTransformer é carregado nesse
+import) e só depois faz fork dos workers, que partilham o modelo em
+copy-on-write. As matrizes de embeddings e os índices FAISS vão para
+EMBEDDINGS_DIR e cada worker faz mmap dos mesmos ficheiros. O diretório por
+omissão (em /dev/shm, por porta) é apagado quando o servidor termina; um
+--embeddings-dir/EMBEDDINGS_DIR explícito fica como está.
+
+Uso (a partir da pasta dumb/):
+    python serve.py dumb_api_bd:app --workers 4 --port 8000
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import shutil
+import importlib
+import tempfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve uma API dumb com vários workers pre-fork")
+    parser.add_argument("app", help="módulo:atributo, ex. dumb_api_bd:app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=1, help="threads do torch por worker")
+    parser.add_argument("--embeddings-dir", default=os.getenv("EMBEDDINGS_DIR"),
+                        help="diretório partilhado para embeddings/índices (por omissão /dev/shm/dumb_embeddings-<porta>)")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+
+def default_embeddings_dir(port: int) -> str:
+    # Um por porta: apagá-lo no fim não mexe nos ficheiros de outro servidor na mesma máquina
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"dumb_embeddings-{port}")
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, threads: int, log_level: str):
+    import uvicorn
+
+    try:
+        import torch
+        # Sem isto cada worker usa todos os cores e competem entre si
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    args = parse_args()
+
+    # Tem de estar definido antes do import: os módulos leem-no ao carregar
+    os.environ["EMBEDDINGS_DIR"] = args.embeddings_dir or default_embeddings_dir(args.port)
+    # Os tokenizers usam threads; depois do fork só dariam avisos e deadlocks
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    if args.workers > 1 and os.getenv("SESSION_BACKEND", "memory") == "memory":
+        print("⚠️ SESSION_BACKEND=memory com vários workers: o feedback negativo pode cair noutro worker. "
+              "Use SESSION_BACKEND=sqlite ou redis.", file=sys.stderr)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    module_name, _, attr = args.app.partition(":")
+    app = getattr(importlib.import_module(module_name), attr or "app")
+    sock = bind_socket(args.host, args.port)
+
+    # Objetos do import passam para a geração permanente: o GC dos workers não
+    # lhes toca e as páginas continuam partilhadas
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                run_worker(app, sock, args.threads, args.log_level)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for slot in range(args.workers):
+        spawn(slot)
+    print(f"{args.workers} workers de {args.app} em {args.host}:{args.port} (EMBEDDINGS_DIR={os.environ['EMBEDDINGS_DIR']})")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"Worker {pid} terminou (estado {status}); a reiniciar", file=sys.stderr)
+            time.sleep(1)
+            spawn(slot)
+
+    if not args.embeddings_dir:
+        # Em /dev/shm os ficheiros ocupam RAM até serem apagados
+        shutil.rmtree(os.environ["EMBEDDINGS_DIR"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger("session_store")
+
+# ========== Configuração ==========
+# memory (por processo), sqlite (ficheiro partilhado) ou redis (qualquer servidor com protocolo Redis)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_MAX = int(os.getenv("SESSION_MAX", 10000))
+SESSION_TTL = float(os.getenv("SESSION_TTL", 1800))
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_REDIS_PREFIX = os.getenv("SESSION_REDIS_PREFIX", "dumb:session:")
+# Leituras/escritas que chegam dentro desta janela (s) vão no mesmo lote
+SESSION_BATCH_WINDOW = float(os.getenv("SESSION_BATCH_WINDOW", 0.002))
+SESSION_BATCH_MAX = int(os.getenv("SESSION_BATCH_MAX", 256))
+# Formato do registo nos backends partilhados; registos de outro formato perdem as referências
+SESSION_RECORD_FORMAT = 2
+
+
+def pack_ref(group: int, item: int) -> int:
+    """Referência compacta a uma resposta: grupo (categoria) nos bits altos, id da FAQ (faq_ref_id) nos baixos."""
+    return (group << 32) | item
+
+
+def unpack_ref(ref: int):
+    return ref >> 32, ref & 0xFFFFFFFF
+
+
+def faq_ref_id(faq_id, question: str) -> int:
+    """Id de uma FAQ para as referências: o faq_id, ou um hash da pergunta se o backend não o enviar.
+
+    Ao contrário da posição no bloco da categoria, não muda com atualizações
+    incrementais nem reloads, e é o mesmo em todos os workers.
+    """
+    if faq_id is not None:
+        return int(faq_id)
+    return zlib.crc32(question.encode("utf-8"))
+
+
+def find_faq(faq_ids: List, questions: List[str], ref_id: int) -> Optional[int]:
+    """Posição atual no bloco da FAQ com este faq_ref_id, ou None se já lá não estiver."""
+    for pos, (faq_id, question) in enumerate(zip(faq_ids, questions)):
+        if faq_ref_id(faq_id, question) == ref_id:
+            return pos
+    return None
+
+
+class SessionState:
+    """Estado de conversa de uma sessão.
+
+    Em vez do texto das respostas guarda referências (categoria, id da FAQ),
+    empacotadas num array de inteiros, que cada API resolve contra a sua cache.
+    `language` é o idioma em que essas respostas foram encontradas.
+    """
+    __slots__ = ("language", "last_question", "answer_refs", "last_answer_index",
+                 "negative_feedback_count", "touched_at")
+
+    def __init__(self, language: str):
+        self.language = language
+        self.last_question = ""
+        self.answer_refs = array("q")
+        self.last_answer_index = 0
+        self.negative_feedback_count = 0
+        self.touched_at = 0.0
+
+    def set_answers(self, refs: Iterable[int], language: str):
+        self.answer_refs = array("q", refs)
+        self.last_answer_index = 0
+        self.language = language
+
+    def clear_answers(self):
+        self.answer_refs = array("q")
+        self.last_answer_index = 0
+
+    def next_ref(self) -> Optional[int]:
+        """Avança para a resposta alternativa seguinte, se houver."""
+        idx = self.last_answer_index + 1
+        if idx < len(self.answer_refs):
+            self.last_answer_index = idx
+            return self.answer_refs[idx]
+        return None
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.answer_refs) + sys.getsizeof(self.last_question)
+
+    def to_record(self) -> str:
+        """Forma serializada usada pelos backends partilhados."""
+        return json.dumps([SESSION_RECORD_FORMAT, self.language, self.last_question, self.answer_refs.tolist(),
+                           self.last_answer_index, self.negative_feedback_count],
+                          ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_record(cls, record: str) -> "SessionState":
+        fields = json.loads(record)
+        if fields[0] != SESSION_RECORD_FORMAT:
+            # Registo antigo, com posições em vez de ids: as referências já não valem
+            state = cls(fields[0])
+            state.last_question = fields[1]
+            return state
+        _, language, last_question, refs, last_answer_index, negative_feedback_count = fields
+        state = cls(language)
+        state.last_question = last_question
+        state.answer_refs = array("q", refs)
+        state.last_answer_index = last_answer_index
+        state.negative_feedback_count = negative_feedback_count
+        return state
+
+
+class SessionStore:
+    """Sessões em memória com limite de tamanho, expiração por inatividade e LRU.
+
+    O OrderedDict está ordenado por último acesso, por isso as sessões mais
+    antigas (as primeiras a expirar) estão sempre no início.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl: float = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.evictions = {"lru": 0, "ttl": 0}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str, language: str) -> SessionState:
+        """Devolve a sessão (criando-a se for nova) e marca-a como usada agora."""
+        now = time.monotonic()
+        self._expire(now)
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = SessionState(language)
+            self._sessions[session_id] = state
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions["lru"] += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        state.touched_at = now
+        return state
+
+    def pop(self, session_id: str) -> Optional[SessionState]:
+        return self._sessions.pop(session_id, None)
+
+    def _expire(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.touched_at <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.evictions["ttl"] += 1
+
+    def memory_usage(self) -> dict:
+        self._expire(time.monotonic())
+        sessions_bytes = sum(sys.getsizeof(sid) + state.nbytes() for sid, state in self._sessions.items())
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_s": self.ttl,
+            "bytes": sys.getsizeof(self._sessions) + sessions_bytes,
+            "evictions": dict(self.evictions),
+        }
+
+    # Interface comum com SharedSessionStore: em memória o estado é alterado no lugar
+    async def load(self, session_id: str, language: str) -> SessionState:
+        return self.get(session_id, language)
+
+    async def save(self, session_id: str, state: SessionState):
+        pass
+
+    async def close(self):
+        pass
+
+
+class Batch:
+    """Junta operações concorrentes sobre sessões numa só ida ao backend.
+
+    `run` recebe {session_id: valor} e devolve {session_id: resultado}. Pedidos
+    repetidos para a mesma sessão partilham o resultado (nas escritas fica o
+    último valor).
+    """
+
+    def __init__(self, run: Callable[[dict], Awaitable[dict]],
+                 window: float = SESSION_BATCH_WINDOW, max_size: int = SESSION_BATCH_MAX):
+        self.run = run
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.items = 0
+        self._values: dict = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def submit(self, key: str, value=None):
+        loop = asyncio.get_running_loop()
+        if self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        self._values[key] = value
+        future = self._futures.get(key)
+        if future is None:
+            future = self._futures[key] = loop.create_future()
+        if len(self._values) >= self.max_size:
+            self._flush()
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        values, futures = self._values, self._futures
+        self._values, self._futures = {}, {}
+        if values:
+            task = asyncio.create_task(self._run(values, futures))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, values: dict, futures: Dict[str, asyncio.Future]):
+        try:
+            results = await self.run(values)
+        except Exception as e:
+            logger.error(f"Erro no lote de {len(values)} sessões: {e}")
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(values)
+        for key, future in futures.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+class SqliteSessionBackend:
+    """Sessões num ficheiro SQLite (WAL) partilhado pelos workers da mesma máquina.
+
+    A ligação só é aberta no primeiro uso e é uma por processo: o store é
+    criado ao importar a app, antes do fork dos workers (serve.py), e o SQLite
+    não permite usar no filho uma ligação aberta no pai.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Chamado com self._lock
+        if self._pid != os.getpid():
+            # A ligação herdada do pai (se houver) não é usada nem fechada aqui
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _get_many(self, session_ids: List[str]) -> Dict[str, str]:
+        placeholders = ",".join("?" * len(session_ids))
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT session_id, data FROM sessions WHERE session_id IN ({placeholders}) AND expires_at > ?",
+                (*session_ids, time.time())
+            ).fetchall()
+        return dict(rows)
+
+    def _set_many(self, records: Dict[str, str], ttl: float):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)",
+                [(session_id, data, now + ttl) for session_id, data in records.items()]
+            )
+            # As sessões expiradas já não são lidas; a limpeza física pode esperar
+            if now - self._purged_at > 60:
+                conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                self._purged_at = now
+            conn.execute("COMMIT")
+
+    async def get_many(self, session_ids: List[str]) -> Dict[str, str]:
+        return await asyncio.to_thread(self._get_many, session_ids)
+
+    async def set_many(self, records: Dict[str, str], ttl: float):
+        await asyncio.to_thread(self._set_many, records, ttl)
+
+    async def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = self._pid = None
+
+
+class RedisSessionBackend:
+    """Sessões num servidor que fale o protocolo Redis (RESP), sem dependências extra.
+
+    Usa uma ligação com pipelining: um lote de leituras é um MGET e um lote de
+    escritas são vários SET ... EX enviados de uma vez.
+    """
+    name = "redis"
+
+    def __init__(self, url: str = SESSION_REDIS_URL, prefix: str = SESSION_REDIS_PREFIX):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Ligação ao servidor de sessões fechada")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            # Devolvido, não lançado: _pipeline tem de ler as respostas que faltam
+            return RuntimeError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = await self._reader.readexactly(size + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            size = int(payload)
+            return None if size < 0 else [await self._read_reply() for _ in range(size)]
+        # Fora do protocolo: a ligação já não está alinhada com os pedidos
+        raise ConnectionError(f"Resposta RESP inesperada: {line!r}")
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            await self._pipeline(setup)
+
+    async def _pipeline(self, commands: list) -> list:
+        self._writer.write(b"".join(self._encode(*command) for command in commands))
+        await self._writer.drain()
+        # Todas as respostas são lidas antes de lançar um erro (ex.: -ERR de AUTH
+        # ou WRONGTYPE); senão ficariam para o comando seguinte
+        replies = [await self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RuntimeError):
+                raise reply
+        return replies
+
+    async def _execute(self, commands: list) -> list:
+        async with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._writer is None or self._writer.is_closing():
+                        await self._connect()
+                    return await self._pipeline(commands)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    # Ligação perdida (ex.: servidor reiniciado): tenta uma vez com ligação nova
+                    await self._drop()
+                    if attempt == 2:
+                        raise
+                except BaseException:
+                    # Erro do servidor ou pedido cancelado a meio do pipeline: pode
+                    # haver respostas por ler, por isso a ligação não é reutilizada
+                    await self._drop()
+                    raise
+
+    async def _drop(self):
+        # Esquecida antes de esperar pelo fecho, que também pode ser cancelado
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def get_many(self, session_ids: List[str]) -> Dict[str, str]:
+        (values,) = await self._execute([("MGET", *(self.prefix + sid for sid in session_ids))])
+        return {sid: value for sid, value in zip(session_ids, values) if value is not None}
+
+    async def set_many(self, records: Dict[str, str], ttl: float):
+        await self._execute([
+            ("SET", self.prefix + sid, data, "EX", max(1, int(ttl)))
+            for sid, data in records.items()
+        ])
+
+    async def close(self):
+        async with self._lock:
+            await self._drop()
+
+
+class SharedSessionStore:
+    """Sessões guardadas fora do processo, para vários workers ou máquinas.
+
+    Cada pedido lê o estado no início (`load`) e grava-o no fim (`save`); as
+    leituras e escritas concorrentes são agrupadas em lotes e cada escrita
+    renova o TTL de inatividade da sessão.
+    """
+
+    def __init__(self, backend, ttl: float = SESSION_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._reads = Batch(self._read_batch)
+        self._writes = Batch(self._write_batch)
+
+    async def _read_batch(self, values: dict) -> dict:
+        return await self.backend.get_many(list(values))
+
+    async def _write_batch(self, values: dict) -> dict:
+        await self.backend.set_many(values, self.ttl)
+        return {}
+
+    async def load(self, session_id: str, language: str) -> SessionState:
+        record = await self._reads.submit(session_id)
+        return SessionState.from_record(record) if record else SessionState(language)
+
+    async def save(self, session_id: str, state: SessionState):
+        await self._writes.submit(session_id, state.to_record())
+
+    def memory_usage(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "ttl_s": self.ttl,
+            "reads": {"batches": self._reads.batches, "items": self._reads.items},
+            "writes": {"batches": self._writes.batches, "items": self._writes.items},
+        }
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_session_store(backend: str = SESSION_BACKEND):
+    """Store de sessões escolhido por SESSION_BACKEND."""
+    if backend == "memory":
+        return SessionStore()
+    if backend == "sqlite":
+        return SharedSessionStore(SqliteSessionBackend())
+    if backend == "redis":
+        return SharedSessionStore(RedisSessionBackend())
+    raise ValueError(f"SESSION_BACKEND desconhecido: {backend}")
@@ -1,15 +1,21 @@
 import sys
-import httpx
-import unicodedata
-from langdetect import detect, detect_langs
-from difflib import SequenceMatcher
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from starlette.middleware.cors import CORSMiddleware
 import logging
-import asyncio
+from contextlib import asynccontextmanager
 from typing import Dict, List, Tuple, Optional
+from http_client import start_http_client, close_http_client
+from chatbot_cache import ChatbotCache
+from prewarm import Prewarmer
+from faq_source import load_chatbot_faqs, close_data_source
+from keyword_matcher import KeywordMatcher
+from message_analysis import fold_text
+from language_id import identify_language
+from lexical_ranker import LexicalRanker
+from session_store import create_session_store, faq_ref_id, find_faq, pack_ref, unpack_ref
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,7 +26,17 @@ logging.basicConfig(
 logger = logging.getLogger("dumb_api_bd")
 logger.info("Logger configurado e pronto!")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_http_client()
+    prewarm.start()
+    yield
+    await prewarm.stop()
+    await conversation_states.close()
+    await close_data_source()
+    await close_http_client()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -34,55 +50,54 @@ model = SentenceTransformer("all-MiniLM-L6-v2")
 
 # ────────────────────────────── CACHES EM MEMÓRIA ───────────────────────────── #
 
-data_cache: Dict[str, dict] = {}
-conversation_states: Dict[str, dict] = {}
+# data_cache (por chatbot) é criado junto de build_chatbot_cache
+conversation_states = create_session_store()
 
 # ────────────────────────────── FUNÇÕES UTILITÁRIAS ─────────────────────────── #
 
 def normalize_text(text: str) -> str:
     """Lowercase e remove acentuação para comparações aproximadas."""
-    return ''.join(
-        c for c in unicodedata.normalize('NFD', text.lower())
-        if unicodedata.category(c) != 'Mn'
-    )
-
-def similarity(a: str, b: str) -> float:
-    """Similaridade aproximada usando SequenceMatcher."""
-    return SequenceMatcher(None, a, b).ratio()
-
-def detect_categories(user_input: str, category_keywords: Dict[int, List[str]]) -> List[int]:
-    norm_input = normalize_text(user_input)
-    return [
-        cid for cid, kws in category_keywords.items()
-        if any(kw in norm_input for kw in kws)
-    ]
-
-def find_answers_ranked(user_input: str, questions: List[str], answers: List[str]) -> List[str]:
-    user_norm = normalize_text(user_input)
-    scored: List[Tuple[float, str]] = []
-    for q, a in zip(questions, answers):
-        sim = similarity(normalize_text(q), user_norm)
-        if sim > 0.3:
-            scored.append((sim, a))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [a for _, a in scored]
-
-def is_feedback_negativo(user_input: str, lang: str, category_keywords: Dict[int, List[str]], feedback_negativo_ids: Dict[str, Optional[int]]) -> bool:
+    return fold_text(text)
+
+def detect_categories(user_input: str, keyword_matcher: KeywordMatcher) -> List[int]:
+    return keyword_matcher.find(normalize_text(user_input))
+
+def find_answers_ranked(user_input: str, question_ranker: LexicalRanker) -> List[int]:
+    """Posições das perguntas semelhantes ao input, da mais para a menos parecida."""
+    return question_ranker.rank(normalize_text(user_input), 0.3)
+
+def resolve_answer(cache: dict, lang: str, ref: int) -> Optional[str]:
+    """Texto da resposta guardada na sessão como referência (categoria, id da FAQ)."""
+    cid, ref_id = unpack_ref(ref)
+    key = (cid, lang)
+    pos = find_faq(cache["faq_ids_by_category"].get(key, []), cache["questions_by_category"].get(key, []), ref_id)
+    return cache["answers_by_category"][key][pos] if pos is not None else None
+
+def is_feedback_negativo(user_input: str, lang: str, keyword_matcher: KeywordMatcher, feedback_negativo_ids: Dict[str, Optional[int]]) -> bool:
     fb_id = feedback_negativo_ids.get(lang)
     if fb_id is None:
         return False
-    norm = normalize_text(user_input)
-    return any(k in norm for k in category_keywords.get(fb_id, []))
-
-def suggest_categories(user_input: str, category_keywords: Dict[int, List[str]], cat_names: Dict[int, str], k: int = 3) -> List[str]:
-    norm_in = normalize_text(user_input)
-    scored: List[Tuple[float, int]] = []
-    for cid, kws in category_keywords.items():
-        tokens = [cat_names.get(cid, "")] + kws
-        best = max((similarity(norm_in, normalize_text(t)) for t in tokens), default=0.0)
-        scored.append((best, cid))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [cat_names[cid] for score, cid in scored[:k] if score >= 0.10]
+    return keyword_matcher.matches(normalize_text(user_input), fb_id)
+
+def build_category_suggestions(category_keywords: Dict[int, List[str]], cat_names: Dict[int, str]) -> dict:
+    """Nome e keywords de todas as categorias num só índice; `groups` diz a categoria de cada um."""
+    cids = list(category_keywords)
+    tokens, groups = [], []
+    for i, cid in enumerate(cids):
+        for t in [cat_names.get(cid, "")] + category_keywords[cid]:
+            tokens.append(normalize_text(t))
+            groups.append(i)
+    # Como antes, ratio(pergunta, keyword)
+    return {"ranker": LexicalRanker(tokens, query_first=True), "groups": np.array(groups, dtype=np.int64), "cids": cids}
+
+def suggest_categories(user_input: str, suggestions: dict, cat_names: Dict[int, str], k: int = 3) -> List[str]:
+    # Abaixo de 0.10 nenhuma categoria é sugerida, por isso nem se comparam
+    scores = suggestions["ranker"].scores(normalize_text(user_input), 0.10)
+    # Melhor semelhança de cada categoria (nome ou keyword) numa só operação
+    best = np.zeros(len(suggestions["cids"]), dtype=np.float64)
+    np.maximum.at(best, suggestions["groups"], scores)
+    top = np.argsort(-best, kind="stable")[:k]
+    return [cat_names[suggestions["cids"][i]] for i in top if best[i] >= 0.10]
 
 # ───────────────────────────── MODELOS Pydantic ─────────────────────────────── #
 
@@ -94,29 +109,71 @@ class MessageRequest(BaseModel):
 
 # ─────────────────────────── FUNÇÕES DE BACKEND API ─────────────────────────── #
 
-async def fetch_categories(chatbot_id: str):
-    url = f"http://localhost:3004/chatbot-categoria/{int(chatbot_id)}"
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url)
-        if resp.status_code != 200:
-            raise HTTPException(resp.status_code, f"Erro ao buscar categorias: {resp.text}")
-        return resp.json()
-
-async def fetch_faq_data(chatbot_id: int):
-    cats = await fetch_categories(str(chatbot_id))
-    faqs: List[dict] = []
-    async with httpx.AsyncClient() as client:
-        tasks = [client.get(f"http://localhost:3004/faq-categoria/?categoria_id={c['categoria_id']}") for c in cats]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        for r in results:
-            if isinstance(r, Exception):
-                logger.error(f"Erro FAQ: {r}")
-                continue
-            if r.status_code != 200:
-                logger.error(f"FAQ {r.status_code}: {r.text}")
-                continue
-            faqs.extend(r.json())
-    return faqs
+# Categorias e FAQs vêm de faq_source.load_chatbot_faqs (FAQ_SOURCE=backend|bulk)
+
+
+# ─────────────────────────── CONSTRUÇÃO DA CACHE ──────────────────────────── #
+
+async def build_chatbot_cache(chatbot_id: str) -> dict:
+    cats, faqs = await load_chatbot_faqs(chatbot_id)
+
+    category_keywords: Dict[int, List[str]] = {}
+    feedback_ids: Dict[str, Optional[int]] = {"pt": None, "en": None}
+    cat_names = {}
+
+    for c in cats:
+        cid = c["categoria_id"]
+        kws = c.get("categoria", {}).get("keywords", [])
+        category_keywords[cid] = [normalize_text(k) for k in kws]
+        cat_names[cid] = c.get("categoria", {}).get("nome", f"Categoria {cid}")
+        if cid == 999:
+            feedback_ids["pt"] = cid
+        elif cid == 998:
+            feedback_ids["en"] = cid
+
+    q_by_cat: Dict[Tuple[int, str], List[str]] = {}
+    a_by_cat: Dict[Tuple[int, str], List[str]] = {}
+    ids_by_cat: Dict[Tuple[int, str], List[Optional[int]]] = {}
+
+    for f in faqs:
+        cid = f["categoria_id"]
+        faq = f.get("faq", {})
+        q = faq.get("pergunta", "").strip()
+        a = faq.get("resposta", "").strip()
+        lang_raw = normalize_text(faq.get("idioma", "pt"))
+        idioma = "pt" if lang_raw.startswith("pt") else "en"
+        if not q or not a:
+            continue
+        key = (cid, idioma)
+        q_by_cat.setdefault(key, []).append(q)
+        a_by_cat.setdefault(key, []).append(a)
+        ids_by_cat.setdefault(key, []).append(f.get("faq_id") or faq.get("faq_id"))
+
+    return {
+        "category_keywords": category_keywords,
+        "keyword_matcher": KeywordMatcher(category_keywords),
+        "category_suggestions": build_category_suggestions(category_keywords, cat_names),
+        "questions_by_category": q_by_cat,
+        # Perguntas normalizadas e indexadas uma vez, não a cada pedido
+        "question_rankers": {key: LexicalRanker([normalize_text(q) for q in qs]) for key, qs in q_by_cat.items()},
+        "answers_by_category": a_by_cat,
+        # Para as referências guardadas na sessão (faq_ref_id)
+        "faq_ids_by_category": ids_by_cat,
+        "feedback_negativo_ids": feedback_ids,
+        "cat_names": cat_names,
+    }
+
+def describe_chatbot_cache(cache: dict) -> dict:
+    return {
+        "categories": len(cache["category_keywords"]),
+        "faqs": sum(len(q) for q in cache["questions_by_category"].values()),
+    }
+
+# Um único builder por chatbot_id, mesmo com pedidos concorrentes
+chatbot_caches = ChatbotCache(build_chatbot_cache, describe_chatbot_cache)
+data_cache: Dict[str, dict] = chatbot_caches.entries
+# Caches dos chatbots ativos construídas no arranque (PREWARM_CHATBOTS), não no primeiro pedido
+prewarm = Prewarmer(chatbot_caches)
 
 
 def detectar_idioma(texto: str) -> str:
@@ -127,15 +184,36 @@ def detectar_idioma(texto: str) -> str:
     texto = texto.strip()
     if len(texto) < 10:
         return "pt"
-    try:
-        idiomas = detect_langs(texto)
-        for lang_prob in idiomas:
-            if lang_prob.lang == "en" and lang_prob.prob > 0.90:
-                return "en"
-        return "pt"
-    except Exception as e:
-        logger.warning(f"Falha ao detectar idioma: {e}")
-        return "pt"
+    lang, confianca = identify_language(texto)
+    return "en" if lang == "en" and confianca > 0.90 else "pt"
+# ───────────────────────────────── RELOAD DA CACHE ─────────────────────────── #
+
+@app.post("/reload/{chatbot_id}")
+async def reload_chatbot(chatbot_id: str, wait: bool = False):
+    """Reconstrói a cache do chatbot em background; o tráfego continua na versão anterior."""
+    future = chatbot_caches.reload(chatbot_id.strip())
+    if wait:
+        try:
+            await chatbot_caches.wait(future)
+        except Exception as e:
+            raise HTTPException(502, f"Erro ao recarregar o chatbot {chatbot_id}: {e}")
+    return chatbot_caches.status(chatbot_id.strip())
+
+@app.get("/reload/{chatbot_id}")
+async def reload_status(chatbot_id: str):
+    return chatbot_caches.status(chatbot_id.strip())
+
+@app.get("/ready")
+async def ready():
+    """Readiness: só responde 200 depois do prewarm das caches dos chatbots ativos."""
+    if not prewarm.ready:
+        raise HTTPException(503, prewarm.status())
+    return prewarm.status()
+
+@app.get("/sessions/stats")
+async def sessions_stats():
+    return conversation_states.memory_usage()
+
 # ───────────────────────────────── ENDPOINT PRINCIPAL ───────────────────────── #
 
 @app.post("/chat_dumb")
@@ -155,109 +233,66 @@ async def chat(req: MessageRequest):
     lang = detectar_idioma(user_input)
 
 
-    # ─── Reset cache se force_reload ───
-    if req.force_reload and chatbot_id in data_cache:
-        del data_cache[chatbot_id]
-
-    # ─── Lazy‑load cache ───
-    if chatbot_id not in data_cache:
-        cats = await fetch_categories(chatbot_id)
-        faqs = await fetch_faq_data(int(chatbot_id))
-
-        category_keywords: Dict[int, List[str]] = {}
-        feedback_ids: Dict[str, Optional[int]] = {"pt": None, "en": None}
-        cat_names = {}
-
-        for c in cats:
-            cid = c["categoria_id"]
-            kws = c.get("categoria", {}).get("keywords", [])
-            category_keywords[cid] = [normalize_text(k) for k in kws]
-            cat_names[cid] = c.get("categoria", {}).get("nome", f"Categoria {cid}")
-            if cid == 999:
-                feedback_ids["pt"] = cid
-            elif cid == 998:
-                feedback_ids["en"] = cid
-
-        q_by_cat: Dict[Tuple[int, str], List[str]] = {}
-        a_by_cat: Dict[Tuple[int, str], List[str]] = {}
-
-        for f in faqs:
-            cid = f["categoria_id"]
-            faq = f.get("faq", {})
-            q = faq.get("pergunta", "").strip()
-            a = faq.get("resposta", "").strip()
-            lang_raw = normalize_text(faq.get("idioma", "pt"))
-            idioma = "pt" if lang_raw.startswith("pt") else "en"
-            if not q or not a:
-                continue
-            key = (cid, idioma)
-            q_by_cat.setdefault(key, []).append(q)
-            a_by_cat.setdefault(key, []).append(a)
-
-        data_cache[chatbot_id] = {
-            "category_keywords": category_keywords,
-            "questions_by_category": q_by_cat,
-            "answers_by_category": a_by_cat,
-            "feedback_negativo_ids": feedback_ids,
-            "cat_names": cat_names,
-        }
+    # ─── force_reload: reconstrói em background, este pedido usa a versão atual ───
+    if req.force_reload:
+        chatbot_caches.reload(chatbot_id)
+
+    cache = await chatbot_caches.get(chatbot_id)
 
-    # ─── Carrega variáveis do cache ───
-    cache = data_cache[chatbot_id]
-    category_keywords = cache["category_keywords"]
-    q_by_cat = cache["questions_by_category"]
+    # ─── Estado de sessão (lido no início, gravado no fim) ───
+    state = await conversation_states.load(session_id, lang)
+    try:
+        return await respond(user_input, lang, cache, state)
+    finally:
+        # Com um backend partilhado o próximo pedido da sessão pode ir para outro worker
+        await conversation_states.save(session_id, state)
+
+async def respond(user_input: str, lang: str, cache: dict, state) -> dict:
+    # ─── Carrega variáveis do cache (single-flight) ───
+    keyword_matcher = cache["keyword_matcher"]
+    question_rankers = cache["question_rankers"]
     a_by_cat = cache["answers_by_category"]
     feedback_ids = cache["feedback_negativo_ids"]
     cat_names = cache["cat_names"]
 
-    # ─── Estado de sessão ───
-    if session_id not in conversation_states:
-        conversation_states[session_id] = {
-            "language": lang,
-            "last_possible_answers": [],
-            "last_answer_index": 0,
-            "last_question": "",
-        }
-    state = conversation_states[session_id]
-
     # ─── Feedback negativo? ───
-    if is_feedback_negativo(user_input, lang, category_keywords, feedback_ids):
-        idx = state.get("last_answer_index", 0) + 1
-        poss = state.get("last_possible_answers", [])
-        if idx < len(poss):
-            state["last_answer_index"] = idx
-            return {"response": poss[idx]}
+    if is_feedback_negativo(user_input, lang, keyword_matcher, feedback_ids):
+        ref = state.next_ref()
+        answer = resolve_answer(cache, state.language, ref) if ref is not None else None
+        if answer:
+            return {"response": answer}
         return {"response": "Lamento, não tenho mais respostas alternativas." if lang == "pt" else "Sorry, no more alternative answers."}
 
     # Reset estado para nova pergunta
-    state.update({
-        "last_possible_answers": [],
-        "last_answer_index": 0,
-        "last_question": user_input,
-    })
+    state.clear_answers()
+    state.last_question = user_input
 
     # ─── Detecta categorias ───
-    detected = detect_categories(user_input, category_keywords)
+    detected = detect_categories(user_input, keyword_matcher)
     logger.info(f"Categorias detectadas: {detected}")
 
     if not detected:
-        sugeridas = suggest_categories(user_input, category_keywords, cat_names)
+        sugeridas = suggest_categories(user_input, cache["category_suggestions"], cat_names)
         if sugeridas:
             msg = ("Não consegui identificar uma categoria exata. Talvez você queira saber sobre: " if lang == "pt" else "Couldn't detect an exact category. Maybe you meant: ") + ", ".join(sugeridas) + "."
             return {"response": msg, "categorias_sugeridas": sugeridas}
         return {"response": "Não consegui identificar uma categoria para sua pergunta. Tente reformular." if lang == "pt" else "Couldn't identify a category. Please rephrase."}
 
     # ─── Coleta respostas candidatas ───
-    possible: List[str] = []
+    unique_answers: List[str] = []
+    answer_refs: List[int] = []
+    seen: set = set()
     for cid in detected:
         key = (cid, lang)
-        qs = q_by_cat.get(key, [])
         ans = a_by_cat.get(key, [])
-        possible.extend(find_answers_ranked(user_input, qs, ans))
-
-    # Remove duplicadas preservando ordem
-    seen: set = set()
-    unique_answers = [a for a in possible if not (a in seen or seen.add(a))]
+        if key not in question_rankers:
+            continue
+        for pos in find_answers_ranked(user_input, question_rankers[key]):
+            # Remove duplicadas preservando ordem
+            if ans[pos] not in seen:
+                seen.add(ans[pos])
+                unique_answers.append(ans[pos])
+                answer_refs.append(pack_ref(cid, faq_ref_id(cache["faq_ids_by_category"][key][pos], cache["questions_by_category"][key][pos])))
 
     if not unique_answers:
         msg = (
@@ -276,7 +311,6 @@ async def chat(req: MessageRequest):
 
         }
 
-    state["last_possible_answers"] = unique_answers
-    state["last_answer_index"] = 0
+    state.set_answers(answer_refs, lang)
 
     return {"response": unique_answers[0]}
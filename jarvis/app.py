@@ -59,7 +59,7 @@ def initialize_components():
     if EMBEDDING_MODEL_NAME == "ollama":
 
 
-        retriever = RAGRetriever2(vector_db_path='chroma-ollama', embedding_model_name=EMBEDDING_MODEL_NAME)
+        retriever = RAGRetriever2(vector_db_path=vector_db_path, embedding_model_name=EMBEDDING_MODEL_NAME)
         llm_model = LLMFactory.create_llm(model_type=LLM_MODEL_TYPE, model_name=LLM_MODEL_NAME)
         print(
              f"Instantiating model type: {LLM_MODEL_TYPE} | model name: {LLM_MODEL_NAME} | embedding model: {EMBEDDING_MODEL_NAME}")
@@ -1,5 +1,13 @@
-from flask import Flask, request, render_template, jsonify, send_file, redirect, url_for, flash
+from flask import Flask, request, render_template, jsonify, send_file, redirect, url_for, flash, session
 import pg8000
+import threading
+import time
+import base64
+import json
+from datetime import datetime
+from io import BytesIO
+import fitz  # PyMuPDF
+from storage.blobs import content_hash, pack, unpack
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
@@ -16,6 +24,11 @@ DBPASSWORD = os.getenv('DBPASSWORD')
 DBHOST = os.getenv('DBHOST')
 DBPORT = int(os.getenv('DBPORT', 5432))
 
+# Tempo (segundos) durante o qual um utilizador carregado é reutilizado sem ir à BD
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+# De quanto em quanto tempo (segundos) cada processo confirma na BD os utilizadores que tem em cache
+USER_RECHECK_INTERVAL = int(os.getenv('USER_RECHECK_INTERVAL', 5))
+
 # Inicializa o Flask e o LoginManager
 app_bd = Flask(__name__)
 app_bd.secret_key = os.urandom(24)
@@ -48,17 +61,135 @@ class User(UserMixin):
     def is_anonymous(self):
         return False
 
+# Cache de utilizadores (por processo): user_id -> (User, expira_em)
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+# Momento da última invalidação, para descartar registos de sessão anteriores
+_user_invalidated_at = {}
+_all_users_invalidated_at = 0.0
+_last_recheck = 0.0
+
+
+def _cache_user(user):
+    with _user_cache_lock:
+        _user_cache[str(user.id)] = (user, time.monotonic() + USER_CACHE_TTL)
+
+
+def _evict_expired():
+    # Chamado com _user_cache_lock
+    now = time.monotonic()
+    for user_id in [user_id for user_id, (_, expires_at) in _user_cache.items() if expires_at <= now]:
+        del _user_cache[user_id]
+    # Registos de sessão mais antigos do que o TTL já são recusados: as invalidações deles podem ir
+    cutoff = time.time() - USER_CACHE_TTL
+    for user_id in [user_id for user_id, at in _user_invalidated_at.items() if at < cutoff]:
+        del _user_invalidated_at[user_id]
+
+
+def _recheck_cached_users():
+    """Confirma na BD os utilizadores em cache neste processo.
+
+    invalidate_user só limpa a memória do worker que trata o pedido; os outros
+    workers dão pela mudança de permissões (ou pela remoção do utilizador)
+    aqui, com uma consulta a cada USER_RECHECK_INTERVAL segundos em vez de uma
+    por pedido.
+    """
+    global _last_recheck
+    now = time.monotonic()
+    with _user_cache_lock:
+        if now - _last_recheck < USER_RECHECK_INTERVAL:
+            return
+        _last_recheck = now
+        _evict_expired()
+        cached = {user_id: user for user_id, (user, _) in _user_cache.items()}
+    if not cached:
+        return
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, username, is_admin FROM users WHERE id = ANY(%s)",
+        ([int(user_id) for user_id in cached],)
+    )
+    current = {str(row[0]): (row[1], bool(row[2])) for row in cursor.fetchall()}
+    cursor.close()
+    conn.close()
+
+    for user_id, user in cached.items():
+        if current.get(user_id) != (user.username, bool(user.is_admin)):
+            invalidate_user(user_id)
+
+
+def invalidate_user(user_id=None):
+    """Remove um utilizador (ou todos, se user_id for None) da cache.
+
+    Deve ser chamado sempre que os dados ou as permissões de admin mudam,
+    para que a alteração não espere pelo fim do TTL. Só vale para este
+    processo: os outros workers confirmam-na em _recheck_cached_users.
+    """
+    global _all_users_invalidated_at
+    now = time.time()
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+            _user_invalidated_at.clear()
+            _all_users_invalidated_at = now
+        else:
+            _user_cache.pop(str(user_id), None)
+            _user_invalidated_at[str(user_id)] = now
+        _evict_expired()
+
+
+def _user_from_session(user_id):
+    # O cookie de sessão do Flask é assinado com a secret_key, por isso o registo
+    # gravado no login não pode ser alterado pelo cliente; só o usamos dentro do TTL
+    record = session.get('_user_record')
+    if not record or str(record.get('id')) != str(user_id):
+        return None
+    loaded_at = record.get('loaded_at', 0)
+    if time.time() - loaded_at > USER_CACHE_TTL:
+        return None
+    if loaded_at <= max(_all_users_invalidated_at, _user_invalidated_at.get(str(user_id), 0.0)):
+        return None
+    return User(id=record['id'], username=record['username'], is_admin=record['is_admin'])
+
+
+def _store_user_in_session(user):
+    session['_user_record'] = {
+        'id': user.id,
+        'username': user.username,
+        'is_admin': bool(user.is_admin),
+        'loaded_at': time.time(),
+    }
+
+
 # Carregar usuário para login_manager
 @login_manager.user_loader
 def load_user(user_id):
+    _recheck_cached_users()
+    with _user_cache_lock:
+        cached = _user_cache.get(str(user_id))
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    user = _user_from_session(user_id)
+    if user:
+        _cache_user(user)
+        return user
+
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, username, is_admin FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
+    row = cursor.fetchone()
     conn.close()
 
-    if user:
-        return User(id=user[0], username=user[1], is_admin=user[2])
+    if row:
+        user = User(id=row[0], username=row[1], is_admin=row[2])
+        _cache_user(user)
+        _store_user_in_session(user)
+        return user
+    invalidate_user(user_id)
+    session.pop('_user_record', None)
     return None
 
 # Rota de login
@@ -77,6 +208,8 @@ def login():
         if user and check_password_hash(user[2], password):  # Verifica senha
             user_obj = User(id=user[0], username=user[1], is_admin=user[3])
             login_user(user_obj)
+            _cache_user(user_obj)
+            _store_user_in_session(user_obj)
             return redirect(url_for('protected_page'))  # Redireciona para a página protegida
 
         flash('Usuário ou senha inválidos.')
@@ -88,6 +221,8 @@ def login():
 @app_bd.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
+    session.pop('_user_record', None)
     logout_user()
     return redirect(url_for('login'))
 
@@ -99,11 +234,48 @@ def protected_page():
         return redirect(url_for('login'))  # Caso o usuário não seja admin, redireciona para o login
     return render_template('bd.html')  # Página protegida para administradores
 
+# Alterar permissões de admin de um utilizador
+@app_bd.route('/users/<int:user_id>/admin', methods=['POST'])
+@login_required
+def set_user_admin(user_id):
+    if not current_user.is_admin:
+        return redirect(url_for('login'))  # Garantir que apenas administradores possam acessar
+
+    is_admin = bool((request.get_json(silent=True) or {}).get('is_admin'))
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET is_admin = %s WHERE id = %s RETURNING username", (is_admin, user_id))
+    row = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    if not row:
+        return jsonify({'error': 'User not found'}), 404
+
+    # A permissão mudou: o próximo pedido deste utilizador tem de ir à BD
+    invalidate_user(user_id)
+    return jsonify({'message': f'User {row[0]} admin={is_admin}.'}), 200
+
 # Rota de upload de arquivos
 ALLOWED_EXTENSIONS = {'pdf', 'txt'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def file_type_of(filename):
+    return filename.rsplit('.', 1)[1].lower()
+
+def count_pages(file_type, file_data):
+    if file_type != 'pdf':
+        return None
+    try:
+        with fitz.open(stream=file_data, filetype="pdf") as doc:
+            return doc.page_count
+    except Exception as e:
+        app_bd.logger.warning(f"Não foi possível contar as páginas do PDF: {e}")
+        return None
+
 @app_bd.route('/upload', methods=['POST'])
 @login_required
 def upload_pdf():
@@ -120,13 +292,47 @@ def upload_pdf():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         file_data = file.read()
+        file_type = file_type_of(filename)
+        digest = content_hash(file_data)
 
         conn = get_db_connection()
         cursor = conn.cursor()
 
+        # O mesmo ficheiro (nome e conteúdo) já existe: devolve a linha existente
         cursor.execute(
-            "INSERT INTO txt_files (file_name, file_data) VALUES (%s, %s) RETURNING id",
-            (filename, file_data)
+            "SELECT id FROM txt_files WHERE content_hash = %s AND file_name = %s LIMIT 1",
+            (digest, filename)
+        )
+        existing = cursor.fetchone()
+        if existing:
+            cursor.close()
+            conn.close()
+            return jsonify({'message': f'File {filename} already uploaded.', 'id': existing[0], 'duplicate': True}), 200
+
+        # Bloqueia o blob até ao commit: um /delete concorrente do último ficheiro
+        # com este conteúdo espera por nós em vez de apagar o blob entre esta
+        # verificação e o INSERT em txt_files (que falharia pela FK)
+        cursor.execute("SELECT 1 FROM file_blobs WHERE content_hash = %s FOR UPDATE", (digest,))
+        if cursor.fetchone() is None:
+            stored_data, compression = pack(file_type, file_data)
+            # DO UPDATE (e não DO NOTHING) para ficar também com o bloqueio se
+            # outro upload do mesmo conteúdo o inseriu entretanto
+            cursor.execute(
+                "INSERT INTO file_blobs (content_hash, data, compression, original_size, stored_size) "
+                "VALUES (%s, %s, %s, %s, %s) "
+                "ON CONFLICT (content_hash) DO UPDATE SET content_hash = EXCLUDED.content_hash",
+                (digest, stored_data, compression, len(file_data), len(stored_data))
+            )
+
+        # Conteúdo já guardado com outro nome: a nova linha aponta para o mesmo blob
+        cursor.execute("SELECT page_count FROM txt_files WHERE content_hash = %s LIMIT 1", (digest,))
+        same_content = cursor.fetchone()
+        page_count = same_content[0] if same_content else count_pages(file_type, file_data)
+
+        cursor.execute(
+            "INSERT INTO txt_files (file_name, content_hash, file_type, file_size, page_count) "
+            "VALUES (%s, %s, %s, %s, %s) RETURNING id",
+            (filename, digest, file_type, len(file_data), page_count)
         )
         pdf_id = cursor.fetchone()[0]
 
@@ -134,28 +340,93 @@ def upload_pdf():
         cursor.close()
         conn.close()
 
-        return jsonify({'message': f'File {filename} uploaded successfully.', 'id': pdf_id}), 200
+        return jsonify({
+            'message': f'File {filename} uploaded successfully.',
+            'id': pdf_id,
+            'duplicate': same_content is not None,
+        }), 200
 
     return jsonify({'error': 'Invalid file type'}), 400
 
 # Rota para listar arquivos PDF
+# Paginação por keyset em (uploaded_at, id): o custo de cada página não depende
+# do número total de ficheiros (índices em migrations/001_txt_files_listing.sql)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(uploaded_at, file_id):
+    raw = json.dumps({'t': uploaded_at.isoformat(), 'id': file_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    raw = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.fromisoformat(raw['t']), int(raw['id'])
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
 @app_bd.route('/get_pdfs', methods=['GET'])
 @login_required
 def get_pdfs():
     if not current_user.is_admin:
         return redirect(url_for('login'))  # Garantir que apenas administradores possam acessar
 
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    conditions, params = [], []
+
+    cursor_arg = request.args.get('cursor')
+    if cursor_arg:
+        try:
+            cursor_uploaded_at, cursor_id = decode_cursor(cursor_arg)
+        except (ValueError, KeyError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        conditions.append("(uploaded_at, id) < (%s, %s)")
+        params.extend([cursor_uploaded_at, cursor_id])
+
+    name = request.args.get('name', '').strip()
+    if name:
+        conditions.append("file_name ILIKE %s")
+        params.append(f"%{escape_like(name)}%")
+
+    file_type = request.args.get('type', '').strip().lower()
+    if file_type:
+        conditions.append("file_type = %s")
+        params.append(file_type)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Pede uma linha a mais para saber se existe página seguinte
+    params.append(limit + 1)
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT id, file_name FROM txt_files ORDER BY uploaded_at DESC")
+    cursor.execute(
+        "SELECT id, file_name, file_type, file_size, page_count, uploaded_at FROM txt_files "
+        f"{where} ORDER BY uploaded_at DESC, id DESC LIMIT %s",
+        tuple(params)
+    )
     pdf_files = cursor.fetchall()
 
     cursor.close()
     conn.close()
 
-    pdf_list = [{'id': pdf[0], 'file_name': pdf[1]} for pdf in pdf_files]
-    return jsonify(pdf_list)
+    has_more = len(pdf_files) > limit
+    pdf_files = pdf_files[:limit]
+    pdf_list = [{
+        'id': pdf[0],
+        'file_name': pdf[1],
+        'file_type': pdf[2],
+        'file_size': pdf[3],
+        'page_count': pdf[4],
+        'uploaded_at': pdf[5].isoformat() if pdf[5] else None,
+    } for pdf in pdf_files]
+
+    next_cursor = encode_cursor(pdf_files[-1][5], pdf_files[-1][0]) if has_more else None
+    return jsonify({'items': pdf_list, 'next_cursor': next_cursor})
 
 # Rota de download de arquivos PDF
 @app_bd.route('/download_pdf/<int:pdf_id>', methods=['GET'])
@@ -167,15 +438,20 @@ def download_pdf(pdf_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT file_name, file_data FROM txt_files WHERE id = %s", (pdf_id,))
+    cursor.execute(
+        "SELECT t.file_name, COALESCE(b.data, t.file_data), b.compression "
+        "FROM txt_files t LEFT JOIN file_blobs b ON b.content_hash = t.content_hash "
+        "WHERE t.id = %s",
+        (pdf_id,)
+    )
     pdf_file = cursor.fetchone()
 
     cursor.close()
     conn.close()
 
     if pdf_file:
-        filename, file_data = pdf_file
-        return send_file(BytesIO(file_data), download_name=filename, as_attachment=True)
+        filename, stored_data, compression = pdf_file
+        return send_file(BytesIO(unpack(stored_data, compression)), download_name=filename, as_attachment=True)
 
     return jsonify({'error': 'File not found'}), 404
 
@@ -194,11 +470,22 @@ def delete_pdf():
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT file_name FROM txt_files WHERE id = %s", (pdf_id,))
+    cursor.execute("SELECT file_name, content_hash FROM txt_files WHERE id = %s", (pdf_id,))
     file_entry = cursor.fetchone()
 
     if file_entry:
+        if file_entry[1]:
+            # Mesmo bloqueio que o /upload: um upload do mesmo conteúdo que já o
+            # tenha termina primeiro, e o NOT EXISTS abaixo vê a sua linha
+            cursor.execute("SELECT 1 FROM file_blobs WHERE content_hash = %s FOR UPDATE", (file_entry[1],))
         cursor.execute("DELETE FROM txt_files WHERE id = %s", (pdf_id,))
+        # Remove o blob quando já nenhum ficheiro aponta para ele
+        if file_entry[1]:
+            cursor.execute(
+                "DELETE FROM file_blobs WHERE content_hash = %s "
+                "AND NOT EXISTS (SELECT 1 FROM txt_files WHERE content_hash = %s)",
+                (file_entry[1], file_entry[1])
+            )
         conn.commit()
 
         cursor.close()
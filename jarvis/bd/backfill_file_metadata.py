@@ -0,0 +1,52 @@
+import os
+import sys
+import fitz  # PyMuPDF
+from db import get_db_connection
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage.blobs import unpack
+
+
+# Preenche page_count dos PDFs carregados antes da migração 001
+def backfill_page_counts(batch_size=50):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated = 0
+    last_id = 0
+
+    try:
+        while True:
+            # Depois da migração 002 o conteúdo está em file_blobs e file_data é NULL
+            cursor.execute(
+                "SELECT t.id, COALESCE(b.data, t.file_data), b.compression "
+                "FROM txt_files t LEFT JOIN file_blobs b ON b.content_hash = t.content_hash "
+                "WHERE t.file_type = 'pdf' AND t.page_count IS NULL AND t.id > %s ORDER BY t.id LIMIT %s",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            for file_id, stored_data, compression in rows:
+                last_id = file_id
+                if stored_data is None:
+                    print(f"PDF {file_id} sem conteúdo")
+                    continue
+                try:
+                    with fitz.open(stream=unpack(stored_data, compression), filetype="pdf") as doc:
+                        page_count = doc.page_count
+                except Exception as e:
+                    print(f"Erro ao ler o PDF {file_id}: {e}")
+                    continue
+                cursor.execute("UPDATE txt_files SET page_count = %s WHERE id = %s", (page_count, file_id))
+                updated += 1
+            conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    print(f"page_count preenchido em {updated} ficheiros.")
+
+
+if __name__ == "__main__":
+    backfill_page_counts()
@@ -1,11 +1,29 @@
 
+-- Conteúdo dos ficheiros, uma vez por hash (migrations/002_file_blobs_dedup.sql)
+CREATE TABLE IF NOT EXISTS file_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    data BYTEA NOT NULL,
+    compression VARCHAR(10) NOT NULL DEFAULT 'none',
+    original_size BIGINT NOT NULL,
+    stored_size BIGINT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE IF NOT EXISTS txt_files (
     id SERIAL PRIMARY KEY,
     file_name VARCHAR(255) NOT NULL,
-    file_data BYTEA NOT NULL,
-    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    -- Só nas linhas anteriores a file_blobs; as novas usam content_hash
+    file_data BYTEA,
+    content_hash CHAR(64) REFERENCES file_blobs(content_hash),
+    file_type VARCHAR(10),
+    file_size BIGINT,
+    page_count INT,
+    uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS idx_txt_files_content_hash ON txt_files (content_hash);
+-- Índices da listagem: migrations/001_txt_files_listing.sql
+
 CREATE TABLE IF NOT EXISTS chat_history (
     id SERIAL PRIMARY KEY,
     user_message TEXT NOT NULL,
@@ -1,4 +1,5 @@
 
+import os
 import pg8000
 import logging
 
@@ -40,6 +41,17 @@ def establish_db_connection():
 
                 logger.info("Database tables ensured to exist.")
 
+                # Migrações incrementais, aplicadas por ordem do nome do ficheiro
+                migrations_dir = 'migrations'
+                if os.path.isdir(migrations_dir):
+                    for migration in sorted(os.listdir(migrations_dir)):
+                        if not migration.endswith('.sql'):
+                            continue
+                        with open(os.path.join(migrations_dir, migration), 'r') as file:
+                            cursor.execute(file.read())
+                        conn.commit()
+                        logger.info(f"Migration applied: {migration}")
+
     except Exception as e:
         logger.error(f"Database Error: {str(e)}", exc_info=True)
         raise
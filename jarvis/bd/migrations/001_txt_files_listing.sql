@@ -0,0 +1,29 @@
+-- Listagem paginada de txt_files (keyset em uploaded_at, id) com filtros por nome e tipo
+
+ALTER TABLE txt_files ADD COLUMN IF NOT EXISTS file_type VARCHAR(10);
+ALTER TABLE txt_files ADD COLUMN IF NOT EXISTS file_size BIGINT;
+ALTER TABLE txt_files ADD COLUMN IF NOT EXISTS page_count INT;
+
+-- Preenche as linhas antigas (page_count dos PDFs: ver bd/backfill_file_metadata.py)
+UPDATE txt_files
+SET file_type = LOWER(SUBSTRING(file_name FROM '\.([^.]+)$'))
+WHERE file_type IS NULL;
+
+UPDATE txt_files
+SET file_size = OCTET_LENGTH(file_data)
+WHERE file_size IS NULL;
+
+-- A paginação por keyset compara (uploaded_at, id), por isso uploaded_at não pode ser NULL
+UPDATE txt_files SET uploaded_at = CURRENT_TIMESTAMP WHERE uploaded_at IS NULL;
+ALTER TABLE txt_files ALTER COLUMN uploaded_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_txt_files_uploaded_at_id
+    ON txt_files (uploaded_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_txt_files_type_uploaded_at_id
+    ON txt_files (file_type, uploaded_at DESC, id DESC);
+
+-- Filtro por nome (ILIKE '%...%')
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_txt_files_file_name_trgm
+    ON txt_files USING gin (file_name gin_trgm_ops);
@@ -0,0 +1,37 @@
+-- Deduplicação por hash de conteúdo: cada conteúdo distinto é guardado uma vez
+-- em file_blobs e as linhas de txt_files apontam para ele
+
+CREATE TABLE IF NOT EXISTS file_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    data BYTEA NOT NULL,
+    compression VARCHAR(10) NOT NULL DEFAULT 'none',
+    original_size BIGINT NOT NULL,
+    stored_size BIGINT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE txt_files ADD COLUMN IF NOT EXISTS content_hash CHAR(64) REFERENCES file_blobs(content_hash);
+ALTER TABLE txt_files ALTER COLUMN file_data DROP NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_txt_files_content_hash ON txt_files (content_hash);
+
+-- Move o conteúdo das linhas antigas para file_blobs (sem compressão)
+INSERT INTO file_blobs (content_hash, data, compression, original_size, stored_size)
+SELECT DISTINCT ON (hash) hash, file_data, 'none', OCTET_LENGTH(file_data), OCTET_LENGTH(file_data)
+FROM (
+    SELECT ENCODE(SHA256(file_data), 'hex') AS hash, file_data
+    FROM txt_files
+    WHERE content_hash IS NULL AND file_data IS NOT NULL
+) AS legacy
+ON CONFLICT (content_hash) DO NOTHING;
+
+UPDATE txt_files
+SET content_hash = ENCODE(SHA256(file_data), 'hex'), file_data = NULL
+WHERE content_hash IS NULL AND file_data IS NOT NULL;
+
+-- Conteúdos já indexados no Chroma pelo populate_database.py
+CREATE TABLE IF NOT EXISTS indexed_content (
+    content_hash CHAR(64) PRIMARY KEY,
+    source VARCHAR(255),
+    chunk_count INT,
+    indexed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
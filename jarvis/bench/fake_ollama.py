@@ -0,0 +1,160 @@
+"""Servidor HTTP que imita a API do Ollama para benchmarks offline.
+
+Responde a /api/generate (com ou sem streaming), /api/embed, /api/embeddings
+e /api/tags. Os tokens são emitidos a uma taxa configurável e os embeddings
+são determinísticos (hashing de palavras), por isso a pesquisa no Chroma
+continua a devolver resultados coerentes sem nenhum modelo real.
+
+Uso:
+    python -m bench.fake_ollama --port 11435 --token-rate 50 --response-tokens 64
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    """Embedding determinístico: cada palavra soma +-1 numa posição do vetor."""
+    vector = [0.0] * dim
+    for word in WORD_RE.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dim] += 1.0 if (value >> 63) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOllama/1.0"
+
+    def log_message(self, format, *args):
+        # Silencioso: o servidor corre durante o benchmark inteiro
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            config = self.server.config
+            self._send_json({"models": [
+                {"name": config.llm_model, "model": config.llm_model},
+                {"name": config.embedding_model, "model": config.embedding_model},
+            ]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/":
+            self._send_json({"status": "Ollama is running"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path == "/api/generate":
+            self._generate(payload)
+        elif self.path == "/api/embed":
+            inputs = payload.get("input", "")
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            dim = self.server.config.embedding_dim
+            self._send_json({
+                "model": payload.get("model"),
+                "embeddings": [fake_embedding(text, dim) for text in inputs],
+            })
+        elif self.path == "/api/embeddings":
+            dim = self.server.config.embedding_dim
+            self._send_json({"embedding": fake_embedding(payload.get("prompt", ""), dim)})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _generate(self, payload: dict):
+        config = self.server.config
+        model = payload.get("model", config.llm_model)
+        delay = 1.0 / config.token_rate if config.token_rate > 0 else 0.0
+        tokens = [f"tok{i} " for i in range(config.response_tokens)]
+
+        if config.first_token_ms:
+            time.sleep(config.first_token_ms / 1000.0)
+
+        if not payload.get("stream", True):
+            time.sleep(delay * len(tokens))
+            self._send_json({
+                "model": model, "created_at": _now(), "response": "".join(tokens),
+                "done": True, "done_reason": "stop", "eval_count": len(tokens),
+            })
+            return
+
+        # Streaming NDJSON sem Content-Length: a ligação fecha no fim (HTTP/1.0)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for token in tokens:
+            if delay:
+                time.sleep(delay)
+            line = {"model": model, "created_at": _now(), "response": token, "done": False}
+            self.wfile.write((json.dumps(line) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        final = {"model": model, "created_at": _now(), "response": "", "done": True,
+                 "done_reason": "stop", "eval_count": len(tokens)}
+        self.wfile.write((json.dumps(final) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+def create_server(host: str, port: int, config: argparse.Namespace) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.config = config
+    return server
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Servidor Ollama falso para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 escolhe uma porta livre")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens por segundo (0 = sem espera)")
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--first-token-ms", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=1024)
+    parser.add_argument("--llm-model", default="llama3.2:latest")
+    parser.add_argument("--embedding-model", default="mxbai-embed-large:latest")
+    return parser
+
+
+def main(argv=None):
+    config = build_arg_parser().parse_args(argv)
+    server = create_server(config.host, config.port, config)
+    # A primeira linha do stdout é lida pelo run_benchmark para saber a porta
+    print(f"LISTENING {server.server_address[0]}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Dados sintéticos para os benchmarks: documentos, ficheiros e coleção Chroma."""
+import os
+import random
+
+from langchain.schema import Document
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAQ_PATH = os.path.join(BASE_DIR, "perguntas_respostas.txt")
+
+WORDS = (
+    "aluno matrícula disciplina curso portal secretaria documento prazo bolsa "
+    "estudo mensalidade pagamento boleto município regulamento candidatura "
+    "artigo conselho competência apoio social habitação transporte cultura "
+    "desporto ambiente costa extensão freguesia serviço pedido formulário "
+    "certidão declaração horário atendimento presencial agendamento"
+).split()
+
+
+def load_faq_pairs() -> list[tuple[str, str]]:
+    pairs = []
+    with open(FAQ_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split("\t")
+            if len(parts) == 2:
+                pairs.append((parts[0], parts[1]))
+    return pairs
+
+
+def synthetic_text(rng: random.Random, paragraphs: int, words_per_paragraph: int = 80) -> str:
+    faq = load_faq_pairs()
+    blocks = []
+    for _ in range(paragraphs):
+        question, answer = rng.choice(faq)
+        filler = " ".join(rng.choice(WORDS) for _ in range(words_per_paragraph))
+        blocks.append(f"{question}\n{answer} {filler}.")
+    return "\n\n".join(blocks)
+
+
+def synthetic_pdf(text: str) -> bytes:
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for block in text.split("\n\n"):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), block, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def synthetic_files(count: int, paragraphs: int, pdf_ratio: float, seed: int) -> list[tuple[str, bytes]]:
+    """Gera `count` ficheiros (.txt e .pdf) prontos a inserir em txt_files."""
+    rng = random.Random(seed)
+    files = []
+    for i in range(count):
+        text = synthetic_text(rng, paragraphs)
+        if rng.random() < pdf_ratio:
+            files.append((f"bench_{i:05d}.pdf", synthetic_pdf(text)))
+        else:
+            files.append((f"bench_{i:05d}.txt", text.encode("utf-8")))
+    return files
+
+
+def synthetic_queries(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    faq = load_faq_pairs()
+    return [rng.choice(faq)[0] for _ in range(count)]
+
+
+def build_fixture_collection(path: str, documents: int, paragraphs: int, seed: int) -> int:
+    """Cria (ou reutiliza) uma coleção Chroma em `path` com documentos sintéticos.
+
+    Os embeddings vêm do Ollama configurado em OLLAMA_HOST, que nos benchmarks
+    é o servidor falso. Devolve o número de chunks na coleção.
+    """
+    from langchain_chroma import Chroma
+    from embeddings.embeddings import Embeddings
+    from populate_database import split_documents, add_to_chroma
+
+    embedding_function = Embeddings(model_name="ollama").get_embedding_function()
+    db = Chroma(persist_directory=path, embedding_function=embedding_function)
+
+    rng = random.Random(seed)
+    docs = [
+        Document(page_content=synthetic_text(rng, paragraphs), metadata={"source": f"fixture_{i:05d}.txt"})
+        for i in range(documents)
+    ]
+    add_to_chroma(split_documents(docs), db)
+    return len(db.get(include=[])["ids"])
@@ -0,0 +1,332 @@
+"""Benchmark offline do Jarvis: /query e ingestão com backends locais.
+
+Arranca um Ollama falso (bench/fake_ollama.py) num subprocesso, cria uma
+coleção Chroma de fixture e troca o Postgres por um SQLite local
+(bench/sqlite_shim.py). Mede latência (p50/p95/p99), throughput e memória,
+e grava o resultado em JSON para comparar execuções.
+
+Correr a partir da pasta jarvis/:
+    python -m bench.run_benchmark --scenario query --concurrency 8 --requests 200
+    python -m bench.run_benchmark --scenario ingest --files 50 --concurrency 4
+    python -m bench.run_benchmark --scenario all --compare bench/results/anterior.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from bench.sqlite_shim import SqliteShim  # noqa: E402
+from bench import fixtures  # noqa: E402
+
+RESULTS_DIR = os.path.join(BASE_DIR, "bench", "results")
+
+
+# ========== Métricas ==========
+def current_rss_mb():
+    """RSS atual do processo em MB (None se não for possível medir)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devolve KB, macOS devolve bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies: list[float], wall_time: float, errors: int) -> dict:
+    ordered = sorted(latencies)
+    stats = {
+        "count": len(ordered),
+        "errors": errors,
+        "wall_time_s": round(wall_time, 4),
+        "throughput_per_s": round(len(ordered) / wall_time, 3) if wall_time > 0 else None,
+    }
+    if not ordered:
+        return stats
+    if len(ordered) > 1:
+        cuts = statistics.quantiles(ordered, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ordered[0]
+    stats.update({
+        "latency_ms": {
+            "min": round(ordered[0] * 1000, 3),
+            "mean": round(statistics.fmean(ordered) * 1000, 3),
+            "p50": round(p50 * 1000, 3),
+            "p95": round(p95 * 1000, 3),
+            "p99": round(p99 * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3),
+        }
+    })
+    return stats
+
+
+def run_concurrently(jobs, concurrency: int):
+    """Executa `jobs` (callables) com `concurrency` threads e mede cada um."""
+    latencies, errors = [], 0
+
+    def timed(job):
+        start = time.perf_counter()
+        job()
+        return time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(timed, job) for job in jobs]
+        for future in as_completed(futures):
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"❌ Erro no pedido: {e}")
+    return latencies, time.perf_counter() - wall_start, errors
+
+
+# ========== Backends locais ==========
+def start_fake_ollama(args):
+    cmd = [
+        sys.executable, "-m", "bench.fake_ollama",
+        "--port", "0",
+        "--token-rate", str(args.token_rate),
+        "--response-tokens", str(args.response_tokens),
+        "--first-token-ms", str(args.first_token_ms),
+        "--embedding-dim", str(args.embedding_dim),
+    ]
+    proc = subprocess.Popen(cmd, cwd=BASE_DIR, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline().strip()
+    if not line.startswith("LISTENING "):
+        proc.kill()
+        raise RuntimeError(f"Ollama falso não arrancou: {line!r}")
+    return proc, "http://" + line.split(" ", 1)[1]
+
+
+def configure_environment(workdir: str, ollama_url: str, args):
+    # load_dotenv não sobrepõe variáveis já definidas, por isso o .env real é ignorado
+    os.environ["OLLAMA_HOST"] = ollama_url
+    os.environ["VECTOR_DB_OLLAMA_PATH"] = os.path.join(workdir, "chroma-ollama")
+    os.environ["EMBEDDING_MODEL_NAME"] = "ollama"
+    os.environ["LLM_MODEL_TYPE"] = "ollama"
+    os.environ["LLM_MODEL_NAME"] = "llama3.2:latest"
+    os.environ["NUM_RELEVANT_DOCS"] = str(args.num_relevant_docs)
+
+
+# ========== Cenários ==========
+def bench_query(args, workdir: str, shim: SqliteShim) -> dict:
+    from werkzeug.serving import make_server
+
+    chunks = fixtures.build_fixture_collection(
+        os.environ["VECTOR_DB_OLLAMA_PATH"], args.fixture_documents, args.paragraphs, args.seed
+    )
+    print(f"📦 Coleção de fixture com {chunks} chunks")
+
+    import app as jarvis_app
+    jarvis_app.get_db_connection = shim.connect
+
+    server = make_server("127.0.0.1", 0, jarvis_app.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/query"
+
+    def post(query_text):
+        body = json.dumps({"query_text": query_text}).encode("utf-8")
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=args.timeout) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}")
+            resp.read()
+
+    try:
+        for query_text in fixtures.synthetic_queries(args.warmup, args.seed + 1):
+            post(query_text)
+
+        rss_before = current_rss_mb()
+        queries = fixtures.synthetic_queries(args.requests, args.seed + 2)
+        latencies, wall, errors = run_concurrently(
+            [lambda q=q: post(q) for q in queries], args.concurrency
+        )
+    finally:
+        server.shutdown()
+
+    result = summarize(latencies, wall, errors)
+    result.update({
+        "fixture_chunks": chunks,
+        "chat_history_rows": shim.count_rows("chat_history"),
+        "memory_mb": {"rss_before": rss_before, "rss_after": current_rss_mb(), "peak_rss": peak_rss_mb()},
+    })
+    return result
+
+
+def bench_ingest(args, workdir: str, shim: SqliteShim) -> dict:
+    from langchain_chroma import Chroma
+    from embeddings.embeddings import Embeddings
+    import populate_database
+
+    populate_database.get_db_connection = shim.connect
+    for file_name, file_data in fixtures.synthetic_files(args.files, args.paragraphs, args.pdf_ratio, args.seed):
+        shim.insert_file(file_name, file_data)
+
+    embedding_function = Embeddings(model_name="ollama").get_embedding_function()
+    db = Chroma(persist_directory=os.path.join(workdir, "chroma-ingest"), embedding_function=embedding_function)
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    documents = populate_database.load_documents_from_database()
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = populate_database.split_documents(documents)
+    split_time = time.perf_counter() - start
+
+    # Um job por documento, para medir a latência de indexação de cada ficheiro
+    by_source = {}
+    for chunk in chunks:
+        by_source.setdefault(chunk.metadata.get("source"), []).append(chunk)
+
+    def ingest(group):
+        populate_database.add_to_chroma(group, db)
+        populate_database.mark_content_indexed(group)
+
+    latencies, wall, errors = run_concurrently(
+        [lambda group=group: ingest(group) for group in by_source.values()], args.concurrency
+    )
+
+    result = summarize(latencies, wall, errors)
+    result.update({
+        "files": args.files,
+        "documents": len(documents),
+        "chunks": len(chunks),
+        "chunks_per_s": round(len(chunks) / wall, 3) if wall > 0 else None,
+        "indexed_contents": shim.count_rows("indexed_content"),
+        "stages_s": {"load": round(load_time, 4), "split": round(split_time, 4), "embed_and_store": round(wall, 4)},
+        "memory_mb": {"rss_before": rss_before, "rss_after": current_rss_mb(), "peak_rss": peak_rss_mb()},
+    })
+    return result
+
+
+# ========== Resultados ==========
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(report: dict, output: str = None) -> str:
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{report['config']['scenario']}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return output
+
+
+def compare_results(current: dict, baseline_path: str):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    print(f"\n📊 Comparação com {baseline_path} (commit {baseline.get('commit')})")
+    for scenario, stats in current["results"].items():
+        old = baseline.get("results", {}).get(scenario)
+        if not old:
+            print(f"  {scenario}: sem dados de referência")
+            continue
+        metrics = [("throughput_per_s", stats.get("throughput_per_s"), old.get("throughput_per_s"))]
+        for p in ("p50", "p95", "p99"):
+            metrics.append((p, stats.get("latency_ms", {}).get(p), old.get("latency_ms", {}).get(p)))
+        for name, new_value, old_value in metrics:
+            if new_value is None or not old_value:
+                continue
+            delta = (new_value - old_value) / old_value * 100
+            print(f"  {scenario:>6} {name:>16}: {old_value:>10.2f} -> {new_value:>10.2f} ({delta:+.1f}%)")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark offline do Jarvis")
+    parser.add_argument("--scenario", choices=["query", "ingest", "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=100, help="pedidos /query medidos")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--num-relevant-docs", type=int, default=5)
+    parser.add_argument("--fixture-documents", type=int, default=20)
+    parser.add_argument("--files", type=int, default=20, help="ficheiros sintéticos a ingerir")
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--pdf-ratio", type=float, default=0.5)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--first-token-ms", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="caminho do JSON (por omissão bench/results/<cenário>-<data>.json)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    os.chdir(BASE_DIR)
+
+    proc, ollama_url = start_fake_ollama(args)
+    report = {
+        "config": vars(args),
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {},
+    }
+    try:
+        with tempfile.TemporaryDirectory(prefix="jarvis-bench-") as workdir:
+            configure_environment(workdir, ollama_url, args)
+            shim = SqliteShim(os.path.join(workdir, "bench.sqlite3"))
+
+            if args.scenario in ("query", "all"):
+                print(f"🔁 /query: {args.requests} pedidos, concorrência {args.concurrency}")
+                report["results"]["query"] = bench_query(args, workdir, shim)
+            if args.scenario in ("ingest", "all"):
+                print(f"🔁 Ingestão: {args.files} ficheiros, concorrência {args.concurrency}")
+                report["results"]["ingest"] = bench_ingest(args, workdir, shim)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    path = save_results(report, args.output)
+    print(json.dumps(report["results"], indent=2, ensure_ascii=False))
+    print(f"✅ Resultados gravados em {path}")
+
+    if args.compare:
+        compare_results(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Substituto local do pg8000 baseado em SQLite, usado só nos benchmarks.
+
+Expõe a mesma interface que o código usa do pg8000 (cursor, execute com
+parâmetros "%s", fetchone/fetchall, commit, close), para que
+`get_db_connection` de app.py e populate_database.py possa ser trocado por
+`SqliteShim(path).connect` sem mexer nas queries.
+"""
+import sqlite3
+
+from storage.blobs import content_hash, pack
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    data BLOB NOT NULL,
+    compression VARCHAR(10) NOT NULL DEFAULT 'none',
+    original_size BIGINT NOT NULL,
+    stored_size BIGINT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS indexed_content (
+    content_hash CHAR(64) PRIMARY KEY,
+    source VARCHAR(255),
+    chunk_count INT,
+    indexed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS txt_files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name VARCHAR(255) NOT NULL,
+    file_data BLOB,
+    content_hash CHAR(64) REFERENCES file_blobs(content_hash),
+    file_type VARCHAR(10),
+    file_size BIGINT,
+    page_count INT,
+    uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_message TEXT NOT NULL,
+    bot_response TEXT NOT NULL,
+    user_id VARCHAR(255),
+    chat_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(100) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    is_admin BOOLEAN DEFAULT FALSE
+);
+"""
+
+
+def translate_query(sql: str) -> str:
+    """Converte os placeholders do pg8000 ("%s") para os do sqlite3 ("?")."""
+    return sql.replace("%s", "?")
+
+
+class ShimCursor:
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_query(sql), tuple(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_query(sql), [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShimConnection:
+    def __init__(self, connection: sqlite3.Connection):
+        self._connection = connection
+
+    def cursor(self):
+        return ShimCursor(self._connection.cursor())
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SqliteShim:
+    """Fábrica de ligações: cada `connect()` abre uma ligação nova, como o pg8000."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(self.path) as conn:
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return ShimConnection(conn)
+
+    def insert_file(self, file_name: str, file_data: bytes) -> int:
+        """Grava um ficheiro como o /upload do app_bd (blob deduplicado e comprimido)."""
+        file_type = file_name.rsplit('.', 1)[-1].lower()
+        digest = content_hash(file_data)
+        stored_data, compression = pack(file_type, file_data)
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO file_blobs (content_hash, data, compression, original_size, stored_size) "
+                "VALUES (%s, %s, %s, %s, %s) ON CONFLICT (content_hash) DO NOTHING",
+                (digest, stored_data, compression, len(file_data), len(stored_data))
+            )
+            cursor.execute(
+                "INSERT INTO txt_files (file_name, content_hash, file_type, file_size) "
+                "VALUES (%s, %s, %s, %s) RETURNING id",
+                (file_name, digest, file_type, len(file_data))
+            )
+            file_id = cursor.fetchone()[0]
+            conn.commit()
+            return file_id
+
+    def count_rows(self, table: str) -> int:
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            return cursor.fetchone()[0]
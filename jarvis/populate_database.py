@@ -9,6 +9,7 @@ from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from langchain_chroma import Chroma
+from storage.blobs import content_hash, unpack
 
 load_dotenv()
 
@@ -41,11 +42,27 @@ def load_documents_from_database():
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        cursor.execute("SELECT id, file_name, file_data FROM txt_files ORDER BY uploaded_at DESC")
-        for file_id, file_name, file_data in cursor.fetchall():
+        # Só traz conteúdos que ainda não foram indexados (ver indexed_content)
+        cursor.execute("""
+            SELECT t.id, t.file_name, COALESCE(b.data, t.file_data), b.compression, t.content_hash
+            FROM txt_files t
+            LEFT JOIN file_blobs b ON b.content_hash = t.content_hash
+            WHERE t.content_hash IS NULL
+               OR NOT EXISTS (SELECT 1 FROM indexed_content i WHERE i.content_hash = t.content_hash)
+            ORDER BY t.uploaded_at DESC
+        """)
+        seen_hashes = set()
+        for file_id, file_name, stored_data, compression, file_hash in cursor.fetchall():
             file_extension = file_name.lower().split('.')[-1]
 
             try:
+                file_data = unpack(stored_data, compression)
+                file_hash = (file_hash or content_hash(file_data)).strip()
+                if file_hash in seen_hashes:
+                    print(f"⏭️ Conteúdo duplicado ignorado: {file_name}")
+                    continue
+                seen_hashes.add(file_hash)
+
                 if file_extension == 'pdf':
                     # Converte PDF binário para texto usando PyMuPDF
                     pdf_bytes = BytesIO(file_data)
@@ -62,7 +79,7 @@ def load_documents_from_database():
                 if text.strip():
                     all_documents.append(Document(
                         page_content=text,
-                        metadata={"source": f"db_{file_name}"}
+                        metadata={"source": f"db_{file_name}", "content_hash": file_hash}
                     ))
             except Exception as file_err:
                 print(f"❌ Erro ao processar arquivo {file_name}: {file_err}")
@@ -73,6 +90,33 @@ def load_documents_from_database():
         print(f"❌ Erro ao carregar arquivos do banco de dados: {e}")
     return all_documents
 
+def mark_content_indexed(chunks):
+    """Regista em indexed_content os hashes dos documentos já enviados para o Chroma."""
+    chunk_counts, sources = {}, {}
+    for chunk in chunks:
+        file_hash = chunk.metadata.get("content_hash")
+        if file_hash:
+            chunk_counts[file_hash] = chunk_counts.get(file_hash, 0) + 1
+            sources[file_hash] = chunk.metadata.get("source")
+    if not chunk_counts:
+        return
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        for file_hash, count in chunk_counts.items():
+            cursor.execute(
+                "INSERT INTO indexed_content (content_hash, source, chunk_count) VALUES (%s, %s, %s) "
+                "ON CONFLICT (content_hash) DO NOTHING",
+                (file_hash, sources[file_hash], count)
+            )
+        conn.commit()
+        cursor.close()
+        conn.close()
+        print(f"🔖 Conteúdos marcados como indexados: {len(chunk_counts)}")
+    except Exception as e:
+        print(f"❌ Erro ao registar conteúdos indexados: {e}")
+
 def load_documents(directory):
     all_documents = []
 
@@ -152,6 +196,17 @@ def clear_database():
         shutil.rmtree(db_path)
         print("🧹 Base de dados limpa!")
 
+    # Sem Chroma, todos os conteúdos têm de voltar a ser indexados
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM indexed_content")
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Erro ao limpar indexed_content: {e}")
+
 def main():
     print("🔁 Processando modelo: ollama")
 
@@ -167,6 +222,7 @@ def main():
 
         chunks = split_documents(db_documents)
         add_to_chroma(chunks, db)
+        mark_content_indexed(chunks)
 
     except Exception as e:
         print(f"❌ Erro ao processar ollama: {e}")
@@ -1,7 +1,12 @@
+import os
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+# String do faiss.index_factory: Flat (exato) chega para poucas perguntas;
+# para FAQs grandes p.ex. HNSW32 ou IVF1024,PQ48
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "Flat")
+
 def carregar_faq_txt(caminho):
     with open(caminho, "r", encoding="utf-8") as f:
         linhas = f.read().splitlines()
@@ -26,7 +31,9 @@ def criar_e_salvar_indice(faq, arquivo_indice, arquivo_perguntas):
     embeddings = model.encode(perguntas).astype('float32')
 
     dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
+    index = faiss.index_factory(dim, FAISS_INDEX_FACTORY)
+    if not index.is_trained:
+        index.train(embeddings)
     index.add(embeddings)
 
     faiss.write_index(index, arquivo_indice)
@@ -1,23 +1,48 @@
 $(document).ready(function () {
-    function loadPDFs() {
+    let nextCursor = null;
+
+    function formatSize(bytes) {
+        if (bytes === null || bytes === undefined) return '';
+        if (bytes < 1024) return bytes + ' B';
+        if (bytes < 1024 * 1024) return (bytes / 1024).toFixed(1) + ' KB';
+        return (bytes / (1024 * 1024)).toFixed(1) + ' MB';
+    }
+
+    function renderPDF(pdf) {
+        let details = [pdf.file_type ? pdf.file_type.toUpperCase() : '', formatSize(pdf.file_size)];
+        if (pdf.page_count) details.push(pdf.page_count + ' pages');
+        return `
+            <div>
+                <a href="/download_pdf/${pdf.id}" target="_blank">${pdf.file_name}</a>
+                <small>${details.filter(Boolean).join(' · ')}</small>
+                <button class="delete-pdf" data-id="${pdf.id}">Delete</button>
+            </div>
+        `;
+    }
+
+    // append = true carrega a página seguinte (cursor) em vez de recomeçar a lista
+    function loadPDFs(append) {
+        let params = {
+            name: $('#pdf-filter-name').val() || '',
+            type: $('#pdf-filter-type').val() || ''
+        };
+        if (append && nextCursor) params.cursor = nextCursor;
+
         $.ajax({
             url: '/get_pdfs',
             method: 'GET',
+            data: params,
             success: function (response) {
-                if (response.length === 0) {
+                let pdfHtml = response.items.map(renderPDF).join('');
+                if (append) {
+                    $('#pdf-list').append(pdfHtml);
+                } else if (response.items.length === 0) {
                     $('#pdf-list').html('<p>No PDFs uploaded.</p>');
                 } else {
-                    let pdfHtml = '';
-                    response.forEach(function (pdf) {
-                        pdfHtml += `
-                            <div>
-                                <a href="/download_pdf/${pdf.id}" target="_blank">${pdf.file_name}</a>
-                                <button class="delete-pdf" data-id="${pdf.id}">Delete</button>
-                            </div>
-                        `;
-                    });
                     $('#pdf-list').html(pdfHtml);
                 }
+                nextCursor = response.next_cursor;
+                $('#pdf-load-more').toggle(!!nextCursor);
             },
             error: function () {
                 $('#pdf-list').html('<p>Error fetching PDF list.</p>');
@@ -25,6 +50,14 @@ $(document).ready(function () {
         });
     }
 
+    $('#pdf-filter-btn').on('click', function () {
+        loadPDFs(false);
+    });
+
+    $('#pdf-load-more').on('click', function () {
+        loadPDFs(true);
+    });
+
     loadPDFs();
 
     // Handle PDF upload
@@ -0,0 +1,28 @@
+import hashlib
+import zlib
+
+# Só o texto compensa comprimir; PDFs já vêm comprimidos internamente
+COMPRESSIBLE_TYPES = {'txt'}
+COMPRESSION_LEVEL = 6
+
+
+def content_hash(file_data: bytes) -> str:
+    """SHA-256 (hex) do conteúdo original, usado como chave do blob."""
+    return hashlib.sha256(file_data).hexdigest()
+
+
+def pack(file_type: str, file_data: bytes):
+    """Devolve (dados_guardados, compressao) para gravar em file_blobs."""
+    if file_type in COMPRESSIBLE_TYPES:
+        compressed = zlib.compress(file_data, COMPRESSION_LEVEL)
+        if len(compressed) < len(file_data):
+            return compressed, 'zlib'
+    return file_data, 'none'
+
+
+def unpack(stored_data, compression) -> bytes:
+    """Inverso de `pack`. `compression` é None para linhas antigas sem blob."""
+    stored_data = bytes(stored_data)
+    if compression == 'zlib':
+        return zlib.decompress(stored_data)
+    return stored_data